@@ -0,0 +1,127 @@
+"""Benchmark: concurrency scaling of the sync vs async RAG pipeline
+
+Les appels OpenAI sont remplacés par des doublures avec une latence fixe
+(embedding + LLM), ce qui permet de mesurer le comportement de la boucle
+d'événements sans réseau ni clé API.
+
+    python scripts/benchmark_async_pipeline.py --concurrency 1 4 16 64
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+# Ajouter le répertoire racine au path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src.rag.generation import RAGGenerator
+from src.rag.pipeline import RAGPipeline
+from src.rag.retrieval import RetrievalSystem
+
+
+class SlowFakeEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic embeddings with a simulated network latency"""
+
+    latency: float = 0.05
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class SlowFakeChatModel(BaseChatModel):
+    """Chat model returning a fixed answer after a simulated latency"""
+
+    latency: float = 0.5
+    answer: str = "This is a benchmark answer."
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake-chat"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+
+def build_pipeline(embedding_latency: float, llm_latency: float) -> RAGPipeline:
+    """Build a pipeline backed by the fake embedding/LLM stand-ins"""
+    embeddings = SlowFakeEmbeddings(size=256, latency=embedding_latency)
+    vector_store = InMemoryVectorStore(embedding=embeddings)
+    vector_store.add_documents([
+        Document(page_content=f"Benchmark document number {i}", metadata={"source": f"doc_{i}.txt"})
+        for i in range(200)
+    ])
+    retrieval = RetrievalSystem(embeddings=embeddings, vector_store=vector_store, top_k=5)
+    generator = RAGGenerator(llm=SlowFakeChatModel(latency=llm_latency), use_langfuse=False)
+    return RAGPipeline(retrieval, generator)
+
+
+async def run_blocking(pipeline: RAGPipeline, question: str):
+    """Old endpoint behaviour: sync pipeline called from a coroutine"""
+    pipeline.run(question)
+
+
+async def run_async(pipeline: RAGPipeline, question: str):
+    """New endpoint behaviour: native async pipeline"""
+    await pipeline.arun(question)
+
+
+async def measure(runner, pipeline: RAGPipeline, concurrency: int, requests_count: int):
+    """Run requests_count queries (all arriving at once) with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    async def one(i: int) -> float:
+        # Latency is measured from arrival time: a blocked event loop delays
+        # the start of every other request, which is exactly what we measure
+        async with semaphore:
+            await runner(pipeline, f"question {i}")
+        return time.perf_counter() - start
+
+    latencies = await asyncio.gather(*(one(i) for i in range(requests_count)))
+    wall = time.perf_counter() - start
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return requests_count / wall, statistics.median(latencies), p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(args.embedding_latency, args.llm_latency)
+
+    print(f"{'mode':<10}{'concurrency':>12}{'req/s':>10}{'p50 (s)':>10}{'p99 (s)':>10}")
+    for concurrency in args.concurrency:
+        for mode, runner in (("blocking", run_blocking), ("async", run_async)):
+            requests_count = max(args.requests, concurrency)
+            throughput, p50, p99 = asyncio.run(measure(runner, pipeline, concurrency, requests_count))
+            print(f"{mode:<10}{concurrency:>12}{throughput:>10.2f}{p50:>10.3f}{p99:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark: ingestion throughput (files/s, MB/s) vs number of worker processes
+
+Génère un corpus de fichiers texte puis mesure le chargement + chunking
+avec DocumentIngester.ingest_directory pour plusieurs tailles de pool.
+
+    python scripts/benchmark_ingestion.py --files 400 --file-kb 256 --workers 1 2 4 8
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Ajouter le répertoire racine au path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.rag.ingestion import DocumentIngester
+
+WORDS = (
+    "retrieval augmented generation vector store embedding chunk document query answer "
+    "kubernetes pod latency throughput index manifest pipeline token model context"
+).split()
+
+
+def generate_corpus(directory: Path, files: int, file_kb: int, seed: int = 0) -> int:
+    """Write `files` text files of about `file_kb` KiB, return total bytes"""
+    rng = random.Random(seed)
+    total = 0
+    for i in range(files):
+        paragraphs = []
+        size = 0
+        while size < file_kb * 1024:
+            paragraph = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 160))) + "."
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 2
+        content = "\n\n".join(paragraphs)
+        (directory / f"doc_{i:05d}.txt").write_text(content)
+        total += len(content.encode("utf-8"))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = Path(tmp)
+        total_bytes = generate_corpus(corpus, args.files, args.file_kb)
+        print(f"Corpus: {args.files} fichiers, {total_bytes / 1e6:.1f} MB")
+        print(f"{'workers':>8}{'seconds':>10}{'files/s':>10}{'MB/s':>10}{'chunks':>10}")
+
+        for workers in args.workers:
+            ingester = DocumentIngester(
+                chunk_size=args.chunk_size,
+                chunk_overlap=args.chunk_overlap,
+                max_workers=workers
+            )
+            start = time.perf_counter()
+            result = ingester.ingest_directory(str(corpus))
+            elapsed = time.perf_counter() - start
+            ingester.shutdown()
+            print(
+                f"{workers:>8}{elapsed:>10.2f}{result.files_processed / elapsed:>10.1f}"
+                f"{total_bytes / 1e6 / elapsed:>10.2f}{len(result.chunks):>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
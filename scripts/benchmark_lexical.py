@@ -0,0 +1,102 @@
+"""Benchmark: BM25 inverted index build time, memory and query latency
+
+Corpus synthétique : vocabulaire de loi de Zipf + identifiants (codes
+d'erreur, SKU) que les requêtes recherchent à l'identique.
+
+    python scripts/benchmark_lexical.py --docs 100000 --words 150 --queries 500
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+# Ajouter le répertoire racine au path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.rag.lexical import BM25Index
+
+
+def generate_corpus(docs: int, words: int, vocabulary: int = 50000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vocab = [f"w{i}" for i in range(vocabulary)]
+    ranks = np.minimum(rng.zipf(1.2, size=(docs, words)), vocabulary) - 1
+    texts = []
+    for i, row in enumerate(ranks):
+        identifier = f"ERR-{i:06d} SKU-{i % 9973}.{i % 7}"
+        texts.append(" ".join(vocab[r] for r in row) + " " + identifier)
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=150)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args()
+
+    texts = generate_corpus(args.docs, args.words)
+    ids = [str(i) for i in range(len(texts))]
+    corpus_mb = sum(len(text) for text in texts) / 1e6
+    print(f"Corpus: {args.docs} chunks, {corpus_mb:.1f} MB de texte")
+
+    def build() -> BM25Index:
+        # Incremental build, batch by batch, as during ingestion
+        index = BM25Index()
+        for offset in range(0, len(texts), args.batch):
+            index.add(ids[offset:offset + args.batch], texts[offset:offset + args.batch])
+        return index
+
+    start = time.perf_counter()
+    index = build()
+    build_seconds = time.perf_counter() - start
+
+    # Second build under tracemalloc (slow) for the peak memory
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"Build:   {build_seconds:.2f} s ({args.docs / build_seconds:.0f} chunks/s), vocabulaire {index.vocabulary_size}")
+    print(f"Mémoire: postings {index.memory_bytes() / 1e6:.1f} MB, pic Python {peak / 1e6:.1f} MB")
+
+    rng = np.random.default_rng(1)
+    queries, targets = [], []
+    for _ in range(args.queries):
+        i = int(rng.integers(0, args.docs))
+        queries.append(f"what does ERR-{i:06d} mean for w{int(rng.integers(0, 200))}")
+        targets.append(str(i))
+
+    latencies, hits = [], 0
+    for query, target in zip(queries, targets):
+        start = time.perf_counter()
+        results = index.search(query, args.k)
+        latencies.append(time.perf_counter() - start)
+        hits += bool(results) and results[0][0] == target
+    latencies.sort()
+    print(
+        f"Requêtes: p50 {statistics.median(latencies) * 1000:.2f} ms, "
+        f"p95 {latencies[int(0.95 * (len(latencies) - 1))] * 1000:.2f} ms, "
+        f"identifiant exact en tête {hits / len(queries):.1%}"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bm25.npz")
+        start = time.perf_counter()
+        index.save(path)
+        save = time.perf_counter() - start
+        start = time.perf_counter()
+        BM25Index.load(path)
+        load = time.perf_counter() - start
+        print(f"Persistance: save {save:.2f} s, load {load:.2f} s, fichier {os.path.getsize(path) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
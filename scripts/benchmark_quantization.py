@@ -0,0 +1,100 @@
+"""Benchmark: stockage quantifié FAISS (fp16 / int8 / PQ) vs float32
+
+Pour chaque quantification : mémoire par vecteur (codes de l'index en RAM,
+copie float32 sur disque pour le re-scoring), recall@k par rapport à la
+recherche exacte float32, latence des requêtes avec et sans re-scoring exact.
+
+    python scripts/benchmark_quantization.py --vectors 100000 --dim 1536 --pq-m 96
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+# Ajouter le répertoire racine au path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.vector_stores import FaissVectorStore
+from scripts.benchmark_vector_stores import generate_vectors, recall
+
+
+def bench(quantization, args, vectors, queries, truth, directory: Path):
+    path = str(directory / f"{args.index_type}-{quantization}")
+    options = dict(
+        index_type=args.index_type,
+        quantization=quantization,
+        pq_m=args.pq_m,
+        nlist=args.nlist,
+        nprobe=args.nprobe
+    )
+    store = FaissVectorStore(DeterministicFakeEmbedding(size=vectors.shape[1]), path, **options)
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), args.batch):
+        block = vectors[offset:offset + args.batch]
+        store.add_embeddings(
+            [(f"doc {offset + i}", vector) for i, vector in enumerate(block)],
+            ids=[str(offset + i) for i in range(len(block))]
+        )
+    store.flush()
+    build = time.perf_counter() - start
+
+    # Serving path: a fresh, memory-mapped read-only instance
+    store = FaissVectorStore(DeterministicFakeEmbedding(size=vectors.shape[1]), path, **options)
+    index_bytes = len(faiss.serialize_index(store._index)) / len(vectors)
+    disk_bytes = os.path.getsize(store.vectors_path) / len(vectors) if os.path.exists(store.vectors_path) else 0
+
+    factors = [1, args.rescore_factor] if quantization != "none" else [1]
+    for factor in factors:
+        store.rescore_factor = factor
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            found = store.similarity_search_with_score_by_vector(query, k=args.k)
+            latencies.append(time.perf_counter() - start)
+            results.append([int(doc.id) for doc, _ in found])
+        latencies.sort()
+        name = quantization if factor == 1 else f"{quantization}+rescore"
+        print(
+            f"{name:<16}{build:>9.1f}{index_bytes:>11.0f}{disk_bytes:>11.0f}"
+            f"{recall(results, truth):>10.3f}{statistics.median(latencies) * 1000:>10.2f}"
+            f"{latencies[int(0.95 * (len(latencies) - 1))] * 1000:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--index-type", default="flat", choices=["flat", "ivf", "hnsw"])
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--quantizations", nargs="+", default=["none", "fp16", "int8", "pq"])
+    args = parser.parse_args()
+
+    vectors = generate_vectors(args.vectors, args.dim)
+    queries = generate_vectors(args.queries, args.dim, seed=1)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k].tolist()
+
+    print(f"{args.vectors} vecteurs x {args.dim} dims, index {args.index_type}, {args.queries} requêtes, k={args.k}")
+    print(f"{'quantification':<16}{'build s':>9}{'RAM o/vec':>11}{'disk o/vec':>11}{'recall':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for quantization in args.quantizations:
+            bench(quantization, args, vectors, queries, truth, Path(tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Benchmark: recall@k and query latency, FAISS (flat / ivf / hnsw) vs Chroma
+
+Vecteurs synthétiques regroupés en clusters (proche de vrais embeddings),
+vérité terrain par recherche exacte numpy (cosinus).
+
+    python scripts/benchmark_vector_stores.py --vectors 50000 --dim 384 --queries 200 --k 10
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Ajouter le répertoire racine au path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.vector_stores import FaissVectorStore
+
+
+def generate_vectors(n: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall(results, truth) -> float:
+    return float(np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, truth)]))
+
+
+def report(name: str, build_seconds: float, latencies, results, truth, size_mb: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(
+        f"{name:<12}{build_seconds:>10.2f}{statistics.median(latencies) * 1000:>10.2f}"
+        f"{p95 * 1000:>10.2f}{recall(results, truth):>10.3f}{size_mb:>10.1f}"
+    )
+
+
+def dir_size_mb(path: Path) -> float:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 1e6
+
+
+def bench_faiss(index_type, vectors, queries, truth, k, directory: Path, batch: int, nlist: int, nprobe: int):
+    store = FaissVectorStore(
+        DeterministicFakeEmbedding(size=vectors.shape[1]),
+        str(directory / index_type),
+        index_type=index_type,
+        nlist=nlist,
+        nprobe=nprobe
+    )
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch):
+        block = vectors[offset:offset + batch]
+        store.add_embeddings(
+            [(f"doc {offset + i}", vector) for i, vector in enumerate(block)],
+            ids=[str(offset + i) for i in range(len(block))]
+        )
+    store.flush()
+    build = time.perf_counter() - start
+
+    # Serving path: a fresh, memory-mapped read-only instance
+    store = FaissVectorStore(
+        DeterministicFakeEmbedding(size=vectors.shape[1]),
+        str(directory / index_type),
+        index_type=index_type,
+        nprobe=nprobe
+    )
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = store.similarity_search_with_score_by_vector(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        results.append([int(doc.id) for doc, _ in found])
+    report(f"faiss-{index_type}", build, latencies, results, truth, dir_size_mb(directory / index_type))
+
+
+def bench_chroma(vectors, queries, truth, k, directory: Path, batch: int):
+    try:
+        import chromadb
+    except ImportError:
+        print("chroma      (chromadb non installé)")
+        return
+    client = chromadb.PersistentClient(path=str(directory / "chroma"))
+    collection = client.create_collection("bench", metadata={"hnsw:space": "cosine"})
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch):
+        block = vectors[offset:offset + batch]
+        collection.add(
+            ids=[str(offset + i) for i in range(len(block))],
+            embeddings=block.tolist(),
+            documents=[f"doc {offset + i}" for i in range(len(block))]
+        )
+    build = time.perf_counter() - start
+
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = collection.query(query_embeddings=[query.tolist()], n_results=k)
+        latencies.append(time.perf_counter() - start)
+        results.append([int(i) for i in found["ids"][0]])
+    report("chroma", build, latencies, results, truth, dir_size_mb(directory / "chroma"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--index-types", nargs="+", default=["flat", "ivf", "hnsw"])
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    vectors = generate_vectors(args.vectors, args.dim)
+    queries = generate_vectors(args.queries, args.dim, seed=1)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k].tolist()
+
+    print(f"{args.vectors} vecteurs x {args.dim} dims, {args.queries} requêtes, k={args.k}")
+    print(f"{'store':<12}{'build s':>10}{'p50 ms':>10}{'p95 ms':>10}{'recall':>10}{'disk MB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        for index_type in args.index_types:
+            bench_faiss(index_type, vectors, queries, truth, args.k, directory, args.batch, args.nlist, args.nprobe)
+        if not args.skip_chroma:
+            bench_chroma(vectors, queries, truth, args.k, directory, args.batch)
+
+
+if __name__ == "__main__":
+    main()
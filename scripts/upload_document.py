@@ -2,6 +2,7 @@
 
 import requests
 import sys
+import time
 from pathlib import Path
 
 def upload_document(file_path: str, api_url: str = "http://localhost:8001"):
@@ -39,11 +40,23 @@ def upload_document(file_path: str, api_url: str = "http://localhost:8001"):
             print("⏳ Envoi en cours...")
             response = requests.post(url, files=files, timeout=timeout)
             response.raise_for_status()
-            
-            result = response.json()
-            print(f"✅ Succès! {result['message']}")
-            print(f"📊 Nombre de chunks créés: {result['chunks_count']}")
-            return True
+        
+        # L'ingestion tourne en tâche de fond : suivre le job jusqu'à la fin
+        status_url = f"{api_url}{response.json()['status_url']}"
+        print("⏳ Indexation en cours...")
+        while True:
+            time.sleep(1)
+            status = requests.get(status_url, timeout=30)
+            status.raise_for_status()
+            job = status.json()
+            if job["status"] == "failed":
+                print(f"❌ Erreur lors de l'ingestion: {job.get('error')}")
+                return False
+            if job["status"] == "succeeded":
+                result = job["result"]
+                print(f"✅ Succès! {result['message']}")
+                print(f"📊 Nombre de chunks créés: {result['chunks_count']}")
+                return True
             
     except requests.exceptions.Timeout:
         print(f"❌ Erreur: Timeout - Le fichier est trop volumineux ou l'API ne répond pas")
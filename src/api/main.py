@@ -1,34 +1,55 @@
 """FastAPI main application"""
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+import asyncio
+import json
 import os
-import tempfile
+import time
 from pathlib import Path
 from contextlib import asynccontextmanager
 
 from src.config import settings
+from src.api.uploads import UPLOAD_OPENAPI, save_upload
 from src.rag.ingestion import DocumentIngester
 from src.rag.retrieval import RetrievalSystem
 from src.rag.generation import RAGGenerator
 from src.rag.pipeline import RAGPipeline
-from src.monitoring.prometheus import setup_prometheus_metrics
+from src.rag.answer_cache import SemanticAnswerCache
+from src.rag.coalescing import RequestCoalescer, coalescing_key
+from src.rag.llm_gateway import LLMOverloaded
+from src.rag.embedding_cache import EmbeddingStats, collect_embedding_stats
+from src.rag.ingest_stream import stream_ingest
+from src.rag.manifest import IngestionManifest, SyncResult, sync_directory, sync_file, sync_upload
+from src.rag.jobs import IngestJob, IngestionJobManager
+from src.rag.metadata_index import MetadataFilter, normalize_filter
+from src.rag.postprocess import RetrievalOptions
+from src.rag.rerank import Reranker
+from src.monitoring.prometheus import record_query, record_query_duration, setup_prometheus_metrics, time_stage
+from src.monitoring.telemetry import telemetry
+from src.utils.langfuse_exporter import shutdown_score_exporter
+from src.utils.mlflow_rest import close_async_mlflow_client, get_async_mlflow_client
 from src.monitoring.evidently import setup_evidently_monitoring
 
 # Initialize RAG components
 rag_pipeline: Optional[RAGPipeline] = None
 document_ingester: Optional[DocumentIngester] = None
 retrieval_system: Optional[RetrievalSystem] = None
+ingestion_manifest: Optional[IngestionManifest] = None
+ingestion_jobs: Optional[IngestionJobManager] = None
+request_coalescer = RequestCoalescer()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown"""
-    global rag_pipeline, document_ingester, retrieval_system
+    global rag_pipeline, document_ingester, retrieval_system, ingestion_manifest, ingestion_jobs
     
     # Startup
     print("Initializing RAG system...")
@@ -44,7 +65,12 @@ async def lifespan(app: FastAPI):
     
     document_ingester = DocumentIngester(
         chunk_size=settings.chunk_size,
-        chunk_overlap=settings.chunk_overlap
+        chunk_overlap=settings.chunk_overlap,
+        max_workers=settings.ingest_workers,
+        max_in_flight=settings.ingest_max_in_flight,
+        # One pool of spawned parsing processes, created here and reused by every job
+        use_processes=not settings.ingest_in_process,
+        nice=settings.ingest_job_nice
     )
     
     retrieval_system = RetrievalSystem(
@@ -58,7 +84,42 @@ async def lifespan(app: FastAPI):
         max_tokens=settings.max_tokens
     )
     
-    rag_pipeline = RAGPipeline(retrieval_system, generator)
+    reranker = Reranker() if settings.rerank_enabled else None
+    
+    answer_cache = None
+    if settings.answer_cache_enabled:
+        answer_cache = SemanticAnswerCache(
+            fetch_chunks=retrieval_system.vector_store.get_by_ids,
+            max_entries=settings.answer_cache_max_entries,
+            threshold=settings.answer_cache_threshold,
+            ttl_seconds=settings.answer_cache_ttl_seconds,
+            clear_on_write=settings.answer_cache_clear_on_ingest
+        )
+        # Every ingestion/deletion through this process invalidates the cache
+        retrieval_system.add_write_listener(answer_cache.on_index_write)
+    
+    rag_pipeline = RAGPipeline(retrieval_system, generator, reranker=reranker, answer_cache=answer_cache)
+    
+    ingestion_manifest = IngestionManifest(
+        settings.ingest_manifest_path
+        or os.path.join(settings.chroma_persist_directory, "ingest_manifest.sqlite")
+    )
+    # Chunks of an ingestion interrupted before the FAISS flush: re-indexed by the next sync
+    dropped_ids = getattr(retrieval_system.vector_store, "dropped_ids", None)
+    if dropped_ids:
+        stale = ingestion_manifest.forget_chunks(dropped_ids)
+        print(f"⚠️  Warning: {len(stale)} fichier(s) à ré-ingérer après une ingestion interrompue")
+    
+    # Ingestion jobs run on their own low-priority pool, away from queries
+    ingestion_jobs = IngestionJobManager(
+        run_ingest_job,
+        max_workers=settings.ingest_job_workers,
+        journal_path=settings.ingest_job_journal_path,
+        nice=settings.ingest_job_nice
+    )
+    resumed = ingestion_jobs.recover(can_resume=lambda job: os.path.exists(job.source))
+    if resumed:
+        print(f"✅ {len(resumed)} job(s) d'ingestion repris depuis le journal")
     
     # Setup monitoring
     if settings.enable_prometheus:
@@ -73,6 +134,19 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     print("Shutting down RAG system...")
+    if ingestion_jobs is not None:
+        ingestion_jobs.shutdown()
+    if document_ingester is not None:
+        document_ingester.shutdown()
+    if rag_pipeline is not None and rag_pipeline.reranker is not None:
+        rag_pipeline.reranker.shutdown()
+    if retrieval_system is not None:
+        retrieval_system.flush()
+    shutdown_score_exporter()
+    telemetry.shutdown()
+    if mlflow_tasks:
+        await asyncio.wait(mlflow_tasks, timeout=5)
+    await close_async_mlflow_client()
 
 
 # Create FastAPI app
@@ -99,9 +173,49 @@ if static_dir.exists():
 
 
 # Pydantic models
-class QuestionRequest(BaseModel):
+class RetrievalParams(BaseModel):
+    """Per-request post-retrieval overrides (None = server default)"""
+    mmr: Optional[bool] = None
+    mmr_lambda: Optional[float] = None
+    fetch_k: Optional[int] = None
+    score_threshold: Optional[float] = None
+    max_per_source: Optional[int] = None
+    
+    def retrieval_options(self) -> RetrievalOptions:
+        return RetrievalOptions.from_settings(
+            mmr=self.mmr,
+            mmr_lambda=self.mmr_lambda,
+            fetch_k=self.fetch_k,
+            score_threshold=self.score_threshold,
+            max_per_source=self.max_per_source
+        )
+
+
+def validate_filter(filter: Optional[MetadataFilter]) -> Optional[MetadataFilter]:
+    """400 on malformed metadata filters"""
+    try:
+        normalize_filter(filter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {e}")
+    return filter or None
+
+
+def query_key(request: "QuestionRequest", filter: Optional[MetadataFilter]) -> str:
+    """Coalescing key: identical in-flight queries share one pipeline run"""
+    return coalescing_key(
+        request.question,
+        request.chat_history,
+        options=request.retrieval_options(),
+        filter=filter,
+        use_cache=request.use_cache
+    )
+
+
+class QuestionRequest(RetrievalParams):
     question: str
     chat_history: Optional[List[Dict[str, str]]] = None
+    filter: Optional[Dict[str, Any]] = None  # {"source": "a.pdf", "tenant": ["x", "y"]}
+    use_cache: bool = True  # False: toujours régénérer la réponse
 
 
 class QuestionResponse(BaseModel):
@@ -111,16 +225,43 @@ class QuestionResponse(BaseModel):
     model: str
     trace_id: Optional[str] = None
     auto_scores: Optional[Dict[str, float]] = None
+    cached: bool = False
 
 
 class IngestRequest(BaseModel):
     path: str
     is_directory: bool = False
+    incremental: bool = True  # Ne ré-ingérer que les fichiers modifiés (manifest)
 
 
 class IngestResponse(BaseModel):
     message: str
     chunks_count: int
+    embedding_cache_hits: int = 0
+    embedding_cache_hit_ratio: float = 0.0
+    embedding_tokens_saved: int = 0
+    embedding_cost_saved_usd: float = 0.0
+    files_changed: Optional[int] = None
+    files_unchanged: Optional[int] = None
+    files_removed: Optional[int] = None
+    chunks_deleted: Optional[int] = None
+    errors: Optional[Dict[str, str]] = None
+
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+
+def embedding_stats_fields(stats: EmbeddingStats) -> Dict[str, Any]:
+    """IngestResponse fields reporting the embedding cache savings"""
+    return {
+        "embedding_cache_hits": stats.cache_hits,
+        "embedding_cache_hit_ratio": round(stats.hit_ratio, 4),
+        "embedding_tokens_saved": stats.tokens_saved,
+        "embedding_cost_saved_usd": round(stats.cost_saved, 6)
+    }
 
 
 # Health check
@@ -157,251 +298,512 @@ async def web_interface():
 
 # Prometheus metrics endpoint
 if settings.enable_prometheus:
-    from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-    from fastapi.responses import Response
+    from prometheus_client import REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client.openmetrics import exposition as openmetrics
     
     @app.get("/metrics")
-    async def metrics():
-        """Prometheus metrics endpoint"""
+    async def metrics(request: Request):
+        """Prometheus metrics endpoint (OpenMetrics, with trace exemplars, when the scraper accepts it)"""
+        if "application/openmetrics-text" in request.headers.get("accept", ""):
+            return Response(content=openmetrics.generate_latest(REGISTRY), media_type=openmetrics.CONTENT_TYPE_LATEST)
         return Response(
             content=generate_latest(),
             media_type=CONTENT_TYPE_LATEST
         )
 
 
+def compute_auto_scores(answer: str, sources_count: int) -> Dict[str, float]:
+    """Heuristic relevance/completeness scores for display"""
+    answer_length = len(answer)
+    relevance = min(1.0, (answer_length / 500) * 0.5 + (sources_count / 5) * 0.5)
+    completeness = min(1.0, answer_length / 300)
+    
+    return {
+        "relevance": round(relevance, 2),
+        "completeness": round(completeness, 2)
+    }
+
+
+async def score_response(
+    trace_id: Optional[str],
+    question: str,
+    answer: str,
+    sources_count: int
+) -> Dict[str, float]:
+    """Compute automatic scores and queue them for Langfuse if trace_id is available"""
+    auto_scores = {}
+    
+    with time_stage("scoring", trace_id):
+        try:
+            auto_scores = compute_auto_scores(answer, sources_count)
+            
+            # Langfuse scores are queued and exported in the background:
+            # query latency does not depend on Langfuse availability
+            if trace_id:
+                from src.utils.langfuse_scoring import enqueue_rag_response_scores
+                enqueue_rag_response_scores(
+                    trace_id=trace_id,
+                    answer=answer,
+                    question=question,
+                    sources_count=sources_count,
+                    answer_length=len(answer)
+                )
+        except Exception as e:
+            print(f"⚠️  Warning: Could not create automatic scores: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    return auto_scores
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a JSON-encoded Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def overloaded(error: LLMOverloaded) -> HTTPException:
+    """503 with Retry-After: the LLM gateway shed the request"""
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
+
 # RAG endpoints
 @app.post("/api/query", response_model=QuestionResponse)
 async def query(request: QuestionRequest):
     """Query the RAG system"""
     if rag_pipeline is None:
         raise HTTPException(status_code=503, detail="RAG system not initialized")
+    filter = validate_filter(request.filter)
+    start = time.perf_counter()
     
-    try:
-        result = rag_pipeline.run(
+    async def answer() -> Dict[str, Any]:
+        result = await rag_pipeline.arun(
             question=request.question,
-            chat_history=request.chat_history
+            chat_history=request.chat_history,
+            retrieval_options=request.retrieval_options(),
+            filter=filter,
+            use_cache=request.use_cache
         )
         
-        # Get trace_id from result (set by RAGGenerator via pipeline)
+        # trace_id is generated by the pipeline for this request
         trace_id = result.get("trace_id")
-        if trace_id:
-            print(f"✅ Trace ID récupéré: {trace_id}")
-        else:
-            print(f"⚠️  Pas de trace_id dans le résultat")
-        
-        # Automatic evaluation and scoring
-        auto_scores = {}
         
-        try:
-            # Calculate scores for display
-            answer_length = len(result["answer"])
-            sources_count = len(result.get("sources", []))
-            
-            # Heuristic scores
-            relevance = min(1.0, (answer_length / 500) * 0.5 + (sources_count / 5) * 0.5)
-            completeness = min(1.0, answer_length / 300)
-            
-            auto_scores = {
-                "relevance": round(relevance, 2),
-                "completeness": round(completeness, 2)
-            }
-            
-            # Create automatic scores in Langfuse if trace_id is available
-            if trace_id:
-                try:
-                    from src.utils.langfuse_scoring import score_rag_response
-                    scores = score_rag_response(
-                        trace_id=trace_id,
-                        answer=result["answer"],
-                        question=request.question,
-                        sources_count=sources_count,
-                        answer_length=answer_length
-                    )
-                    print(f"✅ Scores automatiques créés pour trace_id: {trace_id}")
-                except Exception as score_error:
-                    print(f"⚠️  Warning: Could not create automatic scores: {score_error}")
-            else:
-                print(f"⚠️  Pas de trace_id - scores automatiques non créés dans Langfuse")
-                
-        except Exception as e:
-            print(f"⚠️  Warning: Could not create automatic scores: {e}")
-            import traceback
-            traceback.print_exc()
+        # Automatic evaluation and scoring (once per trace, not per coalesced waiter)
+        auto_scores = await score_response(
+            trace_id=trace_id,
+            question=request.question,
+            answer=result["answer"],
+            sources_count=len(result.get("sources", []))
+        )
         
         # Ensure trace_id is in result
         result["trace_id"] = trace_id
         result["auto_scores"] = auto_scores if auto_scores else None
-        
-        return QuestionResponse(**result)
+        return result
+    
+    try:
+        if settings.request_coalescing_enabled:
+            result = await request_coalescer.run(query_key(request, filter), answer)
+        else:
+            result = await answer()
+        # Serialized once here (a returned Response is not re-validated by FastAPI)
+        with time_stage("serialization", result.get("trace_id")):
+            body = QuestionResponse(**{**result, "question": request.question}).model_dump_json()
+    except LLMOverloaded as e:
+        record_query("shed")
+        raise overloaded(e)
     except Exception as e:
+        record_query("error")
         raise HTTPException(status_code=500, detail=str(e))
+    record_query("success")
+    record_query_duration(time.perf_counter() - start, result.get("trace_id"))
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/api/query/stream")
 async def query_stream(request: QuestionRequest):
-    """Stream query results"""
+    """Stream query results as JSON Server-Sent Events (sources, token..., end)"""
     if rag_pipeline is None:
         raise HTTPException(status_code=503, detail="RAG system not initialized")
+    filter = validate_filter(request.filter)
+    start = time.perf_counter()
     
-    def generate():
-        for state in rag_pipeline.stream(
+    async def events():
+        async for event in rag_pipeline.astream_answer(
             question=request.question,
-            chat_history=request.chat_history
+            chat_history=request.chat_history,
+            retrieval_options=request.retrieval_options(),
+            filter=filter,
+            use_cache=request.use_cache
         ):
-            yield f"data: {state}\n\n"
+            if event["event"] == "end":
+                event["auto_scores"] = await score_response(
+                    trace_id=event.get("trace_id"),
+                    question=request.question,
+                    answer=event["answer"],
+                    sources_count=len(event.get("sources", []))
+                ) or None
+            yield event
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    # Clients joining an identical stream in flight replay it, then follow live
+    if settings.request_coalescing_enabled:
+        stream = request_coalescer.stream(query_key(request, filter), events)
+    else:
+        stream = events()
+    
+    # Wait for the first event before answering: a shed request gets a real 503
+    first: Optional[Dict[str, Any]] = None
+    error: Optional[Exception] = None
+    try:
+        first = await stream.__anext__()
+    except LLMOverloaded as e:
+        record_query("shed")
+        raise overloaded(e)
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        error = e
+    
+    async def generate():
+        try:
+            if error is not None:
+                raise error
+            if first is None:
+                return
+            async for event in _prepend(first, stream):
+                if event["event"] != "end":
+                    yield sse_event(event["event"], event)
+                    continue
+                with time_stage("serialization", event.get("trace_id")):
+                    data = sse_event("end", {**event, "question": request.question})
+                yield data
+                record_query("success")
+                record_query_duration(time.perf_counter() - start, event.get("trace_id"))
+        except LLMOverloaded as e:
+            record_query("shed")
+            yield sse_event("error", {"event": "error", "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            record_query("error")
+            yield sse_event("error", {"event": "error", "detail": str(e)})
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
+async def _prepend(first: Any, stream):
+    yield first
+    async for item in stream:
+        yield item
 
-@app.post("/api/ingest", response_model=IngestResponse)
-async def ingest_documents(request: IngestRequest):
-    """Ingest documents into the vector store"""
-    if document_ingester is None or retrieval_system is None:
+
+def run_ingest_job(job: IngestJob) -> Dict[str, Any]:
+    """Execute an ingestion job (runs on the job pool); returns IngestResponse fields"""
+    params = job.params
+    try:
+        with collect_embedding_stats(settings.embedding_cost_per_1k_tokens) as embedding_stats:
+            if params.get("incremental") and ingestion_manifest is not None:
+                if params.get("is_directory"):
+                    sync = sync_directory(
+                        job.source, document_ingester, retrieval_system, ingestion_manifest,
+                        progress=job.add_progress
+                    )
+                else:
+                    sync = SyncResult()
+                    sync_file(job.source, document_ingester, retrieval_system, ingestion_manifest, sync)
+                    job.add_progress(files=1, chunks=sync.chunks_added)
+                job.errors.update(sync.errors)
+                return {
+                    "message": "Documents synchronized successfully",
+                    "chunks_count": sync.chunks_added,
+                    "files_changed": sync.files_changed,
+                    "files_unchanged": sync.files_unchanged,
+                    "files_removed": sync.files_removed,
+                    "chunks_deleted": sync.chunks_deleted,
+                    "errors": sync.errors or None,
+                    **embedding_stats_fields(embedding_stats)
+                }
+            
+            if params.get("is_directory"):
+                # Streaming ingestion: memory bounded by the batch size
+                ingestion = stream_ingest(
+                    document_ingester,
+                    retrieval_system,
+                    job.source,
+                    batch_size=settings.ingest_batch_size,
+                    prefetch_batches=settings.ingest_prefetch_batches,
+                    progress=job.add_progress
+                )
+                job.errors.update(ingestion.errors)
+                return {
+                    "message": "Documents ingested successfully",
+                    "chunks_count": ingestion.chunks_count,
+                    "errors": ingestion.errors or None,
+                    **embedding_stats_fields(embedding_stats)
+                }
+            
+            filename = params.get("filename")
+            if job.kind == "upload" and ingestion_manifest is not None:
+                # Uploads are deduplicated by the content hash computed while streaming
+                sync = SyncResult()
+                chunks = sync_upload(
+                    job.source, f"upload://{filename}", params["content_hash"],
+                    document_ingester, retrieval_system, ingestion_manifest, sync
+                )
+                if sync.files_unchanged:
+                    job.add_progress(files=1)
+                    return {
+                        "message": f"File {filename} already indexed",
+                        "chunks_count": 0,
+                        "files_unchanged": 1,
+                        **embedding_stats_fields(embedding_stats)
+                    }
+            else:
+                chunks = document_ingester.ingest(source=job.source, is_directory=False)
+                retrieval_system.add_documents(chunks)
+            job.add_progress(files=1, chunks=len(chunks))
+        
+        return {
+            "message": f"File {filename} ingested successfully" if filename else "Documents ingested successfully",
+            "chunks_count": len(chunks),
+            "avg_chunk_size": sum(len(chunk.page_content) for chunk in chunks) / len(chunks) if chunks else 0,
+            **embedding_stats_fields(embedding_stats)
+        }
+    finally:
+        retrieval_system.flush()
+        if params.get("cleanup"):
+            try:
+                os.unlink(job.source)
+            except OSError:
+                pass
+
+
+async def wait_for_job(job: IngestJob) -> Dict[str, Any]:
+    """Await a job without blocking the event loop"""
+    return await asyncio.wrap_future(ingestion_jobs.future(job.id))
+
+
+def job_status_url(job: IngestJob) -> str:
+    return f"/api/ingest/jobs/{job.id}"
+
+
+def require_ingestion():
+    if document_ingester is None or retrieval_system is None or ingestion_jobs is None:
         raise HTTPException(status_code=503, detail="RAG system not initialized")
+
+
+def job_accepted(job: IngestJob) -> IngestJobResponse:
+    return IngestJobResponse(job_id=job.id, status=job.status, status_url=job_status_url(job))
+
+
+async def job_result(job: IngestJob) -> Response:
+    """Wait for the job (wait=true clients) and answer 200 with its IngestResponse"""
+    try:
+        result = IngestResponse(**await wait_for_job(job))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=result.model_dump_json(), media_type="application/json")
+
+
+@app.post(
+    "/api/ingest",
+    response_model=IngestJobResponse,
+    status_code=202,
+    responses={200: {"model": IngestResponse, "description": "wait=true: ingestion finished"}}
+)
+async def ingest_documents(request: IngestRequest, wait: bool = False):
+    """Submit an ingestion job and return its id (wait=true: block until it is done)"""
+    require_ingestion()
     
     try:
-        chunks = document_ingester.ingest(
-            source=request.path,
-            is_directory=request.is_directory
-        )
-        
-        retrieval_system.add_documents(chunks)
-        
-        return IngestResponse(
-            message="Documents ingested successfully",
-            chunks_count=len(chunks)
+        job = ingestion_jobs.submit(
+            "path", request.path,
+            is_directory=request.is_directory,
+            incremental=request.incremental
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return await job_result(job) if wait else job_accepted(job)
 
 
-@app.post("/api/ingest/upload")
-async def ingest_upload(file: UploadFile = File(...)):
-    """Upload and ingest a document"""
-    if document_ingester is None or retrieval_system is None:
-        raise HTTPException(status_code=503, detail="RAG system not initialized")
+async def log_upload_run(
+    filename: str,
+    start_time: int,
+    status: str,
+    params: Optional[Dict[str, Any]] = None,
+    metrics: Optional[Dict[str, float]] = None
+):
+    """One MLflow run per upload, sent after the fact (create, one log-batch, update)"""
+    try:
+        client = get_async_mlflow_client()
+        run = await client.start_run(
+            run_name=f"ingest_{filename}",
+            tags={"type": "ingestion", "filename": filename},
+            start_time=start_time
+        )
+        for key, value in (params or {}).items():
+            run.log_param(key, value)
+        for key, value in (metrics or {}).items():
+            run.log_metric(key, value)
+        await run.end(status)
+    except Exception as e:
+        print(f"⚠️  Warning: Could not log upload to MLflow: {e}")
+
+
+# Références des tâches MLflow en cours (sinon le GC peut les annuler)
+mlflow_tasks: set = set()
+
+
+def schedule_upload_run(*args, **kwargs):
+    task = asyncio.create_task(log_upload_run(*args, **kwargs))
+    mlflow_tasks.add(task)
+    task.add_done_callback(mlflow_tasks.discard)
+
+
+def log_upload_job(job: IngestJob, filename: str, file_size: int, start_time: int):
+    """Log the upload to MLflow once its job is done, whether the client waits or not"""
+    future = ingestion_jobs.future(job.id)
+    if future is None:
+        return
+    loop = asyncio.get_running_loop()
+    
+    def done(future):
+        if future.cancelled() or future.exception() is not None:
+            kwargs = {"status": "FAILED", "params": {"filename": filename}}
+        else:
+            result = future.result()
+            kwargs = {
+                "status": "FINISHED",
+                "params": {"filename": filename, "file_size_bytes": file_size},
+                "metrics": {
+                    "chunks_created": result["chunks_count"],
+                    "avg_chunk_size": result.get("avg_chunk_size", 0)
+                }
+            }
+        try:
+            loop.call_soon_threadsafe(lambda: schedule_upload_run(filename, start_time, **kwargs))
+        except RuntimeError:
+            pass  # loop closed: shutting down
     
-    # MLflow tracking - Try Python SDK first, fallback to REST API
-    mlflow_run_id = None
-    mlflow_using_rest = False
+    future.add_done_callback(done)
+
+
+@app.post(
+    "/api/ingest/upload",
+    response_model=IngestJobResponse,
+    status_code=202,
+    responses={200: {"model": IngestResponse, "description": "wait=true: ingestion finished"}},
+    openapi_extra=UPLOAD_OPENAPI
+)
+async def ingest_upload(request: Request, wait: bool = False):
+    """Upload a document (multipart field "file") and ingest it in the background (wait=true: block until it is indexed)"""
+    require_ingestion()
     
-    # Try Python SDK
+    # MLflow: the run is logged in the background once ingestion is done,
+    # with its own run handle (concurrent uploads never share a current run)
+    start_time = int(time.time() * 1000)
+    filename = None
     try:
-        import mlflow
-        from src.utils.mlflow_utils import start_run
-        mlflow_run = start_run(
-            run_name=f"ingest_{file.filename}",
-            tags={"type": "ingestion", "filename": file.filename}
+        # Streamed from the request body to disk (the body is not spooled first)
+        upload = await save_upload(request)
+        filename = upload.filename
+        # Ingest document on the job pool (the temp file is removed by the job)
+        job = ingestion_jobs.submit(
+            "upload", upload.path, filename=filename, content_hash=upload.sha256, cleanup=True
         )
-        mlflow_run_id = mlflow_run.info.run_id if hasattr(mlflow_run, 'info') else None
-        print(f"✅ MLflow run started (Python SDK): {mlflow_run_id}")
-    except (ImportError, ModuleNotFoundError):
-        # Fallback to REST API
-        try:
-            from src.utils.mlflow_rest import get_mlflow_client
-            client = get_mlflow_client()
-            if client:
-                mlflow_run_id = client.start_run(
-                    run_name=f"ingest_{file.filename}",
-                    tags={"type": "ingestion", "filename": file.filename}
-                )
-                mlflow_using_rest = True
-                print(f"✅ MLflow run started (REST API): {mlflow_run_id}")
-        except Exception as e:
-            print(f"⚠️  Warning: Could not start MLflow run: {e}")
     except Exception as e:
-        print(f"⚠️  Warning: Could not start MLflow run: {e}")
+        status_code = e.status_code if isinstance(e, HTTPException) else 500
+        schedule_upload_run(filename or "upload", start_time, "FAILED", params={"filename": filename})
+        raise HTTPException(status_code=status_code, detail=getattr(e, "detail", None) or str(e))
+    
+    log_upload_job(job, filename, upload.size, start_time)
+    return await job_result(job) if wait else job_accepted(job)
+
+
+@app.get("/api/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Status and progress of an ingestion job"""
+    if ingestion_jobs is None:
+        raise HTTPException(status_code=503, detail="RAG system not initialized")
     
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.snapshot()
+
+
+@app.get("/api/ingest/jobs")
+async def list_ingest_jobs(limit: int = 50):
+    """Most recent ingestion jobs"""
+    if ingestion_jobs is None:
+        raise HTTPException(status_code=503, detail="RAG system not initialized")
+    
+    return {"jobs": [job.snapshot() for job in ingestion_jobs.list()[:limit]]}
+
+
+def search_results(query: str, docs) -> Dict[str, Any]:
+    """Search response payload for one query"""
+    return {
+        "query": query,
+        "results": [
+            {
+                "content": doc.page_content[:500],
+                "metadata": doc.metadata
+            }
+            for doc in docs
+        ]
+    }
+
+
+@app.get("/api/search")
+async def search(
+    query: str,
+    k: Optional[int] = None,
+    filter: Optional[str] = None,
+    params: RetrievalParams = Depends()
+):
+    """Search the vector store (filter: JSON object, e.g. {"source": "a.pdf"})"""
+    if retrieval_system is None:
+        raise HTTPException(status_code=503, detail="RAG system not initialized")
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-        
-        try:
-            # Ingest document
-            chunks = document_ingester.ingest(tmp_path, is_directory=False)
-            retrieval_system.add_documents(chunks)
-            
-            # Log additional metrics to MLflow
-            if mlflow_run_id:
-                try:
-                    if mlflow_using_rest:
-                        from src.utils.mlflow_rest import get_mlflow_client
-                        client = get_mlflow_client()
-                        if client:
-                            client.log_param("filename", file.filename)
-                            client.log_param("file_size_bytes", len(content))
-                            client.log_metric("chunks_created", len(chunks))
-                            avg_chunk_size = sum(len(chunk.page_content) for chunk in chunks) / len(chunks) if chunks else 0
-                            client.log_metric("avg_chunk_size", avg_chunk_size)
-                    else:
-                        import mlflow
-                        mlflow.log_param("filename", file.filename)
-                        mlflow.log_param("file_size_bytes", len(content))
-                        mlflow.log_metric("chunks_created", len(chunks))
-                        avg_chunk_size = sum(len(chunk.page_content) for chunk in chunks) / len(chunks) if chunks else 0
-                        mlflow.log_metric("avg_chunk_size", avg_chunk_size)
-                except Exception as e:
-                    print(f"⚠️  Warning: Could not log to MLflow: {e}")
-            
-            return IngestResponse(
-                message=f"File {file.filename} ingested successfully",
-                chunks_count=len(chunks)
-            )
-        finally:
-            # Clean up temp file
-            os.unlink(tmp_path)
-            # End MLflow run
-            if mlflow_run_id:
-                try:
-                    if mlflow_using_rest:
-                        from src.utils.mlflow_rest import get_mlflow_client
-                        client = get_mlflow_client()
-                        if client:
-                            client.end_run(status="FINISHED")
-                    else:
-                        import mlflow
-                        mlflow.end_run()
-                except Exception as e:
-                    print(f"⚠️  Warning: Could not end MLflow run: {e}")
+        metadata_filter = validate_filter(json.loads(filter)) if filter else None
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid filter: not a JSON object")
     
+    try:
+        results = await retrieval_system.asimilarity_search(
+            query, k=k, options=params.retrieval_options(), filter=metadata_filter
+        )
+        return search_results(query, results)
     except Exception as e:
-        # End MLflow run on error
-        if mlflow_run_id:
-            try:
-                if mlflow_using_rest:
-                    from src.utils.mlflow_rest import get_mlflow_client
-                    client = get_mlflow_client()
-                    if client:
-                        client.end_run(status="FAILED")
-                else:
-                    import mlflow
-                    mlflow.end_run(status="FAILED")
-            except:
-                pass
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/search")
-async def search(query: str, k: Optional[int] = None):
-    """Search the vector store"""
+class BatchSearchRequest(RetrievalParams):
+    queries: List[str]
+    k: Optional[int] = None
+    filter: Optional[Dict[str, Any]] = None  # Appliqué à toutes les requêtes
+
+
+@app.post("/api/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """Search many queries with one embedding request and one matrix search"""
     if retrieval_system is None:
         raise HTTPException(status_code=503, detail="RAG system not initialized")
+    if len(request.queries) > settings.search_batch_max_queries:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.search_batch_max_queries} queries per batch"
+        )
+    filter = validate_filter(request.filter)
     
     try:
-        results = retrieval_system.similarity_search(query, k=k)
-        return {
-            "query": query,
-            "results": [
-                {
-                    "content": doc.page_content[:500],
-                    "metadata": doc.metadata
-                }
-                for doc in results
-            ]
-        }
+        batches = await run_in_threadpool(
+            retrieval_system.similarity_search_batch,
+            request.queries, request.k, request.retrieval_options(), filter
+        )
+        return {"results": [search_results(query, docs) for query, docs in zip(request.queries, batches)]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,170 @@
+"""Streaming multipart uploads: from the request body straight to the upload directory
+
+Starlette's UploadFile spools the whole body to a temporary file before the
+endpoint runs, so a size limit checked afterwards only fires once everything
+has been received, and the file is then copied a second time. Here the body
+is parsed as it arrives and only the file field is written, once, to its
+final path.
+"""
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import multipart
+from multipart.exceptions import FormParserError
+from multipart.multipart import parse_options_header
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from src.config import settings
+
+# Multipart framing around the file: boundaries, part headers, small fields
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# OpenAPI schema of the upload endpoints (the body is not declared as File(...))
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+
+@dataclass
+class SavedUpload:
+    path: str
+    filename: str
+    size: int
+    sha256: str
+
+
+class _FileField:
+    """Parser callbacks keeping the bytes of one file field, ignoring the other parts"""
+
+    def __init__(self, name: str):
+        self.name = name.encode()
+        self.filename: Optional[str] = None
+        self.data = bytearray()  # parsed, not yet written
+        self._in_file = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field_data,
+            "on_header_value": self._header_value_data,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def take(self) -> bytes:
+        block = bytes(self.data)
+        self.data.clear()
+        return block
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_field_data(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _header_value_data(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        # First file part with the expected field name only
+        if options.get(b"name") == self.name and b"filename" in options and self.filename is None:
+            self.filename = options[b"filename"].decode("utf-8", errors="replace")
+            self._in_file = True
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.data += data[start:end]
+
+    def _part_end(self):
+        self._in_file = False
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File exceeds the {settings.ingest_upload_max_bytes} bytes upload limit"
+    )
+
+
+async def save_upload(request: Request, field: str = "file") -> SavedUpload:
+    """Stream the file field of a multipart request to disk, hashing it on the fly
+
+    Raises 413 before reading anything when Content-Length is already above
+    ingest_upload_max_bytes, otherwise as soon as the received file passes it.
+    """
+    max_bytes = settings.ingest_upload_max_bytes
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise _too_large()
+
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data upload")
+
+    upload_dir = settings.ingest_upload_dir
+    if upload_dir:
+        os.makedirs(upload_dir, exist_ok=True)
+
+    file_field = _FileField(field)
+    parser = multipart.MultipartParser(options[b"boundary"], file_field.callbacks())
+    digest = hashlib.sha256()
+    size = 0
+    tmp_file = tempfile.NamedTemporaryFile(delete=False, dir=upload_dir)
+    path = tmp_file.name
+
+    async def write(block: bytes) -> int:
+        digest.update(block)
+        await run_in_threadpool(tmp_file.write, block)
+        return len(block)
+
+    try:
+        with tmp_file:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if size + len(file_field.data) > max_bytes:
+                    raise _too_large()
+                # Write in blocks of ingest_upload_chunk_bytes, not per network chunk
+                if len(file_field.data) >= settings.ingest_upload_chunk_bytes:
+                    size += await write(file_field.take())
+            parser.finalize()
+            size += await write(file_field.take())
+        if file_field.filename is None:
+            raise HTTPException(status_code=422, detail=f"Missing file field {field!r}")
+        # The loaders pick a parser from the extension
+        final_path = tmp_file.name + os.path.splitext(file_field.filename)[1]
+        os.replace(tmp_file.name, final_path)
+        path = final_path
+    except FormParserError as e:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail=f"Malformed multipart upload: {e}")
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return SavedUpload(path=path, filename=file_field.filename, size=size, sha256=digest.hexdigest())
@@ -1,7 +1,7 @@
 """Configuration management using Pydantic Settings"""
 
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -22,24 +22,128 @@ class Settings(BaseSettings):
     temperature: float = 0.7
     max_tokens: int = 1000
     
+    # LLM gateway: appels simultanés, file d'attente bornée, délestage (503 + Retry-After)
+    llm_max_concurrency: int = 8
+    llm_max_queue: int = 64
+    llm_queue_timeout_seconds: float = 10.0  # Attente maximale d'un créneau LLM
+    llm_tokens_per_minute: int = 0  # Quota TPM du fournisseur (0 = pas de limite)
+    
     # Vector Store Configuration
-    vector_store_type: str = "chroma"
+    vector_store_type: str = "chroma"  # "chroma" ou "faiss"
     chroma_persist_directory: str = "./chroma_db"
+    faiss_index_directory: str = "./faiss_index"
+    faiss_index_type: str = "flat"  # "flat", "ivf" ou "hnsw"
+    faiss_mmap: bool = True  # Index mappé en lecture seule (partagé entre workers via le page cache)
+    faiss_nlist: int = 1024  # IVF: nombre de listes (index plat exact jusqu'à 39 x nlist vecteurs)
+    faiss_nprobe: int = 16  # IVF: listes visitées par requête
+    faiss_hnsw_m: int = 32
+    faiss_hnsw_ef_construction: int = 200
+    faiss_hnsw_ef_search: int = 128
+    faiss_reload_interval_seconds: float = 5.0  # Recharger l'index s'il a été réécrit par un autre process
+    faiss_quantization: str = "none"  # "none", "fp16", "int8" (par dimension) ou "pq"
+    faiss_pq_m: int = 64  # Sous-quantifieurs PQ (octets par vecteur avec 8 bits)
+    faiss_pq_nbits: int = 8
+    faiss_rescore_factor: int = 4  # Index quantifié: k x facteur candidats re-scorés en float32 (1 = désactivé)
+    metadata_index_fields: List[str] = ["source", "doc_type", "tenant"]  # Champs filtrables par bitmap (FAISS)
     
     # Retrieval Configuration
     top_k: int = 5
+    search_batch_max_queries: int = 1000
+    
+    # Post-retrieval (MMR, seuil de similarité, plafond par source) — surchargeable par requête
+    retrieval_mmr_enabled: bool = False
+    retrieval_mmr_lambda: float = 0.5
+    retrieval_fetch_k: Optional[int] = None  # Candidats avant sélection (par défaut: 4 x k)
+    retrieval_score_threshold: Optional[float] = None  # Similarité cosinus minimale
+    retrieval_max_per_source: Optional[int] = None
     chunk_size: int = 1000
     chunk_overlap: int = 200
     
+    # Hybrid retrieval (BM25 + vecteurs)
+    retrieval_mode: str = "vector"  # "vector", "hybrid" ou "lexical"
+    lexical_index_enabled: bool = False  # Mode "vector": BM25 maintenu pour le repli (toujours actif en hybrid/lexical)
+    lexical_index_path: Optional[str] = None  # Par défaut: <chroma_persist_directory>/bm25_index.npz
+    hybrid_vector_weight: float = 1.0
+    hybrid_lexical_weight: float = 1.0
+    hybrid_rrf_k: int = 60
+    lexical_fallback_timeout_seconds: float = 2.0  # Recherche vectorielle plus lente -> résultats BM25
+    lexical_fallback_cooldown_seconds: float = 30.0  # Après un échec, BM25 seul pendant ce délai
+    lexical_fallback_workers: int = 32  # Recherches vectorielles sync concurrentes sous timeout
+    
+    # Reranking entre retrieve et generate
+    rerank_enabled: bool = False
+    rerank_scorer: str = "lexical"  # "lexical" ou "cross_encoder" (sentence-transformers)
+    rerank_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    rerank_fetch_k: int = 20  # Candidats récupérés avant reranking
+    rerank_top_n: int = 3  # Chunks envoyés au LLM
+    rerank_budget_seconds: float = 0.3  # Au-delà: ordre vectoriel conservé
+    rerank_batch_size: int = 16
+    rerank_max_length: int = 512
+    
+    # Cache sémantique des réponses (questions paraphrasées)
+    answer_cache_enabled: bool = False
+    answer_cache_threshold: float = 0.95  # Similarité cosinus minimale entre questions
+    answer_cache_max_entries: int = 10000
+    answer_cache_ttl_seconds: float = 86400.0
+    answer_cache_clear_on_ingest: bool = True  # False: seules les réponses aux chunks modifiés sont invalidées
+    
+    # Requêtes identiques simultanées: une seule exécution du pipeline
+    request_coalescing_enabled: bool = True
+    
+    # Query embedding cache
+    query_embedding_cache_enabled: bool = True
+    query_embedding_cache_max_bytes: int = 64 * 1024 * 1024
+    query_embedding_cache_ttl_seconds: float = 3600.0
+    query_embedding_cache_path: Optional[str] = None  # ex: ./cache/query_embeddings.sqlite (partagé entre workers)
+    
+    # Ingestion embedding cache (content-addressed, persistent)
+    ingest_embedding_cache_enabled: bool = True
+    ingest_embedding_cache_path: Optional[str] = None  # Par défaut: <chroma_persist_directory>/embedding_cache.sqlite
+    embedding_cost_per_1k_tokens: float = 0.00002  # text-embedding-3-small
+    ingest_manifest_path: Optional[str] = None  # Par défaut: <chroma_persist_directory>/ingest_manifest.sqlite
+    
+    # Parallel ingestion (chargement + chunking dans un pool de processus)
+    ingest_workers: int = 1  # Processus de parsing, 0 = un par CPU
+    ingest_in_process: bool = False  # True: parsing dans le processus de l'API (séquentiel si ingest_workers=1)
+    ingest_max_in_flight: Optional[int] = None  # Par défaut: 2 x ingest_workers
+    ingest_batch_size: int = 256  # Chunks par batch (embedding + écriture) en ingestion streaming
+    ingest_prefetch_batches: int = 2
+    
+    # Embedding requests (ingestion)
+    embedding_batch_max_tokens: int = 250_000  # Limite OpenAI: 300k tokens par requête
+    embedding_batch_max_inputs: int = 1000
+    embedding_max_concurrency: int = 4
+    embedding_max_retries: int = 6
+    embedding_tokens_per_minute: int = 0  # Quota TPM, 0 = pas de limite côté client
+    vector_store_write_batch_size: int = 5000
+    
+    # Background ingestion jobs
+    ingest_job_workers: int = 1  # Jobs exécutés en parallèle (pool dédié, séparé des requêtes)
+    ingest_job_nice: int = 10  # Priorité OS abaissée pour les threads de jobs et les processus de parsing (Linux)
+    ingest_job_journal_path: Optional[str] = None  # Journal JSONL des jobs, repris au redémarrage
+    ingest_upload_dir: Optional[str] = None  # Par défaut: répertoire temporaire du système
+    ingest_upload_max_bytes: int = 512 * 1024 * 1024  # 413 au-delà
+    ingest_upload_chunk_bytes: int = 1024 * 1024  # Taille des blocs lus/écrits en streaming
+    
     # Langfuse Configuration
     langfuse_secret_key: Optional[str] = None
     langfuse_public_key: Optional[str] = None
     langfuse_host: str = "http://localhost:3000"  # Par défaut: instance locale
     enable_langfuse: bool = True
+    # Export des scores Langfuse en arrière-plan (file bornée, envoi par lots)
+    langfuse_score_queue_size: int = 10000  # Au-delà, les scores sont abandonnés (comptés)
+    langfuse_score_batch_size: int = 50
+    langfuse_score_flush_seconds: float = 1.0
+    langfuse_score_max_retries: int = 3
     
     # MLflow Configuration
     mlflow_tracking_uri: str = "http://localhost:5000"
     mlflow_experiment_name: str = "rag_experiments"
+    mlflow_max_retries: int = 3  # Erreurs réseau, 429 et 5xx du serveur MLflow
+    # Télémétrie du hot path: agrégée en mémoire, envoyée à MLflow par lots (runs/log-batch)
+    telemetry_enabled: bool = True
+    telemetry_flush_seconds: float = 10.0
+    telemetry_disabled_stages: List[str] = []  # "retrieval", "generation", "pipeline", "ingestion", "indexing"
     
     # Monitoring
     enable_prometheus: bool = True
@@ -1,9 +1,15 @@
 """Prometheus metrics setup"""
 
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from prometheus_client import Counter, Histogram, Gauge
-from typing import Optional
+from typing import Iterator, Optional
 from src.config import settings
 
+# Trace of the request being served, attached as exemplar to latency observations
+current_trace_id: ContextVar[Optional[str]] = ContextVar("rag_trace_id", default=None)
+
 # Metrics
 query_counter = Counter(
     'rag_queries_total',
@@ -39,6 +45,104 @@ vector_store_size = Gauge(
     'Number of documents in vector store'
 )
 
+query_embedding_cache_requests = Counter(
+    'rag_query_embedding_cache_total',
+    'Query embedding cache lookups',
+    ['result']
+)
+
+query_embedding_cache_bytes = Gauge(
+    'rag_query_embedding_cache_bytes',
+    'Size of the in-memory query embedding cache in bytes'
+)
+
+rerank_duration = Histogram(
+    'rag_rerank_duration_seconds',
+    'Duration of the rerank stage in seconds',
+    ['scorer', 'outcome'],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+)
+
+answer_cache_requests = Counter(
+    'rag_answer_cache_total',
+    'Semantic answer cache lookups',
+    ['result']
+)
+
+answer_cache_entries = Gauge(
+    'rag_answer_cache_entries',
+    'Number of answers in the semantic answer cache'
+)
+
+coalesced_requests = Counter(
+    'rag_coalesced_requests_total',
+    'Requests that ran the pipeline (leader) or joined an identical in-flight run (follower)',
+    ['endpoint', 'role']
+)
+
+llm_in_flight = Gauge(
+    'rag_llm_in_flight',
+    'LLM calls running through the gateway'
+)
+
+llm_queue_depth = Gauge(
+    'rag_llm_queue_depth',
+    'Requests waiting for an LLM gateway slot'
+)
+
+llm_tokens_per_minute = Gauge(
+    'rag_llm_tokens_per_minute',
+    'LLM tokens used (or reserved) over the last minute'
+)
+
+llm_queue_wait = Histogram(
+    'rag_llm_queue_wait_seconds',
+    'Time spent waiting for an LLM gateway slot',
+    buckets=[0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0]
+)
+
+llm_shed = Counter(
+    'rag_llm_shed_total',
+    'Requests refused by the LLM gateway',
+    ['reason']
+)
+
+lexical_fallbacks = Counter(
+    'rag_lexical_fallbacks_total',
+    'Vector searches answered by BM25 because the embedding service was slow or down',
+    ['reason']
+)
+
+langfuse_scores = Counter(
+    'rag_langfuse_scores_total',
+    'Langfuse scores handled by the background exporter',
+    ['result']
+)
+
+langfuse_score_queue_depth = Gauge(
+    'rag_langfuse_score_queue_depth',
+    'Langfuse scores waiting to be exported'
+)
+
+stage_duration = Histogram(
+    'rag_stage_duration_seconds',
+    'Duration of one stage of a RAG query in seconds',
+    ['stage'],
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+)
+
+llm_tokens = Counter(
+    'rag_llm_tokens_total',
+    'LLM tokens used, per model',
+    ['model', 'kind']
+)
+
+telemetry_flushes = Counter(
+    'rag_telemetry_flushes_total',
+    'Telemetry flushes to MLflow (failed intervals are dropped)',
+    ['result']
+)
+
 
 def setup_prometheus_metrics():
     """Setup Prometheus metrics"""
@@ -53,9 +157,14 @@ def record_query(status: str = "success"):
     query_counter.labels(status=status).inc()
 
 
-def record_query_duration(duration: float):
+def _exemplar(trace_id: Optional[str] = None) -> Optional[dict]:
+    trace_id = trace_id or current_trace_id.get()
+    return {"trace_id": trace_id} if trace_id else None
+
+
+def record_query_duration(duration: float, trace_id: Optional[str] = None):
     """Record query duration"""
-    query_duration.observe(duration)
+    query_duration.observe(duration, exemplar=_exemplar(trace_id))
 
 
 def record_retrieval_docs(count: int):
@@ -78,4 +187,100 @@ def set_vector_store_size(size: int):
     vector_store_size.set(size)
 
 
+def record_query_embedding_cache(result: str):
+    """Record a query embedding cache lookup ("hit" or "miss")"""
+    query_embedding_cache_requests.labels(result=result).inc()
+
+
+def set_query_embedding_cache_bytes(size: int):
+    """Set query embedding cache size in bytes"""
+    query_embedding_cache_bytes.set(size)
+
+
+def record_rerank(scorer: str, outcome: str, duration: float):
+    """Record a rerank stage run ("reranked", "timeout" or "error")"""
+    rerank_duration.labels(scorer=scorer, outcome=outcome).observe(duration)
+
+
+def record_answer_cache(result: str):
+    """Record an answer cache lookup ("hit", "miss", "stale" or "bypass")"""
+    answer_cache_requests.labels(result=result).inc()
+
+
+def set_answer_cache_entries(count: int):
+    """Set the number of cached answers"""
+    answer_cache_entries.set(count)
+
+
+def record_coalesced_request(endpoint: str, role: str):
+    """Record a request as "leader" (runs the pipeline) or "follower" (shares the result)"""
+    coalesced_requests.labels(endpoint=endpoint, role=role).inc()
+
+
+def set_llm_gateway_state(in_flight: int, queued: int, tokens_last_minute: int):
+    """Export the LLM gateway state (active queries = running + waiting)"""
+    llm_in_flight.set(in_flight)
+    llm_queue_depth.set(queued)
+    llm_tokens_per_minute.set(tokens_last_minute)
+    active_queries.set(in_flight + queued)
+
+
+def record_llm_queue_wait(seconds: float):
+    """Record the time a request waited for an LLM slot"""
+    llm_queue_wait.observe(seconds)
+
+
+def record_llm_shed(reason: str):
+    """Record a request shed by the LLM gateway ("queue_full", "deadline", "tpm" or "timeout")"""
+    llm_shed.labels(reason=reason).inc()
+
+
+def record_lexical_fallback(reason: str):
+    """Record a switch to BM25-only results ("timeout" or "unavailable")"""
+    lexical_fallbacks.labels(reason=reason).inc()
+
+
+def record_langfuse_scores(result: str, count: int):
+    """Record exported scores ("exported", "failed" after retries, "dropped" on a full queue)"""
+    langfuse_scores.labels(result=result).inc(count)
+
+
+def set_langfuse_score_queue_depth(depth: int):
+    """Set the number of scores waiting for export"""
+    langfuse_score_queue_depth.set(depth)
+
+
+def record_stage_duration(stage: str, duration: float, trace_id: Optional[str] = None):
+    """Record the duration of a query stage, with the current trace as exemplar"""
+    stage_duration.labels(stage=stage).observe(duration, exemplar=_exemplar(trace_id))
+
+
+@contextmanager
+def time_stage(stage: str, trace_id: Optional[str] = None) -> Iterator[None]:
+    """Time the enclosed block as one stage (failed runs included)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage_duration(stage, time.perf_counter() - start, trace_id)
+
+
+@contextmanager
+def traced(trace_id: Optional[str]) -> Iterator[None]:
+    """Make trace_id the exemplar of the stages timed in the enclosed block"""
+    token = current_trace_id.set(trace_id)
+    try:
+        yield
+    finally:
+        current_trace_id.reset(token)
+
+
+def record_llm_tokens(model: str, prompt_tokens: int, completion_tokens: int):
+    """Record the prompt and completion tokens of one LLM call"""
+    llm_tokens.labels(model=model, kind="prompt").inc(prompt_tokens)
+    llm_tokens.labels(model=model, kind="completion").inc(completion_tokens)
+
 
+def record_telemetry_flush(result: str):
+    """Record a telemetry flush to MLflow ("ok" or "failed")"""
+    telemetry_flushes.labels(result=result).inc()
@@ -0,0 +1,131 @@
+"""Non-blocking telemetry sink for MLflow
+
+The hot path (retrieval, generation, ingestion...) only updates an
+in-memory aggregate per metric (count / mean / max). A background thread
+swaps the aggregates every flush_interval seconds and sends them to one
+MLflow run per process with runs/log-batch over a pooled HTTP session.
+MLflow being slow or down costs the requests nothing: the interval is
+dropped and counted.
+"""
+
+import math
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.config import settings
+from src.monitoring.prometheus import record_telemetry_flush
+
+
+class TelemetrySink:
+    """Per-stage metric aggregation, flushed in batches by a worker thread"""
+
+    def __init__(
+        self,
+        client_factory: Optional[Callable[[], object]] = None,
+        flush_interval: Optional[float] = None,
+        enabled: Optional[bool] = None,
+        disabled_stages: Optional[Iterable[str]] = None
+    ):
+        self.client_factory = client_factory or _default_client
+        self.flush_interval = flush_interval or settings.telemetry_flush_seconds
+        self.enabled = settings.telemetry_enabled if enabled is None else enabled
+        self.disabled_stages = frozenset(
+            settings.telemetry_disabled_stages if disabled_stages is None else disabled_stages
+        )
+
+        self._lock = threading.Lock()
+        self._aggregates: Dict[str, List[float]] = {}  # name -> [count, sum, max]
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._flush_lock = threading.Lock()
+        self._client = None
+        self._run_id: Optional[str] = None
+        self._step = 0
+        self._failing = False
+
+    def enabled_for(self, stage: str) -> bool:
+        return self.enabled and stage not in self.disabled_stages
+
+    def record(self, stage: str, key: str, value: float):
+        """Add one observation of stage.key (O(1), never blocks on I/O)"""
+        if not self.enabled or stage in self.disabled_stages:
+            return
+        name = f"{stage}.{key}"
+        with self._lock:
+            aggregate = self._aggregates.get(name)
+            if aggregate is None:
+                self._aggregates[name] = [1, value, value]
+            else:
+                aggregate[0] += 1
+                aggregate[1] += value
+                if value > aggregate[2]:
+                    aggregate[2] = value
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="telemetry", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _drain(self) -> Dict[str, List[float]]:
+        with self._lock:
+            aggregates, self._aggregates = self._aggregates, {}
+        return aggregates
+
+    def _batch(self, aggregates: Dict[str, List[float]]) -> List[Dict]:
+        timestamp = int(time.time() * 1000)
+        metrics = []
+        for name, (count, total, maximum) in sorted(aggregates.items()):
+            for suffix, value in (("count", count), ("mean", total / count), ("max", maximum)):
+                if math.isfinite(value):
+                    metrics.append({"key": f"{name}.{suffix}", "value": float(value), "timestamp": timestamp, "step": self._step})
+        return metrics
+
+    def flush(self) -> bool:
+        """Send the current aggregates; False if they had to be dropped"""
+        with self._flush_lock:
+            aggregates = self._drain()
+            if not aggregates:
+                return True
+            try:
+                if self._client is None:
+                    self._client = self.client_factory()
+                if self._run_id is None:
+                    self._run_id = self._client.create_run(
+                        run_name=f"telemetry-{socket.gethostname()}-{os.getpid()}",
+                        tags={"type": "telemetry"}
+                    )
+                self._client.log_batch(self._run_id, metrics=self._batch(aggregates))
+            except Exception as e:
+                # Warn once per outage, not every interval
+                if not self._failing:
+                    print(f"⚠️  Warning: Could not flush telemetry to MLflow (dropping, will retry): {e}")
+                self._failing = True
+                record_telemetry_flush("failed")
+                return False
+            self._step += 1
+            if self._failing:
+                print("✅ Telemetry flush to MLflow recovered")
+            self._failing = False
+            record_telemetry_flush("ok")
+            return True
+
+    def shutdown(self):
+        """Stop the worker and send what is left"""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join(timeout=self.flush_interval)
+        self.flush()
+
+
+def _default_client():
+    from src.utils.mlflow_rest import MLflowRESTClient
+    return MLflowRESTClient()
+
+
+# Process-wide sink; its worker starts with the first record
+telemetry = TelemetrySink()
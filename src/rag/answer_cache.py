@@ -0,0 +1,212 @@
+"""Semantic answer cache: serve a previous answer to a paraphrased question"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.monitoring.prometheus import record_answer_cache, set_answer_cache_entries
+
+
+def chunk_fingerprint(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def cache_scope(**params: Any) -> str:
+    """Answers are only shared between requests with the same scope (filter, options, model...)"""
+    return hashlib.blake2b(
+        json.dumps(params, sort_keys=True, default=str).encode("utf-8"), digest_size=8
+    ).hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    scope: str
+    chunk_fingerprints: Dict[str, str]  # chunk id -> fingerprint of its text
+    result: Dict[str, Any]
+    created_at: float = field(default_factory=time.time)
+
+
+class SemanticAnswerCache:
+    """Bounded LRU cache of answers, looked up by question embedding similarity
+
+    Question vectors live in one float32 matrix (grown by doubling up to
+    max_entries rows): a lookup is a single matrix-vector product over the
+    cached questions of the same scope. A hit is only served if the chunks
+    the answer was generated from still exist unchanged (fetch_chunks reads
+    them back by id), so writes by other workers to a shared index are
+    caught too.
+    """
+
+    def __init__(
+        self,
+        fetch_chunks: Callable[[Sequence[str]], List[Document]],
+        max_entries: int = 10000,
+        threshold: float = 0.95,
+        ttl_seconds: Optional[float] = 86400.0,
+        clear_on_write: bool = True
+    ):
+        self.fetch_chunks = fetch_chunks
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.clear_on_write = clear_on_write
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # (capacity, dim), row = slot
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()  # LRU order
+        self._by_chunk: Dict[str, Set[int]] = {}
+        self._free: List[int] = []
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _find(self, vector: np.ndarray, scope: str) -> Optional[int]:
+        slots = [slot for slot, entry in self._entries.items() if entry.scope == scope]
+        if not slots or self._vectors is None or self._vectors.shape[1] != len(vector):
+            return None
+        similarities = self._vectors[slots] @ vector
+        best = int(np.argmax(similarities))
+        return slots[best] if similarities[best] >= self.threshold else None
+
+    def get(self, vector: Sequence[float], scope: str) -> Optional[Dict[str, Any]]:
+        """Cached result for a similar question in the same scope, or None"""
+        query = self._normalize(vector)
+        with self._lock:
+            slot = self._find(query, scope)
+            entry = self._entries.get(slot) if slot is not None else None
+            if entry is not None and self.ttl_seconds and time.time() - entry.created_at > self.ttl_seconds:
+                self._remove(slot)
+                entry = None
+        if entry is None:
+            self._record("miss")
+            return None
+
+        # Outside the lock: one read of the source chunks by id
+        current = {
+            doc.id: chunk_fingerprint(doc.page_content)
+            for doc in self.fetch_chunks(list(entry.chunk_fingerprints))
+        }
+        if current != entry.chunk_fingerprints:
+            with self._lock:
+                if self._entries.get(slot) is entry:
+                    self._remove(slot)
+            self._record("stale")
+            return None
+
+        with self._lock:
+            if self._entries.get(slot) is entry:
+                self._entries.move_to_end(slot)
+        self._record("hit")
+        return copy.deepcopy(entry.result)
+
+    def put(self, vector: Sequence[float], scope: str, question: str, documents: List[Document], result: Dict[str, Any]):
+        """Cache an answer with the chunks it was generated from (all need an id)"""
+        if not documents or any(not doc.id for doc in documents):
+            return
+        query = self._normalize(vector)
+        entry = CachedAnswer(
+            question=question,
+            scope=scope,
+            chunk_fingerprints={doc.id: chunk_fingerprint(doc.page_content) for doc in documents},
+            result=copy.deepcopy(result)
+        )
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(query):
+                self._vectors = np.zeros((min(self.max_entries, 256), len(query)), dtype=np.float32)
+                self._clear()
+            existing = self._find(query, scope)
+            if existing is not None:
+                self._remove(existing)
+            slot = self._allocate()
+            self._vectors[slot] = query
+            self._entries[slot] = entry
+            for chunk_id in entry.chunk_fingerprints:
+                self._by_chunk.setdefault(chunk_id, set()).add(slot)
+        set_answer_cache_entries(len(self._entries))
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        capacity = len(self._vectors)
+        if capacity < self.max_entries:
+            grown = np.zeros((min(self.max_entries, 2 * capacity), self._vectors.shape[1]), dtype=np.float32)
+            grown[:capacity] = self._vectors
+            self._vectors = grown
+            self._free = list(range(len(grown) - 1, capacity - 1, -1))
+        else:
+            self._remove(next(iter(self._entries)))  # least recently used
+        return self._free.pop()
+
+    def invalidate_chunks(self, chunk_ids: Sequence[str]) -> int:
+        """Drop the answers generated from any of these chunks"""
+        with self._lock:
+            slots = set()
+            for chunk_id in chunk_ids:
+                slots |= self._by_chunk.get(chunk_id, set())
+            for slot in slots:
+                self._remove(slot)
+        set_answer_cache_entries(len(self._entries))
+        return len(slots)
+
+    def on_index_write(self, chunk_ids: Sequence[str]):
+        """Index write listener: new content may change any answer (clear_on_write),
+        replaced or deleted chunks invalidate the answers built on them"""
+        if self.clear_on_write:
+            self.clear()
+        else:
+            self.invalidate_chunks(chunk_ids)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+        set_answer_cache_entries(0)
+
+    def _clear(self):
+        self._entries.clear()
+        self._by_chunk.clear()
+        self._free = list(range(len(self._vectors) - 1, -1, -1)) if self._vectors is not None else []
+
+    def _remove(self, slot: int):
+        entry = self._entries.pop(slot, None)
+        if entry is None:
+            return
+        for chunk_id in entry.chunk_fingerprints:
+            slots = self._by_chunk.get(chunk_id)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self._by_chunk[chunk_id]
+        self._free.append(slot)
+
+    def record_bypass(self):
+        """Request that skipped the cache (not counted in the hit ratio)"""
+        record_answer_cache("bypass")
+
+    def _record(self, result: str):
+        if result == "hit":
+            self.hits += 1
+        else:
+            self.misses += 1
+        record_answer_cache(result)
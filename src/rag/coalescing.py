@@ -0,0 +1,125 @@
+"""Single-flight coalescing of identical in-flight requests
+
+The first request for a key (the leader) runs the work; identical requests
+arriving while it is in flight (followers) wait for the same result instead
+of starting their own retrieval + generation. Streams are broadcast: a
+follower that joins mid-stream first replays the events already sent, then
+follows live.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from src.monitoring.prometheus import record_coalesced_request
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+def coalescing_key(
+    question: str,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    **params: Any
+) -> str:
+    """Same normalized question, same chat history, same parameters -> same key"""
+    payload = json.dumps(
+        {"question": normalize_question(question), "chat_history": chat_history or [], "params": params},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _Broadcast:
+    """Events of one stream, kept until it ends so late subscribers can replay them"""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        # The event loop only keeps weak references to tasks: the broadcast owns its producer
+        self.producer: Optional[asyncio.Task] = None
+
+    def publish(self, event: Any):
+        self.events.append(event)
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None):
+        self.done, self.error = True, error
+        self._notify()
+
+    def _notify(self):
+        # Wake everyone up, then re-arm for the next event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class RequestCoalescer:
+    """In-flight registry of shared runs (results) and shared streams (broadcasts)
+
+    The shared work runs in its own task: a client that disconnects only
+    stops waiting, the run goes on for the others. Keys are dropped as soon
+    as the run ends, nothing is cached here.
+    """
+
+    def __init__(self, name: str = "query"):
+        self.name = name
+        self._runs: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+
+    def in_flight(self) -> int:
+        return len(self._runs) + len(self._streams)
+
+    async def run(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of work(), shared with every identical request already in flight"""
+        task = self._runs.get(key)
+        if task is not None:
+            record_coalesced_request(self.name, "follower")
+        else:
+            record_coalesced_request(self.name, "leader")
+            task = asyncio.ensure_future(work())
+            self._runs[key] = task
+            task.add_done_callback(lambda _: self._runs.pop(key, None))
+        # shield: cancelling this waiter must not cancel the shared run
+        return await asyncio.shield(task)
+
+    async def stream(self, key: str, work: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Events of work(), broadcast to every identical stream in flight"""
+        broadcast = self._streams.get(key)
+        if broadcast is not None:
+            record_coalesced_request(f"{self.name}_stream", "follower")
+        else:
+            record_coalesced_request(f"{self.name}_stream", "leader")
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.producer = asyncio.ensure_future(self._produce(key, broadcast, work))
+        async for event in broadcast.subscribe():
+            yield event
+
+    async def _produce(self, key: str, broadcast: _Broadcast, work: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for event in work():
+                broadcast.publish(event)
+        except Exception as e:
+            broadcast.close(e)
+        else:
+            broadcast.close()
+        finally:
+            self._streams.pop(key, None)
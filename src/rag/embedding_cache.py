@@ -0,0 +1,465 @@
+"""Embedding caches sitting in front of the embedding API"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+
+from src.monitoring.prometheus import record_query_embedding_cache, set_query_embedding_cache_bytes
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Approximate per-entry bookkeeping cost (OrderedDict slot, tuple, floats)
+_ENTRY_OVERHEAD_BYTES = 120
+
+# SQLite limits the number of bound parameters per statement
+_SQLITE_BATCH = 500
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model_name: str):
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Encoding files are downloaded on first use and may be unreachable
+        print(f"⚠️  Warning: Could not load tiktoken encoding: {e}")
+        return None
+
+
+def count_tokens(text: str, model_name: str) -> int:
+    """Count tokens as billed by the embedding API (≈ 4 chars/token without tiktoken)"""
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def content_hash(text: str, model_name: str) -> str:
+    """Content address of a chunk embedding: sha256 of model name + chunk text"""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a query so that trivially different spellings share a cache key"""
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.lower().split())
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU + TTL cache of query embeddings
+
+    Vectors are stored packed as float32 and the cache is bounded by its
+    size in bytes. With persist_path, entries are also written to a SQLite
+    file (WAL mode) so several worker processes share their embeddings;
+    expired rows are deleted on open and then every prune_interval seconds
+    (by the writing thread), so the file holds at most one TTL of queries.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 3600.0,
+        persist_path: Optional[str] = None,
+        prune_interval: float = 300.0
+    ):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.prune_interval = prune_interval
+
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # The connection is shared by request threads: one statement at a time
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._next_prune = 0.0
+        if persist_path:
+            self._db = self._open_db(persist_path)
+            self._maybe_prune()
+
+    def _open_db(self, path: str) -> Optional[sqlite3.Connection]:
+        """Open (and create) the shared on-disk cache"""
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            db.commit()
+            return db
+        except sqlite3.Error as e:
+            print(f"⚠️  Warning: Could not open query embedding cache {path}: {e}")
+            return None
+
+    @property
+    def persistent(self) -> bool:
+        """Lookups and writes may block on the SQLite file"""
+        return self._db is not None
+
+    def _key(self, text: str) -> str:
+        return content_hash(normalize_query(text), self.model_name)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Return the cached embedding for text, or None"""
+        key = self._key(text)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                blob, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    record_query_embedding_cache("hit")
+                    return _unpack(blob)
+                self._remove(key)
+
+        entry = self._load(key, now)
+        if entry is not None:
+            with self._lock:
+                self._insert(key, *entry)
+                self.hits += 1
+            record_query_embedding_cache("hit")
+            return _unpack(entry[0])
+
+        with self._lock:
+            self.misses += 1
+        record_query_embedding_cache("miss")
+        return None
+
+    def put(self, text: str, vector: List[float]):
+        """Cache the embedding of text"""
+        key = self._key(text)
+        blob = _pack(vector)
+        created_at = time.time()
+
+        with self._lock:
+            self._insert(key, blob, created_at)
+        self._store(key, blob, created_at)
+
+    def clear(self):
+        """Drop all in-memory entries"""
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+        set_query_embedding_cache_bytes(0)
+
+    def _insert(self, key: str, blob: bytes, created_at: float):
+        if key in self._entries:
+            self._remove(key)
+        entry_bytes = len(blob) + len(key) + _ENTRY_OVERHEAD_BYTES
+        if entry_bytes > self.max_bytes:
+            return
+        self._entries[key] = (blob, created_at)
+        self._size_bytes += entry_bytes
+        # Evict least recently used entries until we fit in the byte budget
+        while self._size_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+        set_query_embedding_cache_bytes(self._size_bytes)
+
+    def _remove(self, key: str):
+        blob, _ = self._entries.pop(key)
+        self._size_bytes -= len(blob) + len(key) + _ENTRY_OVERHEAD_BYTES
+
+    def _load(self, key: str, now: float) -> Optional[Tuple[bytes, float]]:
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT vector, created_at FROM query_embeddings WHERE key = ? AND created_at >= ?",
+                    (key, now - self.ttl_seconds)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️  Warning: Query embedding cache read failed: {e}")
+            return None
+        return (bytes(row[0]), row[1]) if row else None
+
+    def _store(self, key: str, blob: bytes, created_at: float):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                    (key, blob, created_at)
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️  Warning: Query embedding cache write failed: {e}")
+        self._maybe_prune()
+
+    def _maybe_prune(self):
+        now = time.monotonic()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + self.prune_interval
+        try:
+            self.prune_expired()
+        except sqlite3.Error as e:
+            print(f"⚠️  Warning: Query embedding cache pruning failed: {e}")
+
+    def prune_expired(self) -> int:
+        """Delete expired entries from the on-disk cache"""
+        if self._db is None:
+            return 0
+        with self._db_lock:
+            cursor = self._db.execute(
+                "DELETE FROM query_embeddings WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+
+@dataclass
+class EmbeddingStats:
+    """Embedding cache statistics for one ingestion"""
+
+    chunks: int = 0
+    cache_hits: int = 0
+    tokens_embedded: int = 0
+    tokens_saved: int = 0
+    cost_per_1k_tokens: float = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.cache_hits / self.chunks if self.chunks else 0.0
+
+    @property
+    def cost_saved(self) -> float:
+        return self.tokens_saved / 1000 * self.cost_per_1k_tokens
+
+
+_current_stats: ContextVar[Optional[EmbeddingStats]] = ContextVar("embedding_stats", default=None)
+# Embedding requests of one ingestion may run concurrently
+_stats_lock = threading.Lock()
+
+
+@contextmanager
+def collect_embedding_stats(cost_per_1k_tokens: float = 0.0) -> Iterator[EmbeddingStats]:
+    """Collect document embedding cache statistics for the enclosed calls"""
+    stats = EmbeddingStats(cost_per_1k_tokens=cost_per_1k_tokens)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class DocumentEmbeddingStore:
+    """Persistent content-addressed store of chunk embeddings (SQLite)
+
+    Keys are sha256(model name + chunk text), so re-ingesting a document only
+    pays for the chunks whose text changed.
+    """
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """Open the store on first use"""
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS document_embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, tokens INTEGER NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Tuple[List[float], int]]:
+        """Return {key: (vector, tokens)} for the keys present in the store"""
+        found: Dict[str, Tuple[List[float], int]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), _SQLITE_BATCH):
+                batch = unique_keys[start:start + _SQLITE_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT key, vector, tokens FROM document_embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob, tokens in rows:
+                    found[key] = (_unpack(blob), tokens)
+        return found
+
+    def put_many(self, items: Sequence[Tuple[str, List[float], int]]):
+        """Store (key, vector, tokens) entries"""
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO document_embeddings (key, vector, tokens) VALUES (?, ?, ?)",
+                [(key, _pack(vector), tokens) for key, vector, tokens in items]
+            )
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM document_embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper answering from the query cache and the document store"""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        document_store: Optional[DocumentEmbeddingStore] = None
+    ):
+        self.embeddings = embeddings
+        self.query_cache = query_cache
+        self.document_store = document_store
+
+    def _lookup_documents(self, texts: List[str]):
+        """Split texts into cached vectors and the unique texts still to embed"""
+        model_name = self.document_store.model_name
+        keys = [content_hash(text, model_name) for text in texts]
+        cached = self.document_store.get_many(keys)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        return keys, cached, missing
+
+    def _merge_documents(self, keys, cached, missing, new_vectors) -> List[List[float]]:
+        model_name = self.document_store.model_name
+        new_entries = []
+        for (key, text), vector in zip(missing.items(), new_vectors):
+            tokens = count_tokens(text, model_name)
+            cached[key] = (vector, tokens)
+            new_entries.append((key, vector, tokens))
+        if new_entries:
+            self.document_store.put_many(new_entries)
+
+        stats = _current_stats.get()
+        if stats is not None:
+            with _stats_lock:
+                self._update_stats(stats, keys, cached, missing)
+        return [cached[key][0] for key in keys]
+
+    @staticmethod
+    def _update_stats(stats: EmbeddingStats, keys, cached, missing):
+        stats.chunks += len(keys)
+        missing = dict(missing)
+        for key in keys:
+            tokens = cached[key][1]
+            if key in missing:
+                stats.tokens_embedded += tokens
+                # Duplicates within the batch are only embedded once
+                missing.pop(key)
+            else:
+                stats.cache_hits += 1
+                stats.tokens_saved += tokens
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.document_store is None:
+            return self.embeddings.embed_documents(texts)
+        keys, cached, missing = self._lookup_documents(texts)
+        new_vectors = self.embeddings.embed_documents(list(missing.values())) if missing else []
+        return self._merge_documents(keys, cached, missing, new_vectors)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.document_store is None:
+            return await self.embeddings.aembed_documents(texts)
+        keys, cached, missing = self._lookup_documents(texts)
+        new_vectors = await self.embeddings.aembed_documents(list(missing.values())) if missing else []
+        return self._merge_documents(keys, cached, missing, new_vectors)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries: cache hits are served, misses go in one request"""
+        vectors: List[Optional[List[float]]] = [
+            self.query_cache.get(text) if self.query_cache is not None else None
+            for text in texts
+        ]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            embedded = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            for text, vector in embedded.items():
+                if self.query_cache is not None:
+                    self.query_cache.put(text, vector)
+            vectors = [vector if vector is not None else embedded[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_cache is None:
+            return self.embeddings.embed_query(text)
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.query_cache.put(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.query_cache is None:
+            return await self.embeddings.aembed_query(text)
+        # The SQLite lookup / write must not block the event loop
+        persistent = self.query_cache.persistent
+        if persistent:
+            vector = await run_in_executor(None, self.query_cache.get, text)
+        else:
+            vector = self.query_cache.get(text)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            if persistent:
+                await run_in_executor(None, self.query_cache.put, text, vector)
+            else:
+                self.query_cache.put(text, vector)
+        return vector
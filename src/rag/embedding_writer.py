@@ -0,0 +1,156 @@
+"""Token-budget-aware batched embedding writer"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from .embedding_cache import count_tokens
+
+try:
+    import openai
+    RETRYABLE_ERRORS = (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+except (ImportError, AttributeError):
+    RETRYABLE_ERRORS = ()
+
+
+def _is_retryable(error: BaseException) -> bool:
+    """429s, timeouts and 5xx are retried; anything else fails the batch"""
+    if RETRYABLE_ERRORS and isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return getattr(error, "status_code", None) == 429
+
+
+def pack_by_tokens(token_counts: Sequence[int], max_tokens: int, max_inputs: int) -> List[List[int]]:
+    """Greedily pack items (by index, in order) into requests under both limits"""
+    requests: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index, tokens in enumerate(token_counts):
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_inputs):
+            requests.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        requests.append(current)
+    return requests
+
+
+class TokenRateLimiter:
+    """Sliding one-minute window of embedded tokens (tokens-per-minute quota)"""
+
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self._window: "deque[tuple[float, int]]" = deque()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        """Block until `tokens` fit in the current window"""
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._window and now - self._window[0][0] >= 60:
+                    self._used -= self._window.popleft()[1]
+                if self._used + tokens <= self.tokens_per_minute:
+                    self._window.append((now, tokens))
+                    self._used += tokens
+                    return
+                wait = 60 - (now - self._window[0][0])
+            time.sleep(max(wait, 0.05))
+
+
+class BatchedEmbeddingWriter:
+    """Embed chunks in token-packed requests, several at a time, then bulk upsert
+
+    Requests are packed by tiktoken count so each one stays under the
+    embedding API's per-request limits, up to max_concurrency requests are in
+    flight, and 429/5xx/timeouts are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_tokens_per_request: int = 250_000,
+        max_inputs_per_request: int = 1000,
+        max_concurrency: int = 4,
+        max_retries: int = 6,
+        write_batch_size: int = 5000,
+        tokens_per_minute: int = 0
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_inputs_per_request = max_inputs_per_request
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.write_batch_size = write_batch_size
+        self.rate_limiter = TokenRateLimiter(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    def _embed_request(self, texts: List[str], tokens: int) -> List[List[float]]:
+        """One embedding request, retried on rate limits / transient errors"""
+        retrying = Retrying(
+            retry=retry_if_exception(_is_retryable),
+            wait=wait_random_exponential(multiplier=1, max=60),
+            stop=stop_after_attempt(self.max_retries),
+            reraise=True
+        )
+        for attempt in retrying:
+            with attempt:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire(tokens)
+                return self.embeddings.embed_documents(texts)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, returning vectors in input order"""
+        if not texts:
+            return []
+        token_counts = [count_tokens(text, self.model_name) for text in texts]
+        requests = pack_by_tokens(token_counts, self.max_tokens_per_request, self.max_inputs_per_request)
+
+        def run(indices: List[int]) -> List[List[float]]:
+            return self._embed_request([texts[i] for i in indices], sum(token_counts[i] for i in indices))
+
+        if len(requests) == 1 or self.max_concurrency == 1:
+            results = [run(indices) for indices in requests]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(requests))) as pool:
+                # Each request runs in a copy of the caller's context (embedding stats)
+                futures = [
+                    pool.submit(contextvars.copy_context().run, run, indices)
+                    for indices in requests
+                ]
+                results = [future.result() for future in futures]
+
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for indices, request_vectors in zip(requests, results):
+            for index, vector in zip(indices, request_vectors):
+                vectors[index] = vector
+        return vectors
+
+    def write(self, retrieval_system, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """Embed documents and upsert them in large bulk writes"""
+        vectors = self.embed([doc.page_content for doc in documents])
+        written: List[str] = []
+        for start in range(0, len(documents), self.write_batch_size):
+            end = start + self.write_batch_size
+            written.extend(retrieval_system.add_embedded_documents(
+                documents[start:end],
+                vectors[start:end],
+                ids=ids[start:end] if ids is not None else None
+            ))
+        return written
@@ -1,15 +1,22 @@
 """RAG Generation with LangChain"""
 
-from typing import List, Optional, Dict, Any
+import time
+import uuid
+from typing import List, Optional, Dict, Any, Callable, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import HumanMessage, AIMessage
 # Chains are now handled via LCEL (LangChain Expression Language)
+# LANGFUSE_TRACE_CONTEXT: v3 handlers take the trace id (trace_context) and are
+# cheap to create per request; v2 handlers are shared and use the root run_id
 try:
     from langfuse.langchain import CallbackHandler as LangfuseCallbackHandler
     LANGFUSE_AVAILABLE = True
+    LANGFUSE_TRACE_CONTEXT = True
 except ImportError:
+    LANGFUSE_TRACE_CONTEXT = False
     try:
         from langfuse.callback import CallbackHandler as LangfuseCallbackHandler
         LANGFUSE_AVAILABLE = True
@@ -21,18 +28,17 @@ except ImportError:
             LangfuseCallbackHandler = None
             LANGFUSE_AVAILABLE = False
 from src.config import settings
+from .embedding_cache import count_tokens
+from .llm_gateway import LLMCall, LLMGateway
+from src.monitoring.prometheus import record_llm_tokens, record_stage_duration, time_stage, traced
+from src.monitoring.telemetry import telemetry
 
-try:
-    import mlflow
-    MLFLOW_AVAILABLE = True
-except ImportError:
-    MLFLOW_AVAILABLE = False
-    class MockMLflow:
-        @staticmethod
-        def log_param(*args, **kwargs): pass
-        @staticmethod
-        def log_metric(*args, **kwargs): pass
-    mlflow = MockMLflow()
+
+def new_trace_id() -> str:
+    """Trace id generated up front for one request, in the format Langfuse will report"""
+    trace_id = uuid.uuid4()
+    # v3: W3C trace id (32 hex chars); v2: the root run id as a string
+    return trace_id.hex if LANGFUSE_TRACE_CONTEXT else str(trace_id)
 
 
 class RAGGenerator:
@@ -43,19 +49,26 @@ class RAGGenerator:
         llm_model: Optional[str] = None,
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
-        use_langfuse: bool = True
+        use_langfuse: bool = True,
+        llm: Optional[BaseChatModel] = None,
+        gateway: Optional[LLMGateway] = None
     ):
         self.llm_model = llm_model or settings.llm_model
         self.temperature = temperature or settings.temperature
         self.max_tokens = max_tokens or settings.max_tokens
         
         # Initialize LLM
-        self.llm = ChatOpenAI(
-            model=self.llm_model,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            openai_api_key=settings.openai_api_key
-        )
+        if llm is None:
+            llm = ChatOpenAI(
+                model=self.llm_model,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                openai_api_key=settings.openai_api_key,
+                stream_usage=True  # usage_metadata on streamed answers too (TPM accounting)
+            )
+        self.llm = llm
+        # Every LLM call waits for a gateway slot (concurrency, queue, TPM budget)
+        self.gateway = gateway or LLMGateway()
         
         # Langfuse callback handler
         self.langfuse_handler = None
@@ -107,14 +120,13 @@ Provide a detailed and accurate answer:"""),
             MessagesPlaceholder(variable_name="chat_history"),
         ])
     
-    def generate(
+    def _prepare_inputs(
         self,
         question: str,
         context_documents: List[Document],
         chat_history: Optional[List] = None
     ) -> Dict[str, Any]:
-        """Generate answer from question and context"""
-        
+        """Build the prompt inputs from question, context and chat history"""
         # Format context
         context = "\n\n".join([doc.page_content for doc in context_documents])
         
@@ -127,93 +139,156 @@ Provide a detailed and accurate answer:"""),
                 elif msg["role"] == "assistant":
                     formatted_history.append(AIMessage(content=msg["content"]))
         
-        # Create chain
-        chain = self.prompt_template | self.llm
-        
-        # Prepare callbacks (Langfuse handler)
-        callbacks = []
-        if self.langfuse_handler:
-            callbacks.append(self.langfuse_handler)
+        return {
+            "context": context,
+            "question": question,
+            "chat_history": formatted_history
+        }
+    
+    def _estimate_tokens(self, inputs: Dict[str, Any]) -> int:
+        """Tokens reserved before the call: prompt estimate + max_tokens of answer"""
+        prompt = inputs["context"] + inputs["question"] + "".join(m.content for m in inputs["chat_history"])
+        return count_tokens(prompt, self.llm_model) + self.max_tokens
+    
+    def _prompt(
+        self,
+        question: str,
+        context_documents: List[Document],
+        chat_history: Optional[List]
+    ) -> Tuple[Dict[str, Any], int]:
+        """(prompt inputs, tokens to reserve), timed as the prompt stage"""
+        with time_stage("prompt"):
+            inputs = self._prepare_inputs(question, context_documents, chat_history)
+            return inputs, self._estimate_tokens(inputs)
+    
+    def _token_usage(
+        self, inputs: Dict[str, Any], answer: str, usage: Optional[Dict[str, Any]]
+    ) -> Tuple[int, int]:
+        """(prompt, completion) tokens reported by the provider, or estimated when usage is missing"""
+        if usage and usage.get("total_tokens"):
+            return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        return self._estimate_tokens(inputs) - self.max_tokens, count_tokens(answer, self.llm_model)
+    
+    def _settle(self, call: LLMCall, inputs: Dict[str, Any], answer: str, usage: Optional[Dict[str, Any]]):
+        """Bill the call to the gateway and count its tokens per model"""
+        prompt_tokens, completion_tokens = self._token_usage(inputs, answer, usage)
+        call.record(prompt_tokens + completion_tokens)
+        record_llm_tokens(self.llm_model, prompt_tokens, completion_tokens)
+    
+    @property
+    def tracing_enabled(self) -> bool:
+        return self.langfuse_handler is not None
+    
+    def exemplar_trace_id(self, trace_id: Optional[str]) -> Optional[str]:
+        """trace_id as latency exemplar, only when the trace is sent to Langfuse"""
+        return trace_id if self.tracing_enabled else None
+    
+    def _invoke_config(self, trace_id: Optional[str]) -> Dict[str, Any]:
+        """Runnable config tracing this call under trace_id (no shared handler state)"""
+        if not self.langfuse_handler or not trace_id:
+            return {}
+        if LANGFUSE_TRACE_CONTEXT:
+            handler = LangfuseCallbackHandler(
+                public_key=settings.langfuse_public_key,
+                trace_context={"trace_id": trace_id}
+            )
+        else:
+            handler = self.langfuse_handler
+        # The root run id is the trace id for handlers without trace_context
+        return {"callbacks": [handler], "run_id": uuid.UUID(trace_id)}
+    
+    def _build_result(
+        self,
+        question: str,
+        answer: str,
+        context_documents: List[Document],
+        trace_id: Optional[str]
+    ) -> Dict[str, Any]:
+        """Log the generation and build the response payload"""
+        # Aggregated and sent to MLflow in the background (questions are not logged)
+        telemetry.record("generation", "context_docs_count", len(context_documents))
+        telemetry.record("generation", "answer_length", len(answer))
         
-        # Invoke with callbacks
-        # The CallbackHandler will create a trace automatically
-        response = chain.invoke(
+        return {
+            "answer": answer,
+            "sources": self.format_sources(context_documents),
+            "model": self.llm_model,
+            "trace_id": trace_id if self.tracing_enabled else None  # Only ids of real traces
+        }
+    
+    @staticmethod
+    def format_sources(context_documents: List[Document]) -> List[Dict[str, Any]]:
+        """Format context documents as response sources"""
+        return [
             {
-                "context": context,
-                "question": question,
-                "chat_history": formatted_history
-            },
-            config={"callbacks": callbacks} if callbacks else {}
-        )
+                "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+                "metadata": doc.metadata if isinstance(doc.metadata, dict) else {"source": str(doc.metadata)}
+            }
+            for doc in context_documents
+        ]
+    
+    def generate(
+        self,
+        question: str,
+        context_documents: List[Document],
+        chat_history: Optional[List] = None,
+        trace_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Generate answer from question and context, traced under trace_id"""
+        chain = self.prompt_template | self.llm
+        trace_id = trace_id or new_trace_id()
         
-        answer = response.content
+        with traced(self.exemplar_trace_id(trace_id)):
+            inputs, tokens = self._prompt(question, context_documents, chat_history)
+            with self.gateway.slot(tokens) as call:
+                with time_stage("llm"):
+                    response = chain.invoke(inputs, config=self._invoke_config(trace_id))
+                self._settle(call, inputs, response.content, getattr(response, "usage_metadata", None))
         
-        # Try to get trace_id from the CallbackHandler after invocation
-        # The CallbackHandler stores the trace_id internally
-        trace_id = None
-        try:
-            if self.langfuse_handler:
-                # Inspect the handler to find the trace_id
-                # The CallbackHandler might store it in various attributes
-                handler_attrs = dir(self.langfuse_handler)
-                
-                # Common attribute names where trace_id might be stored
-                possible_attrs = ['trace_id', 'run_id', 'traceId', '_trace_id', '_run_id', 
-                                'current_trace_id', 'langfuse_trace_id', 'trace']
-                
-                for attr_name in possible_attrs:
-                    if hasattr(self.langfuse_handler, attr_name):
-                        try:
-                            attr_value = getattr(self.langfuse_handler, attr_name)
-                            if attr_value and isinstance(attr_value, str) and len(attr_value) > 10:
-                                trace_id = attr_value
-                                print(f"✅ Trace ID trouvé dans handler.{attr_name}: {trace_id}")
-                                break
-                        except:
-                            continue
-                
-                # If not found, try to get from handler's internal state
-                if not trace_id:
-                    # Try to access private attributes
-                    for attr in handler_attrs:
-                        if 'trace' in attr.lower() or 'run' in attr.lower():
-                            try:
-                                value = getattr(self.langfuse_handler, attr)
-                                if value and isinstance(value, str) and len(value) > 10:
-                                    trace_id = value
-                                    print(f"✅ Trace ID trouvé dans handler.{attr}: {trace_id}")
-                                    break
-                            except:
-                                continue
-                
-                if not trace_id:
-                    print(f"⚠️  Trace ID non trouvé dans le CallbackHandler")
-                    print(f"   Attributs inspectés: {len(handler_attrs)}")
-                    print(f"   💡 Les scores utiliseront score_current_trace() si disponible")
-        except Exception as e:
-            print(f"⚠️  Warning: Could not get trace_id from handler: {e}")
+        return self._build_result(question, response.content, context_documents, trace_id)
+    
+    async def agenerate(
+        self,
+        question: str,
+        context_documents: List[Document],
+        chat_history: Optional[List] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+        trace_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Generate answer from question and context without blocking the event loop
         
-        # Store trace_id for later use
-        self.last_trace_id = trace_id
+        If on_token is given, the LLM is streamed and on_token is called with
+        every token as soon as it arrives.
+        """
+        chain = self.prompt_template | self.llm
+        trace_id = trace_id or new_trace_id()
+        config = self._invoke_config(trace_id)
         
-        # Log to MLflow (si disponible)
-        if MLFLOW_AVAILABLE:
-            mlflow.log_param("question", question)
-            mlflow.log_metric("context_docs_count", len(context_documents))
-            mlflow.log_metric("answer_length", len(answer))
+        with traced(self.exemplar_trace_id(trace_id)):
+            inputs, tokens = self._prompt(question, context_documents, chat_history)
+            # llm stages start once the gateway slot is held (queue wait is measured apart)
+            async with self.gateway.aslot(tokens) as call:
+                with time_stage("llm"):
+                    if on_token is None:
+                        response = await chain.ainvoke(inputs, config=config)
+                        answer = response.content
+                        usage = getattr(response, "usage_metadata", None)
+                    else:
+                        parts = []
+                        usage = None
+                        start = time.perf_counter()
+                        async for chunk in chain.astream(inputs, config=config):
+                            if chunk.content:
+                                if not parts:
+                                    record_stage_duration("llm_first_token", time.perf_counter() - start)
+                                parts.append(chunk.content)
+                                on_token(chunk.content)
+                            # With stream_usage the last chunk carries the totals
+                            usage = getattr(chunk, "usage_metadata", None) or usage
+                        answer = "".join(parts)
+                self._settle(call, inputs, answer, usage)
         
-        return {
-            "answer": answer,
-            "sources": [
-                {
-                    "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                    "metadata": doc.metadata if isinstance(doc.metadata, dict) else {"source": str(doc.metadata)}
-                }
-                for doc in context_documents
-            ],
-            "model": self.llm_model,
-            "trace_id": trace_id  # Include trace_id in response
-        }
+        return self._build_result(question, answer, context_documents, trace_id)
     
     def generate_with_retriever(
         self,
@@ -231,4 +306,13 @@ Provide a detailed and accurate answer:"""),
         
         # Generate answer
         return self.generate(question, context_documents, chat_history)
-
+    
+    async def agenerate_with_retriever(
+        self,
+        question: str,
+        retriever,
+        chat_history: Optional[List] = None
+    ) -> Dict[str, Any]:
+        """Generate answer using a retriever, asynchronously"""
+        context_documents = await retriever.ainvoke(question)
+        return await self.agenerate(question, context_documents, chat_history)
@@ -0,0 +1,130 @@
+"""Streaming ingestion: generator stages connected by bounded batches
+
+files -> load + chunk (process pool, bounded in-flight files)
+      -> batches of chunks -> embeddings -> vector store upserts
+
+Each stage pulls from the previous one and the prefetch stages use bounded
+queues, so a slow stage blocks its producers (backpressure) and peak memory
+is proportional to the batch size, not to the corpus size.
+"""
+
+import contextvars
+import queue
+import threading
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from langchain_core.documents import Document
+
+from .ingestion import DocumentIngester, IngestionResult
+
+T = TypeVar("T")
+
+_END = object()
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Group items into lists of at most `size` items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def prefetch(iterable: Iterable[T], max_items: int = 2) -> Iterator[T]:
+    """Run an upstream stage in a background thread, at most max_items ahead
+
+    The bounded queue gives backpressure: the producer blocks when the
+    consumer falls behind. Producer exceptions are re-raised in the consumer.
+    """
+    items: "queue.Queue" = queue.Queue(maxsize=max_items)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_END, e))
+
+    # Copy the context so context-local state (e.g. embedding stats) follows the stage
+    context = contextvars.copy_context()
+    producer = threading.Thread(target=context.run, args=(produce,), name="ingest-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Consumer stopped (done, error or closed early): release the producer
+        stop.set()
+        producer.join(timeout=5)
+
+
+def iter_directory_chunks(
+    ingester: DocumentIngester,
+    directory: str,
+    result: IngestionResult,
+    progress: Optional[Callable[..., None]] = None
+) -> Iterator[Document]:
+    """Yield chunks file by file, recording per-file errors in result"""
+    for file_path, chunks, error in ingester.iter_load_and_chunk(ingester.list_files(directory)):
+        result.files_processed += 1
+        if progress is not None:
+            progress(files=1)
+        if error is not None:
+            result.errors[file_path] = error
+            continue
+        yield from chunks
+
+
+def embed_batches(batches: Iterable[List[Document]], writer) -> Iterator[Tuple[List[Document], List[List[float]]]]:
+    """Embed each batch of chunks (token-packed, concurrent requests)"""
+    for batch in batches:
+        yield batch, writer.embed([doc.page_content for doc in batch])
+
+
+def stream_ingest(
+    ingester: DocumentIngester,
+    retrieval_system,
+    directory: str,
+    batch_size: int = 256,
+    prefetch_batches: int = 2,
+    progress: Optional[Callable[..., None]] = None
+) -> IngestionResult:
+    """Ingest a directory with memory bounded by batch size
+
+    Loading/chunking, embedding and vector store writes overlap: each of the
+    first two stages runs ahead of its consumer by at most prefetch_batches.
+    progress, if given, is called with files=/chunks= increments.
+    """
+    result = IngestionResult()
+
+    chunks = iter_directory_chunks(ingester, directory, result, progress)
+    chunk_batches = prefetch(batched(chunks, batch_size), prefetch_batches)
+    embedded = prefetch(embed_batches(chunk_batches, retrieval_system.writer), prefetch_batches)
+
+    for documents, vectors in embedded:
+        retrieval_system.add_embedded_documents(documents, vectors)
+        result.chunks_count += len(documents)
+        if progress is not None:
+            progress(chunks=len(documents))
+
+    return result
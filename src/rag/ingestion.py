@@ -1,7 +1,14 @@
 """Document ingestion and processing"""
 
+import logging
+import multiprocessing
 import os
-from typing import List, Optional
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from pathlib import Path
 
 from langchain_community.document_loaders import (
@@ -12,105 +19,220 @@ from langchain_community.document_loaders import (
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
-try:
-    import mlflow
-    MLFLOW_AVAILABLE = True
-except ImportError:
-    MLFLOW_AVAILABLE = False
-    # Mock mlflow pour éviter les erreurs
-    class MockMLflow:
-        @staticmethod
-        def log_param(*args, **kwargs): pass
-        @staticmethod
-        def log_metric(*args, **kwargs): pass
-    mlflow = MockMLflow()
+from src.monitoring.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
+
+
+def load_file(file_path: str) -> List[Document]:
+    """Load a file with the loader matching its extension"""
+    path = Path(file_path)
+    suffix = path.suffix.lower()
+    
+    loader_map = {
+        ".pdf": PyPDFLoader,
+        ".docx": Docx2txtLoader,
+        ".txt": TextLoader,
+    }
+    
+    if suffix not in loader_map:
+        raise ValueError(f"Unsupported file type: {suffix}")
+    
+    loader = loader_map[suffix](str(path))
+    return loader.load()
+
+
+@lru_cache(maxsize=4)
+def _get_text_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+
+
+def _lower_process_priority(nice: int):
+    """Pool initializer: lower the OS priority of the parsing process"""
+    if nice <= 0:
+        return
+    try:
+        os.nice(nice)
+    except (AttributeError, OSError):
+        pass
+
+
+def _load_and_chunk(file_path: str, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """Worker: load and chunk one file (runs in a pool process)"""
+    splitter = _get_text_splitter(chunk_size, chunk_overlap)
+    return splitter.split_documents(load_file(file_path))
+
+
+@dataclass
+class IngestionResult:
+    """Chunks produced by a directory ingestion, with per-file errors
+    
+    Streaming ingestion leaves chunks empty and only counts them.
+    """
+    chunks: List[Document] = field(default_factory=list)
+    chunks_count: int = 0
+    files_processed: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)
 
 
 class DocumentIngester:
-    """Handle document ingestion and chunking"""
+    """Handle document ingestion and chunking
+    
+    With use_processes or max_workers > 1, files are parsed and chunked in
+    a pool of max_workers processes (at a lower OS priority with nice),
+    created once with the spawn start method and reused for every call, so
+    CPU-bound parsing does not hold the GIL of the calling process. Spawned
+    workers do not inherit the threads and locks of a running server, as
+    forked ones would. Call shutdown() to stop them.
+    """
     
     def __init__(
         self,
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
-        chunking_strategy: str = "recursive"
+        chunking_strategy: str = "recursive",
+        max_workers: int = 1,
+        max_in_flight: Optional[int] = None,
+        use_processes: bool = False,
+        nice: int = 0
     ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         
-        if chunking_strategy == "recursive":
-            self.text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                length_function=len,
+        # Worker processes: 1 = serial in the caller (unless use_processes), 0 = one per CPU
+        self.max_workers = max_workers if max_workers > 0 else (os.cpu_count() or 1)
+        self.max_in_flight = max_in_flight or 2 * self.max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        if use_processes or self.max_workers > 1:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_process_priority,
+                initargs=(nice,)
             )
+        
+        if chunking_strategy == "recursive":
+            self.text_splitter = _get_text_splitter(chunk_size, chunk_overlap)
         else:
             raise ValueError(f"Unknown chunking strategy: {chunking_strategy}")
     
     def load_document(self, file_path: str) -> List[Document]:
         """Load a document from file path"""
         path = Path(file_path)
-        suffix = path.suffix.lower()
-        
-        loader_map = {
-            ".pdf": PyPDFLoader,
-            ".docx": Docx2txtLoader,
-            ".txt": TextLoader,
-        }
         
-        if suffix not in loader_map:
-            raise ValueError(f"Unsupported file type: {suffix}")
+        documents = load_file(str(path))
         
-        loader = loader_map[suffix](str(path))
-        documents = loader.load()
-        
-        # Log to MLflow (si disponible)
-        if MLFLOW_AVAILABLE:
-            mlflow.log_param("document_path", str(path))
-            mlflow.log_param("document_type", suffix)
-            mlflow.log_metric("document_chunks", len(documents))
+        telemetry.record("ingestion", "document_chunks", len(documents))
         
         return documents
     
-    def load_directory(self, directory_path: str) -> List[Document]:
-        """Load all supported documents from a directory"""
+    def list_files(self, directory_path: str) -> List[str]:
+        """List supported files under a directory, in a stable order"""
         directory = Path(directory_path)
+        return sorted(
+            str(file_path)
+            for file_path in directory.rglob("*")
+            if file_path.is_file() and file_path.suffix.lower() in SUPPORTED_EXTENSIONS
+        )
+    
+    def load_directory(self, directory_path: str) -> List[Document]:
+        """Load all supported documents from a directory (in the process pool, if any)"""
         all_documents = []
         
-        supported_extensions = {".pdf", ".docx", ".txt"}
+        for file_path, documents, error in self._iter_files(load_file, self.list_files(directory_path)):
+            if error is not None:
+                logger.warning("Error loading %s: %s", file_path, error)
+                continue
+            all_documents.extend(documents)
         
-        for file_path in directory.rglob("*"):
-            if file_path.suffix.lower() in supported_extensions:
+        telemetry.record("ingestion", "total_documents", len(all_documents))
+        return all_documents
+    
+    def iter_load_and_chunk(self, file_paths: Iterable[str]) -> Iterator[Tuple[str, List[Document], Optional[str]]]:
+        """Load and chunk files, yielding (path, chunks, error) in input order
+        
+        With a process pool, at most max_in_flight files are submitted ahead
+        of the consumer.
+        """
+        worker = partial(_load_and_chunk, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        return self._iter_files(worker, file_paths)
+    
+    def _iter_files(
+        self, worker: Callable[[str], List[Document]], file_paths: Iterable[str]
+    ) -> Iterator[Tuple[str, List[Document], Optional[str]]]:
+        """Apply a picklable worker to each file, yielding (path, documents, error) in input order"""
+        if self._pool is None:
+            for file_path in file_paths:
                 try:
-                    docs = self.load_document(str(file_path))
-                    all_documents.extend(docs)
+                    yield file_path, worker(file_path), None
                 except Exception as e:
-                    print(f"Error loading {file_path}: {e}")
-                    continue
+                    yield file_path, [], str(e)
+            return
         
-        if MLFLOW_AVAILABLE:
-            mlflow.log_metric("total_documents", len(all_documents))
-        return all_documents
+        pool = self._pool
+        paths = iter(file_paths)
+        
+        def submit(file_path: str):
+            return file_path, pool.submit(worker, file_path)
+        
+        pending = deque(submit(file_path) for file_path in islice(paths, self.max_in_flight))
+        while pending:
+            file_path, future = pending.popleft()
+            try:
+                chunks, error = future.result(), None
+            except Exception as e:
+                chunks, error = [], str(e)
+            # Keep the pool busy while the consumer handles this file
+            for next_path in islice(paths, 1):
+                pending.append(submit(next_path))
+            yield file_path, chunks, error
+    
+    def ingest_directory(self, directory_path: str) -> IngestionResult:
+        """Load and chunk all supported files of a directory (in the process pool, if any)"""
+        result = IngestionResult()
+        
+        for file_path, chunks, error in self.iter_load_and_chunk(self.list_files(directory_path)):
+            result.files_processed += 1
+            if error is not None:
+                logger.warning("Error loading %s: %s", file_path, error)
+                result.errors[file_path] = error
+                continue
+            result.chunks.extend(chunks)
+        result.chunks_count = len(result.chunks)
+        
+        telemetry.record("ingestion", "total_chunks", len(result.chunks))
+        return result
     
     def chunk_documents(self, documents: List[Document]) -> List[Document]:
         """Split documents into chunks"""
         chunks = self.text_splitter.split_documents(documents)
         
-        if MLFLOW_AVAILABLE:
-            mlflow.log_metric("total_chunks", len(chunks))
-            mlflow.log_metric("avg_chunk_size", sum(len(chunk.page_content) for chunk in chunks) / len(chunks) if chunks else 0)
+        telemetry.record("ingestion", "total_chunks", len(chunks))
+        if chunks:
+            telemetry.record("ingestion", "avg_chunk_size", sum(len(chunk.page_content) for chunk in chunks) / len(chunks))
         
         return chunks
     
     def ingest(self, source: str, is_directory: bool = False) -> List[Document]:
         """Main ingestion method"""
         if is_directory:
-            documents = self.load_directory(source)
-        else:
-            documents = self.load_document(source)
+            return self.ingest_directory(source).chunks
         
-        chunks = self.chunk_documents(documents)
-        return chunks
-
-
-
+        if self._pool is not None:
+            # Parsed and chunked in a worker process; errors are re-raised here
+            chunks = self._pool.submit(_load_and_chunk, source, self.chunk_size, self.chunk_overlap).result()
+            telemetry.record("ingestion", "total_chunks", len(chunks))
+            return chunks
+        
+        return self.chunk_documents(self.load_document(source))
+    
+    def shutdown(self):
+        """Stop the worker processes, if any"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,201 @@
+"""Background ingestion jobs"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TERMINAL_STATUSES = {SUCCEEDED, FAILED}
+
+
+@dataclass
+class IngestJob:
+    """An ingestion job and its progress"""
+    id: str
+    kind: str  # "path" or "upload"
+    source: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    files_processed: int = 0
+    chunks_embedded: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+
+    def add_progress(self, files: int = 0, chunks: int = 0):
+        """Progress callback used by the ingestion stages"""
+        self.files_processed += files
+        self.chunks_embedded += chunks
+
+    @property
+    def elapsed_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable view, including throughput"""
+        data = asdict(self)
+        elapsed = self.elapsed_seconds
+        data["elapsed_seconds"] = round(elapsed, 3)
+        data["files_per_second"] = round(self.files_processed / elapsed, 3) if elapsed else 0.0
+        data["chunks_per_second"] = round(self.chunks_embedded / elapsed, 3) if elapsed else 0.0
+        return data
+
+
+def _lower_thread_priority(nice: int):
+    """Executor initializer: lower the OS priority of the job thread (Linux)"""
+    if nice <= 0:
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+    except (AttributeError, OSError):
+        pass
+
+
+class IngestionJobManager:
+    """In-process ingestion job queue
+
+    Jobs run on a dedicated, small thread pool (not the threadpool serving
+    requests) whose threads get a lower OS priority, so a big ingest does not
+    starve queries on the same pod. With journal_path, every state change is
+    appended to a JSONL journal and unfinished jobs are resubmitted on restart.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[IngestJob], Dict[str, Any]],
+        max_workers: int = 1,
+        journal_path: Optional[str] = None,
+        nice: int = 10,
+        max_finished_jobs: int = 1000
+    ):
+        self.runner = runner
+        self.journal_path = journal_path
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: Dict[str, IngestJob] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers),
+            thread_name_prefix="ingest-job",
+            initializer=_lower_thread_priority,
+            initargs=(nice,)
+        )
+        if journal_path:
+            Path(journal_path).parent.mkdir(parents=True, exist_ok=True)
+
+    def submit(self, kind: str, source: str, **params) -> IngestJob:
+        """Queue a job and return it immediately"""
+        job = IngestJob(id=uuid.uuid4().hex, kind=kind, source=source, params=params)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._journal(job)
+        self._schedule(job)
+        return job
+
+    def _schedule(self, job: IngestJob):
+        future = self._executor.submit(self._run, job)
+        with self._lock:
+            self._futures[job.id] = future
+
+    def future(self, job_id: str) -> Optional[Future]:
+        """Future resolving to the job result (for callers that wait)"""
+        return self._futures.get(job_id)
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def _run(self, job: IngestJob) -> Dict[str, Any]:
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._journal(job)
+        try:
+            job.result = self.runner(job)
+            job.status = SUCCEEDED
+            return job.result
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            raise
+        finally:
+            job.finished_at = time.time()
+            self._journal(job)
+            self._forget_old_jobs()
+
+    def _forget_old_jobs(self):
+        """Keep memory bounded: drop the oldest finished jobs"""
+        with self._lock:
+            finished = [job for job in self._jobs.values() if job.status in TERMINAL_STATUSES]
+            excess = len(finished) - self.max_finished_jobs
+            if excess <= 0:
+                return
+            for job in sorted(finished, key=lambda job: job.finished_at or 0)[:excess]:
+                self._jobs.pop(job.id, None)
+                self._futures.pop(job.id, None)
+
+    def _journal(self, job: IngestJob):
+        if not self.journal_path:
+            return
+        line = json.dumps(asdict(job), default=str)
+        with self._lock:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def recover(self, can_resume: Callable[[IngestJob], bool]) -> List[IngestJob]:
+        """Replay the journal; resubmit unfinished jobs that can be resumed"""
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return []
+
+        latest: Dict[str, IngestJob] = {}
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    latest[json.loads(line)["id"]] = IngestJob(**json.loads(line))
+                except (ValueError, TypeError, KeyError):
+                    continue
+
+        # Compact the journal to the last state of every job
+        with self._lock:
+            with open(self.journal_path, "w", encoding="utf-8") as f:
+                for job in latest.values():
+                    f.write(json.dumps(asdict(job), default=str) + "\n")
+
+        resumed = []
+        for job in latest.values():
+            with self._lock:
+                self._jobs[job.id] = job
+            if job.status in TERMINAL_STATUSES:
+                continue
+            if can_resume(job):
+                job.status = QUEUED
+                job.files_processed = job.chunks_embedded = 0
+                job.started_at = job.finished_at = None
+                self._journal(job)
+                self._schedule(job)
+                resumed.append(job)
+            else:
+                job.status = FAILED
+                job.error = "Interrupted by a restart and cannot be resumed"
+                job.finished_at = time.time()
+                self._journal(job)
+        self._forget_old_jobs()
+        return resumed
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
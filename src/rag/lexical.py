@@ -0,0 +1,225 @@
+"""In-process BM25 inverted index and reciprocal rank fusion"""
+
+import json
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Identifiers (ERR-4021, foo_bar, v1.2.3, a/b) are kept whole and also split into parts
+_TOKEN_RE = re.compile(r"\w+(?:[-.:/]\w+)*")
+_PART_RE = re.compile(r"[-.:/]")
+_MAX_TF = 65535
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound identifiers also yield their parts"""
+    tokens = _TOKEN_RE.findall(text.lower())
+    compounds = [token for token in tokens if _PART_RE.search(token)]
+    for token in compounds:
+        tokens.extend(part for part in _PART_RE.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    """BM25 over compact postings: per term, parallel arrays of doc numbers and tfs
+
+    Documents are keyed by the vector store id, so the index only holds ids
+    and statistics (texts are fetched back from the vector store). Updates are
+    incremental: add() appends postings, delete() tombstones the document and
+    postings are compacted once tombstones exceed compact_ratio.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, compact_ratio: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._reset()
+        self.dirty = False
+
+    def _reset(self):
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_numbers: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+        self._deleted = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_numbers)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._postings)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]):
+        """Index documents (re-indexing ids that already exist)"""
+        with self._lock:
+            self._delete(ids)
+            for doc_id, text in zip(ids, texts):
+                counts = Counter(tokenize(text))
+                number = len(self._doc_ids)
+                self._doc_ids.append(doc_id)
+                self._doc_numbers[doc_id] = number
+                length = sum(counts.values())
+                self._lengths.append(length)
+                self._total_length += length
+                for token, tf in counts.items():
+                    postings = self._postings.get(token)
+                    if postings is None:
+                        postings = self._postings[token] = (array("I"), array("H"))
+                    postings[0].append(number)
+                    postings[1].append(min(tf, _MAX_TF))
+            self.dirty = True
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            if self._delete(ids):
+                self.dirty = True
+                if self._deleted > self.compact_ratio * max(len(self._doc_ids), 1):
+                    self._compact()
+
+    def _delete(self, ids: Iterable[str]) -> int:
+        removed = 0
+        for doc_id in ids:
+            number = self._doc_numbers.pop(doc_id, None)
+            if number is None:
+                continue
+            self._doc_ids[number] = None
+            self._total_length -= self._lengths[number]
+            self._lengths[number] = 0
+            self._deleted += 1
+            removed += 1
+        return removed
+
+    def _compact(self):
+        """Drop tombstoned documents and renumber the postings"""
+        keep = np.array([doc_id is not None for doc_id in self._doc_ids], dtype=bool)
+        renumber = np.cumsum(keep) - 1
+        postings = {}
+        for token, (docs, tfs) in self._postings.items():
+            docs_np = np.frombuffer(docs, dtype=np.uint32)
+            mask = keep[docs_np]
+            if mask.any():
+                postings[token] = (
+                    array("I", renumber[docs_np[mask]].astype(np.uint32).tobytes()),
+                    array("H", np.frombuffer(tfs, dtype=np.uint16)[mask].tobytes())
+                )
+        self._doc_ids = [doc_id for doc_id in self._doc_ids if doc_id is not None]
+        self._doc_numbers = {doc_id: number for number, doc_id in enumerate(self._doc_ids)}
+        self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uint32)[keep].tobytes())
+        self._postings = postings
+        self._deleted = 0
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top-k (document id, BM25 score)"""
+        terms = set(tokenize(query))
+        with self._lock:
+            live = len(self._doc_numbers)
+            if not live or not terms:
+                return []
+            avgdl = self._total_length / live or 1.0
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                df = len(docs)
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[docs] / avgdl)
+                # Doc numbers are unique within a posting list: plain fancy-index add
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+            if self._deleted:
+                scores[lengths == 0] = 0
+
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self._doc_ids[number], float(scores[number])) for number in ranked]
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the postings and per-document arrays"""
+        postings = sum(
+            docs.itemsize * len(docs) + tfs.itemsize * len(tfs)
+            for docs, tfs in self._postings.values()
+        )
+        return postings + self._lengths.itemsize * len(self._lengths)
+
+    def save(self, path: str):
+        """Persist as one npz: CSR postings + document table (written atomically)"""
+        with self._lock:
+            if self._deleted:
+                self._compact()
+            terms = list(self._postings)
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            for i, term in enumerate(terms):
+                offsets[i + 1] = offsets[i] + len(self._postings[term][0])
+            docs = np.empty(offsets[-1], dtype=np.uint32)
+            tfs = np.empty(offsets[-1], dtype=np.uint16)
+            for i, term in enumerate(terms):
+                docs[offsets[i]:offsets[i + 1]] = np.frombuffer(self._postings[term][0], dtype=np.uint32)
+                tfs[offsets[i]:offsets[i + 1]] = np.frombuffer(self._postings[term][1], dtype=np.uint16)
+
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(
+                tmp_path,
+                params=np.array([self.k1, self.b]),
+                terms=np.frombuffer(json.dumps(terms).encode("utf-8"), dtype=np.uint8),
+                doc_ids=np.frombuffer(json.dumps(self._doc_ids).encode("utf-8"), dtype=np.uint8),
+                lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+                offsets=offsets,
+                docs=docs,
+                tfs=tfs
+            )
+            os.replace(tmp_path, path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        data = np.load(path)
+        k1, b = data["params"]
+        index = cls(k1=float(k1), b=float(b))
+        terms = json.loads(data["terms"].tobytes().decode("utf-8"))
+        index._doc_ids = json.loads(data["doc_ids"].tobytes().decode("utf-8"))
+        index._doc_numbers = {doc_id: number for number, doc_id in enumerate(index._doc_ids)}
+        index._lengths = array("I", data["lengths"].tobytes())
+        index._total_length = int(data["lengths"].sum())
+        offsets, docs, tfs = data["offsets"], data["docs"], data["tfs"]
+        index._postings = {
+            term: (
+                array("I", docs[offsets[i]:offsets[i + 1]].tobytes()),
+                array("H", tfs[offsets[i]:offsets[i + 1]].tobytes())
+            )
+            for i, term in enumerate(terms)
+        }
+        return index
+
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[Sequence[Document]],
+    weights: Optional[Sequence[float]] = None,
+    rrf_k: int = 60
+) -> List[Document]:
+    """Fuse ranked lists: score(d) = sum_i w_i / (rrf_k + rank_i(d))"""
+    weights = weights or [1.0] * len(result_lists)
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(results, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
@@ -0,0 +1,247 @@
+"""LLM gateway: concurrency limit, bounded wait queue and load shedding
+
+Every chat completion goes through a slot of the gateway. At most
+max_concurrency calls run at once; the others wait in a FIFO queue of at
+most max_queue requests for at most queue_timeout seconds. A request is
+shed right away (LLMOverloaded, turned into a 503 with Retry-After by the
+API) when the queue is full, when its expected wait is already past the
+deadline, or when the tokens-per-minute budget is spent.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Deque, List, Optional, Set, Tuple
+
+from src.config import settings
+from src.monitoring.prometheus import record_llm_queue_wait, record_llm_shed, set_llm_gateway_state
+
+
+class LLMOverloaded(Exception):
+    """The LLM gateway refused the call; retry after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"LLM capacity exhausted ({reason}), retry in {self.retry_after}s")
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted", "reservation")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+        self.reservation: Optional[list] = None  # [time, tokens] entry of the TPM window
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class LLMCall:
+    """Handle of an admitted call: report the tokens actually billed"""
+
+    def __init__(self, reserved: int, reservation: Optional[list] = None):
+        self.reserved = reserved
+        self.reservation = reservation
+        self.tokens: Optional[int] = None
+        self.started = time.monotonic()
+
+    def record(self, tokens: int):
+        self.tokens = tokens
+
+
+class LLMGateway:
+    """Admission control in front of the chat model, shared by sync and async callers"""
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        tokens_per_minute: Optional[int] = None
+    ):
+        self.max_concurrency = max_concurrency or settings.llm_max_concurrency
+        self.max_queue = settings.llm_max_queue if max_queue is None else max_queue
+        self.queue_timeout = settings.llm_queue_timeout_seconds if queue_timeout is None else queue_timeout
+        self.tokens_per_minute = settings.llm_tokens_per_minute if tokens_per_minute is None else tokens_per_minute
+
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queue: Deque[_Waiter] = deque()
+        self._window: Deque[List] = deque()  # [time, tokens], sliding minute
+        self._tokens = 0
+        self._call_seconds = 1.0  # EWMA of call durations, for the expected wait
+        self._calls: Set[LLMCall] = set()  # running calls, with their start time
+
+    @property
+    def in_flight(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def tokens_last_minute(self) -> int:
+        with self._lock:
+            self._prune(time.monotonic())
+            return self._tokens
+
+    def _prune(self, now: float):
+        while self._window and now - self._window[0][0] >= 60:
+            expired = self._window.popleft()
+            self._tokens -= expired[1]
+            expired[1] = None  # aged out: settling it no longer counts
+
+    def _settle(self, reservation: Optional[list], tokens: int):
+        """Correct a reservation in place: it keeps its timestamp and ages out as one entry"""
+        if reservation is not None and reservation[1] is not None:
+            self._tokens += tokens - reservation[1]
+            reservation[1] = tokens
+
+    def _expected_wait(self) -> float:
+        """Wait of a request joining the queue now, from what the running calls have left"""
+        now = time.monotonic()
+        remaining = [max(0.0, self._call_seconds - (now - call.started)) for call in self._calls]
+        # Granted but not started yet: a full call; free slots: no wait
+        remaining += [self._call_seconds] * max(0, self._running - len(remaining))
+        remaining += [0.0] * max(0, self.max_concurrency - len(remaining))
+        remaining.sort()
+        # Queued requests take the slots in the order they free up
+        position = len(self._queue)
+        return remaining[position % self.max_concurrency] + (position // self.max_concurrency) * self._call_seconds
+
+    def _shed_reason(self, tokens: int, now: float) -> Optional[Tuple[str, float]]:
+        """(reason, retry_after) if a new call must be refused now"""
+        if self.tokens_per_minute:
+            self._prune(now)
+            if self._window and self._tokens + min(tokens, self.tokens_per_minute) > self.tokens_per_minute:
+                return "tpm", 60 - (now - self._window[0][0])
+        if self._running < self.max_concurrency:
+            return None
+        if len(self._queue) >= self.max_queue:
+            return "queue_full", self._expected_wait()
+        if self._expected_wait() > self.queue_timeout:
+            return "deadline", self._expected_wait()
+        return None
+
+    def check(self, tokens: int = 0):
+        """Raise LLMOverloaded if a call would be shed now (cheap early rejection)"""
+        with self._lock:
+            shed = self._shed_reason(tokens, time.monotonic())
+        if shed is not None:
+            raise LLMOverloaded(*shed)
+
+    def _admit(self, tokens: int, waiter: _Waiter) -> bool:
+        """Reserve tokens and take a slot (True) or join the queue (False)"""
+        with self._lock:
+            now = time.monotonic()
+            shed = self._shed_reason(tokens, now)
+            if shed is None and tokens:
+                waiter.reservation = [now, tokens]
+                self._window.append(waiter.reservation)
+                self._tokens += tokens
+            elif shed is not None:
+                record_llm_shed(shed[0])
+            if shed is None:
+                if self._running < self.max_concurrency:
+                    self._running += 1
+                    waiter.granted = True
+                else:
+                    self._queue.append(waiter)
+            self._publish()
+        if shed is not None:
+            raise LLMOverloaded(*shed)
+        return waiter.granted
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leave the queue after a timeout; True if the slot was granted meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queue.remove(waiter)
+            self._settle(waiter.reservation, 0)
+            self._publish()
+        return False
+
+    def _start(self, call: LLMCall):
+        with self._lock:
+            self._calls.add(call)
+
+    def _release(self, call: LLMCall, duration: Optional[float]):
+        with self._lock:
+            self._calls.discard(call)
+            if call.tokens is not None:
+                # Settle the reservation with the billed count
+                self._settle(call.reservation, call.tokens)
+            if duration is not None:
+                self._call_seconds = 0.8 * self._call_seconds + 0.2 * duration
+            if self._queue:
+                # Hand the slot over: _running stays the same
+                waiter = self._queue.popleft()
+                waiter.granted = True
+                waiter.wake()
+            else:
+                self._running -= 1
+            self._publish()
+
+    def _publish(self):
+        set_llm_gateway_state(self._running, len(self._queue), self._tokens)
+
+    def _timeout(self) -> LLMOverloaded:
+        record_llm_shed("timeout")
+        with self._lock:
+            return LLMOverloaded("timeout", self._expected_wait())
+
+    @contextmanager
+    def slot(self, tokens: int = 0):
+        """Run one LLM call (blocking callers); tokens = estimated tokens of the call"""
+        waiter = _Waiter()
+        start = time.monotonic()
+        if not self._admit(tokens, waiter):
+            if not waiter.event.wait(self.queue_timeout) and not self._abandon(waiter):
+                raise self._timeout()
+        record_llm_queue_wait(time.monotonic() - start)
+        call = LLMCall(tokens, waiter.reservation)
+        self._start(call)
+        try:
+            yield call
+        finally:
+            self._release(call, time.monotonic() - call.started)
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int = 0):
+        """Async slot: waiting in the queue does not block the event loop"""
+        waiter = _Waiter(asyncio.get_running_loop())
+        start = time.monotonic()
+        if not self._admit(tokens, waiter):
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._timeout()
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    unused = LLMCall(tokens, waiter.reservation)
+                    unused.record(0)
+                    self._release(unused, None)
+                raise
+        record_llm_queue_wait(time.monotonic() - start)
+        call = LLMCall(tokens, waiter.reservation)
+        self._start(call)
+        try:
+            yield call
+        finally:
+            self._release(call, time.monotonic() - call.started)
@@ -0,0 +1,317 @@
+"""Ingestion manifest for incremental (re-)ingestion"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+# Read files in 1 MiB blocks when hashing
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """sha256 of a file's content, streamed"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def assign_chunk_ids(source: str, chunks: List[Document]) -> List[str]:
+    """Deterministic chunk ids derived from the source path and chunk text
+
+    Unchanged chunks of an edited file keep their id, so only the chunks
+    whose text changed are deleted/upserted. Repeated texts in the same file
+    are told apart by their occurrence number.
+    """
+    ids = []
+    occurrences: Dict[str, int] = {}
+    for chunk in chunks:
+        text_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+        occurrence = occurrences.get(text_hash, 0)
+        occurrences[text_hash] = occurrence + 1
+        chunk_id = hashlib.sha256(f"{source}\0{text_hash}\0{occurrence}".encode("utf-8")).hexdigest()[:32]
+        chunk.metadata["chunk_id"] = chunk_id
+        ids.append(chunk_id)
+    return ids
+
+
+@dataclass
+class ManifestEntry:
+    """What was indexed for one file"""
+    path: str
+    mtime: float
+    size: int
+    content_hash: str
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+class IngestionManifest:
+    """Manifest of indexed files (path, mtime, size, content hash, chunk ids)
+
+    Stored in SQLite next to the vector store so each file update is
+    committed on its own and a 40k-file manifest is never rewritten whole.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL, "
+            "content_hash TEXT NOT NULL, chunk_ids TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_content_hash ON files (content_hash)")
+        self._db.commit()
+
+    @staticmethod
+    def _entry(row) -> ManifestEntry:
+        path, mtime, size, content_hash, chunk_ids = row
+        return ManifestEntry(path, mtime, size, content_hash, json.loads(chunk_ids))
+
+    def get(self, path: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT path, mtime, size, content_hash, chunk_ids FROM files WHERE path = ?",
+                (path,)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def find_by_hash(self, content_hash: str) -> Optional[ManifestEntry]:
+        """Return an indexed file with this content hash, if any"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT path, mtime, size, content_hash, chunk_ids FROM files WHERE content_hash = ? LIMIT 1",
+                (content_hash,)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def put(self, entry: ManifestEntry):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (path, mtime, size, content_hash, chunk_ids) VALUES (?, ?, ?, ?, ?)",
+                (entry.path, entry.mtime, entry.size, entry.content_hash, json.dumps(entry.chunk_ids))
+            )
+            self._db.commit()
+
+    def remove(self, path: str):
+        with self._lock:
+            self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._db.commit()
+
+    def forget_chunks(self, chunk_ids: List[str]) -> List[str]:
+        """Mark the files owning these chunks as changed so the next sync re-indexes them
+
+        Used for chunks the vector store lost (an ingestion interrupted before
+        its flush); returns the affected paths.
+        """
+        lost = set(chunk_ids)
+        affected = []
+        with self._lock:
+            rows = self._db.execute("SELECT path, mtime, size, content_hash, chunk_ids FROM files").fetchall()
+            for row in rows:
+                entry = self._entry(row)
+                if lost.isdisjoint(entry.chunk_ids):
+                    continue
+                # No mtime/hash match, and the lost chunks count as new
+                self._db.execute(
+                    "UPDATE files SET mtime = 0, content_hash = '', chunk_ids = ? WHERE path = ?",
+                    (json.dumps([chunk_id for chunk_id in entry.chunk_ids if chunk_id not in lost]), entry.path)
+                )
+                affected.append(entry.path)
+            self._db.commit()
+        return affected
+
+    def paths_under(self, directory: str) -> List[str]:
+        """Indexed paths located under directory"""
+        prefix = os.path.join(directory, "")
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path FROM files WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+@dataclass
+class SyncResult:
+    """Outcome of an incremental ingestion"""
+    files_scanned: int = 0
+    files_changed: int = 0
+    files_unchanged: int = 0
+    files_removed: int = 0
+    chunks_added: int = 0
+    chunks_deleted: int = 0
+    chunks_unchanged: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class _FilePlan:
+    """A file that needs (re-)indexing"""
+    path: str
+    mtime: float
+    size: int
+    content_hash: str
+    entry: Optional[ManifestEntry]
+
+
+def _plan_file(file_path: str, manifest: IngestionManifest, result: SyncResult) -> Optional[_FilePlan]:
+    """Return what to re-index for a file, or None if it is unchanged"""
+    path = str(Path(file_path).resolve())
+    stat = os.stat(path)
+    entry = manifest.get(path)
+    result.files_scanned += 1
+
+    # Cheap check first: same mtime and size means unchanged
+    if entry and entry.mtime == stat.st_mtime and entry.size == stat.st_size:
+        result.files_unchanged += 1
+        result.chunks_unchanged += len(entry.chunk_ids)
+        return None
+
+    content_hash = file_sha256(path)
+    if entry and entry.content_hash == content_hash:
+        # Touched but identical: only refresh mtime/size
+        manifest.put(ManifestEntry(path, stat.st_mtime, stat.st_size, content_hash, entry.chunk_ids))
+        result.files_unchanged += 1
+        result.chunks_unchanged += len(entry.chunk_ids)
+        return None
+
+    return _FilePlan(path, stat.st_mtime, stat.st_size, content_hash, entry)
+
+
+def _apply_file(
+    plan: _FilePlan,
+    chunks: List[Document],
+    retrieval_system,
+    manifest: IngestionManifest,
+    result: SyncResult
+):
+    """Delete the stale chunks of a file and upsert its new ones"""
+    entry = plan.entry
+    chunk_ids = assign_chunk_ids(plan.path, chunks)
+
+    old_ids = set(entry.chunk_ids) if entry else set()
+    new_ids = set(chunk_ids)
+    stale_ids = [chunk_id for chunk_id in (entry.chunk_ids if entry else []) if chunk_id not in new_ids]
+    added = [(chunk_id, chunk) for chunk_id, chunk in zip(chunk_ids, chunks) if chunk_id not in old_ids]
+
+    if stale_ids:
+        retrieval_system.delete(stale_ids)
+    if added:
+        retrieval_system.add_documents([chunk for _, chunk in added], ids=[chunk_id for chunk_id, _ in added])
+
+    manifest.put(ManifestEntry(plan.path, plan.mtime, plan.size, plan.content_hash, chunk_ids))
+    result.files_changed += 1
+    result.chunks_added += len(added)
+    result.chunks_deleted += len(stale_ids)
+    result.chunks_unchanged += len(chunk_ids) - len(added)
+
+
+def sync_file(file_path: str, ingester, retrieval_system, manifest: IngestionManifest, result: SyncResult):
+    """Bring the index up to date with one file (no-op if unchanged)"""
+    plan = _plan_file(file_path, manifest, result)
+    if plan is not None:
+        chunks = ingester.ingest(plan.path, is_directory=False)
+        _apply_file(plan, chunks, retrieval_system, manifest, result)
+
+
+def sync_upload(
+    file_path: str,
+    source: str,
+    content_hash: str,
+    ingester,
+    retrieval_system,
+    manifest: IngestionManifest,
+    result: SyncResult
+) -> List[Document]:
+    """Index an uploaded file under a stable source key (e.g. upload://report.pdf)
+
+    Content already indexed (under any path) is skipped; re-uploading a
+    modified file under the same name only replaces the chunks that changed.
+    Returns the chunks of the file, or an empty list if it was skipped.
+    """
+    result.files_scanned += 1
+    if manifest.find_by_hash(content_hash) is not None:
+        result.files_unchanged += 1
+        return []
+
+    stat = os.stat(file_path)
+    chunks = ingester.ingest(file_path, is_directory=False)
+    for chunk in chunks:
+        chunk.metadata["source"] = source
+    plan = _FilePlan(source, stat.st_mtime, stat.st_size, content_hash, manifest.get(source))
+    _apply_file(plan, chunks, retrieval_system, manifest, result)
+    return chunks
+
+
+def sync_directory(
+    directory: str,
+    ingester,
+    retrieval_system,
+    manifest: IngestionManifest,
+    progress: Optional[Callable[..., None]] = None
+) -> SyncResult:
+    """Incrementally ingest a directory
+
+    Only new or modified files are loaded (in parallel if the ingester has
+    several workers); chunks of deleted files and chunks that disappeared
+    from modified files are removed from the store. progress, if given, is
+    called with files=/chunks= increments as files are processed.
+    """
+    result = SyncResult()
+    directory = str(Path(directory).resolve())
+
+    seen = set()
+    plans: List[_FilePlan] = []
+    for file_path in ingester.list_files(directory):
+        path = str(Path(file_path).resolve())
+        seen.add(path)
+        try:
+            plan = _plan_file(path, manifest, result)
+        except OSError as e:
+            result.errors[path] = str(e)
+            continue
+        if plan is not None:
+            plans.append(plan)
+        elif progress is not None:
+            progress(files=1)
+
+    loaded = ingester.iter_load_and_chunk([plan.path for plan in plans])
+    for plan, (path, chunks, error) in zip(plans, loaded):
+        chunks_before = result.chunks_added
+        if error is not None:
+            result.errors[path] = error
+        else:
+            try:
+                _apply_file(plan, chunks, retrieval_system, manifest, result)
+            except Exception as e:
+                result.errors[path] = str(e)
+        if progress is not None:
+            progress(files=1, chunks=result.chunks_added - chunks_before)
+
+    for path in manifest.paths_under(directory):
+        if path in seen:
+            continue
+        entry = manifest.get(path)
+        if entry and entry.chunk_ids:
+            retrieval_system.delete(entry.chunk_ids)
+            result.chunks_deleted += len(entry.chunk_ids)
+        manifest.remove(path)
+        result.files_removed += 1
+
+    return result
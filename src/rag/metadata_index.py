@@ -0,0 +1,193 @@
+"""Metadata filters and a bitmap index (field -> value -> ids) to pre-filter searches
+
+A filter maps metadata fields to a value or a list of accepted values:
+{"source": "guide.pdf", "doc_type": ["pdf", "docx"]} keeps chunks whose
+source is guide.pdf AND whose doc_type is pdf or docx.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MetadataFilter = Dict[str, Any]
+
+SCALAR_TYPES = (str, int, float, bool)
+
+# Bitmaps are split in 4096-bit chunks, only non-empty chunks are stored:
+# a value whose ids are clustered (chunks of one file) costs a few words
+CHUNK_BITS = 4096
+CHUNK_BYTES = CHUNK_BITS // 8
+
+Bitmap = Dict[int, int]
+
+
+def normalize_filter(filter: Optional[MetadataFilter]) -> Optional[Dict[str, List[Any]]]:
+    """field -> list of accepted values; ValueError on malformed filters"""
+    if not filter:
+        return None
+    if not isinstance(filter, dict):
+        raise ValueError("filter must be an object mapping metadata fields to values")
+    normalized = {}
+    for field, value in filter.items():
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        if not values:
+            raise ValueError(f"filter on {field!r} has no accepted value")
+        for item in values:
+            if not isinstance(item, SCALAR_TYPES):
+                raise ValueError(f"filter on {field!r}: only str, int, float and bool values are supported")
+        normalized[field] = values
+    return normalized
+
+
+def _key(value: Any) -> Tuple[bool, Any]:
+    # True == 1 in Python: keep booleans apart from numbers
+    return isinstance(value, bool), value
+
+
+def matches(metadata: Dict[str, Any], filter: Optional[MetadataFilter]) -> bool:
+    """Post-filter check for stores or paths without an index"""
+    normalized = normalize_filter(filter)
+    if normalized is None:
+        return True
+    for field, values in normalized.items():
+        if field not in metadata or not isinstance(metadata[field], SCALAR_TYPES):
+            return False
+        if _key(metadata[field]) not in {_key(value) for value in values}:
+            return False
+    return True
+
+
+def to_chroma_where(filter: Optional[MetadataFilter]) -> Optional[Dict[str, Any]]:
+    """Chroma `where` clause for a filter"""
+    normalized = normalize_filter(filter)
+    if normalized is None:
+        return None
+    clauses = [
+        {field: {"$eq": values[0]}} if len(values) == 1 else {field: {"$in": values}}
+        for field, values in normalized.items()
+    ]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def bitmap_count(bitmap: Bitmap) -> int:
+    return sum(word.bit_count() for word in bitmap.values())
+
+
+def bitmap_to_bytes(bitmap: Bitmap) -> np.ndarray:
+    """Packed little-endian bitmap (bit i = id i), the layout of faiss.IDSelectorBitmap"""
+    if not bitmap:
+        return np.zeros(1, dtype=np.uint8)
+    packed = np.zeros((max(bitmap) + 1) * CHUNK_BYTES, dtype=np.uint8)
+    for chunk, word in bitmap.items():
+        packed[chunk * CHUNK_BYTES:(chunk + 1) * CHUNK_BYTES] = np.frombuffer(
+            word.to_bytes(CHUNK_BYTES, "little"), dtype=np.uint8
+        )
+    return packed
+
+
+def bitmap_ids(bitmap: Bitmap) -> List[int]:
+    ids = []
+    for chunk in sorted(bitmap):
+        word, base = bitmap[chunk], chunk * CHUNK_BITS
+        while word:
+            low = word & -word
+            ids.append(base + low.bit_length() - 1)
+            word ^= low
+    return ids
+
+
+def _union(bitmaps: Iterable[Bitmap]) -> Bitmap:
+    result: Bitmap = {}
+    for bitmap in bitmaps:
+        for chunk, word in bitmap.items():
+            result[chunk] = result.get(chunk, 0) | word
+    return result
+
+
+def _intersect(a: Bitmap, b: Bitmap) -> Bitmap:
+    if len(b) < len(a):
+        a, b = b, a
+    result = {}
+    for chunk, word in a.items():
+        common = word & b.get(chunk, 0)
+        if common:
+            result[chunk] = common
+    return result
+
+
+class MetadataIndex:
+    """In-memory bitmaps of integer ids (e.g. FAISS ids) per indexed field value
+
+    Only the configured fields are indexed: a unique field such as chunk_id
+    would cost one bitmap per chunk. Conditions on other fields are left
+    to the caller, which post-filters the pre-filtered candidates.
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(fields)
+        self._bitmaps: Dict[str, Dict[Tuple[bool, Any], Bitmap]] = {field: {} for field in self.fields}
+        self._entries: Dict[int, Tuple[Tuple[str, Tuple[bool, Any]], ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, ids: Sequence[int], metadatas: Sequence[Optional[Dict[str, Any]]]):
+        for slot, metadata in zip(ids, metadatas):
+            slot = int(slot)
+            if slot in self._entries:
+                self._remove(slot)
+            metadata = metadata or {}
+            entries = tuple(
+                (field, _key(metadata[field]))
+                for field in self.fields
+                if isinstance(metadata.get(field), SCALAR_TYPES)
+            )
+            chunk, bit = divmod(slot, CHUNK_BITS)
+            for field, key in entries:
+                bitmap = self._bitmaps[field].setdefault(key, {})
+                bitmap[chunk] = bitmap.get(chunk, 0) | (1 << bit)
+            self._entries[slot] = entries
+
+    def remove(self, ids: Iterable[int]):
+        for slot in ids:
+            self._remove(int(slot))
+
+    def _remove(self, slot: int):
+        entries = self._entries.pop(slot, None)
+        if entries is None:
+            return
+        chunk, bit = divmod(slot, CHUNK_BITS)
+        for field, key in entries:
+            bitmap = self._bitmaps[field][key]
+            word = bitmap.get(chunk, 0) & ~(1 << bit)
+            if word:
+                bitmap[chunk] = word
+            else:
+                bitmap.pop(chunk, None)
+                if not bitmap:
+                    del self._bitmaps[field][key]
+
+    def split(self, filter: Optional[MetadataFilter]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """(part answered by the bitmaps, part left to post-filtering)"""
+        normalized = normalize_filter(filter) or {}
+        indexed = {field: values for field, values in normalized.items() if field in self._bitmaps}
+        rest = {field: values for field, values in normalized.items() if field not in self._bitmaps}
+        return indexed, rest
+
+    def select(self, filter: Optional[MetadataFilter]) -> Optional[Bitmap]:
+        """Ids matching the filter (AND across fields, OR within values)
+
+        Fields that are not indexed are ignored (see split); None when no
+        field of the filter is indexed.
+        """
+        indexed, _ = self.split(filter)
+        if not indexed:
+            return None
+        result: Optional[Bitmap] = None
+        for field, values in indexed.items():
+            per_value = self._bitmaps[field]
+            selected = _union(per_value.get(_key(value), {}) for value in values)
+            result = selected if result is None else _intersect(result, selected)
+            if not result:
+                return {}
+        return result
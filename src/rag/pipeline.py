@@ -1,22 +1,21 @@
 """Complete RAG Pipeline using LangGraph"""
 
-from typing import List, Dict, Any, Optional, TypedDict
+from typing import List, Dict, Any, Optional, Tuple, TypedDict
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import run_in_executor
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 from .retrieval import RetrievalSystem
-from .generation import RAGGenerator
-
-try:
-    import mlflow
-    MLFLOW_AVAILABLE = True
-except ImportError:
-    MLFLOW_AVAILABLE = False
-    class MockMLflow:
-        @staticmethod
-        def log_metric(*args, **kwargs): pass
-    mlflow = MockMLflow()
+from .answer_cache import SemanticAnswerCache, cache_scope
+from .metadata_index import MetadataFilter
+from .postprocess import RetrievalOptions
+from .rerank import Reranker
+from .generation import RAGGenerator, new_trace_id
+from src.monitoring.prometheus import time_stage, traced
+from src.monitoring.telemetry import telemetry
 
 
 class RAGState(TypedDict):
@@ -27,6 +26,11 @@ class RAGState(TypedDict):
     answer: str
     chat_history: List[Dict[str, str]]
     sources: List[Dict[str, Any]]
+    trace_id: str  # Generated up front, one per request
+    stream_tokens: bool
+    retrieval_options: Optional[RetrievalOptions]
+    filter: Optional[MetadataFilter]
+    query_vector: Optional[List[float]]  # Embedded once per request (answer cache lookup)
 
 
 class RAGPipeline:
@@ -35,10 +39,14 @@ class RAGPipeline:
     def __init__(
         self,
         retrieval_system: RetrievalSystem,
-        generator: RAGGenerator
+        generator: RAGGenerator,
+        reranker: Optional[Reranker] = None,
+        answer_cache: Optional[SemanticAnswerCache] = None
     ):
         self.retrieval_system = retrieval_system
         self.generator = generator
+        self.reranker = reranker
+        self.answer_cache = answer_cache
         
         # Build LangGraph workflow
         self.workflow = self._build_workflow()
@@ -47,15 +55,31 @@ class RAGPipeline:
         """Build the LangGraph workflow"""
         workflow = StateGraph(RAGState)
         
-        # Add nodes
-        workflow.add_node("retrieve", self._retrieve_node)
-        workflow.add_node("generate", self._generate_node)
+        # Add nodes (sync implementation for invoke/stream, async one for ainvoke/astream)
+        workflow.add_node(
+            "retrieve",
+            RunnableLambda(self._retrieve_node, afunc=self._aretrieve_node, name="retrieve")
+        )
+        workflow.add_node(
+            "generate",
+            RunnableLambda(self._generate_node, afunc=self._agenerate_node, name="generate")
+        )
+        
+        if self.reranker is not None:
+            workflow.add_node(
+                "rerank",
+                RunnableLambda(self._rerank_node, afunc=self._arerank_node, name="rerank")
+            )
         
         # Set entry point
         workflow.set_entry_point("retrieve")
         
         # Add edges
-        workflow.add_edge("retrieve", "generate")
+        if self.reranker is not None:
+            workflow.add_edge("retrieve", "rerank")
+            workflow.add_edge("rerank", "generate")
+        else:
+            workflow.add_edge("retrieve", "generate")
         workflow.add_edge("generate", END)
         
         return workflow.compile()
@@ -64,15 +88,49 @@ class RAGPipeline:
         """Retrieve relevant documents"""
         question = state.get("question", "")
         
-        # Retrieve documents
-        documents = self.retrieval_system.similarity_search(question)
+        # Retrieve documents (over-fetched when a rerank node follows)
+        with traced(self.generator.exemplar_trace_id(state.get("trace_id"))):
+            documents = self.retrieval_system.similarity_search(
+                question, k=self._retrieve_k, options=state.get("retrieval_options"), filter=state.get("filter"),
+                query_vector=state.get("query_vector")
+            )
+        
+        state["documents"] = documents
+        telemetry.record("pipeline", "retrieved_docs", len(documents))
+        
+        return state
+    
+    async def _aretrieve_node(self, state: RAGState) -> RAGState:
+        """Retrieve relevant documents (async)"""
+        question = state.get("question", "")
+        
+        with traced(self.generator.exemplar_trace_id(state.get("trace_id"))):
+            documents = await self.retrieval_system.asimilarity_search(
+                question, k=self._retrieve_k, options=state.get("retrieval_options"), filter=state.get("filter"),
+                query_vector=state.get("query_vector")
+            )
         
         state["documents"] = documents
-        if MLFLOW_AVAILABLE:
-            mlflow.log_metric("retrieved_docs", len(documents))
+        telemetry.record("pipeline", "retrieved_docs", len(documents))
         
         return state
     
+    @property
+    def _retrieve_k(self) -> Optional[int]:
+        return self.reranker.fetch_k if self.reranker is not None else None
+    
+    def _rerank_node(self, state: RAGState) -> RAGState:
+        """Keep the best candidates for generation"""
+        with time_stage("rerank", self.generator.exemplar_trace_id(state.get("trace_id"))):
+            state["documents"] = self.reranker.rerank(state.get("question", ""), state.get("documents", []))
+        return state
+    
+    async def _arerank_node(self, state: RAGState) -> RAGState:
+        """Keep the best candidates for generation (async)"""
+        with time_stage("rerank", self.generator.exemplar_trace_id(state.get("trace_id"))):
+            state["documents"] = await self.reranker.arerank(state.get("question", ""), state.get("documents", []))
+        return state
+    
     def _generate_node(self, state: RAGState) -> RAGState:
         """Generate answer from retrieved documents"""
         question = state.get("question", "")
@@ -80,51 +138,227 @@ class RAGPipeline:
         chat_history = state.get("chat_history", [])
         
         # Generate answer
-        result = self.generator.generate(question, documents, chat_history)
+        result = self.generator.generate(question, documents, chat_history, trace_id=state.get("trace_id"))
         
         state["answer"] = result["answer"]
         state["sources"] = result.get("sources", [])
         
         return state
     
-    def run(
+    async def _agenerate_node(self, state: RAGState) -> RAGState:
+        """Generate answer from retrieved documents (async)"""
+        question = state.get("question", "")
+        documents = state.get("documents", [])
+        chat_history = state.get("chat_history", [])
+        
+        # Token events are pushed on the "custom" stream (see astream_answer)
+        on_token = None
+        if state.get("stream_tokens"):
+            writer = get_stream_writer()
+            
+            def on_token(token: str):
+                writer({"event": "token", "content": token})
+        
+        result = await self.generator.agenerate(
+            question, documents, chat_history, on_token=on_token, trace_id=state.get("trace_id")
+        )
+        
+        state["answer"] = result["answer"]
+        state["sources"] = result.get("sources", [])
+        
+        return state
+    
+    def _initial_state(
         self,
         question: str,
-        chat_history: Optional[List[Dict[str, str]]] = None
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        stream_tokens: bool = False,
+        retrieval_options: Optional[RetrievalOptions] = None,
+        filter: Optional[MetadataFilter] = None,
+        query_vector: Optional[List[float]] = None
     ) -> Dict[str, Any]:
-        """Run the complete RAG pipeline"""
-        initial_state = {
+        """Build the initial workflow state"""
+        return {
             "question": question,
             "chat_history": chat_history or [],
-            "messages": []
+            "messages": [],
+            "stream_tokens": stream_tokens,
+            "retrieval_options": retrieval_options,
+            "filter": filter,
+            "query_vector": query_vector,
+            "trace_id": new_trace_id()
         }
-        
-        # Run workflow
-        final_state = self.workflow.invoke(initial_state)
-        
-        # Get trace_id from generator if available
-        trace_id = final_state.get("trace_id") or self.generator.last_trace_id if hasattr(self.generator, 'last_trace_id') else None
-        
+    
+    def _build_response(self, question: str, final_state: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the pipeline response from the final workflow state"""
         return {
             "question": question,
             "answer": final_state.get("answer", ""),
             "sources": final_state.get("sources", []),
             "model": self.generator.llm_model,
-            "trace_id": trace_id
+            # Only expose ids of traces that were actually sent to Langfuse
+            "trace_id": final_state.get("trace_id") if self.generator.tracing_enabled else None,
+            "cached": False
         }
     
+    def _use_cache(self, chat_history: Optional[List[Dict[str, str]]], use_cache: bool) -> bool:
+        """Follow-up questions depend on the conversation: never served from the cache"""
+        if self.answer_cache is None:
+            return False
+        if not use_cache or chat_history:
+            self.answer_cache.record_bypass()
+            return False
+        return True
+    
+    def _cache_scope(self, retrieval_options: Optional[RetrievalOptions], filter: Optional[MetadataFilter]) -> str:
+        return cache_scope(
+            model=self.generator.llm_model,
+            retrieval_mode=self.retrieval_system.retrieval_mode,
+            options=retrieval_options or RetrievalOptions.from_settings(),
+            filter=filter
+        )
+    
+    @staticmethod
+    def _cache_hit(question: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        # No new trace: the answer was generated by an earlier request
+        return {**result, "question": question, "trace_id": None, "cached": True}
+    
+    def _cache_put(self, key: Optional[Tuple[List[float], str]], question: str, final_state, response):
+        if key is not None and response.get("answer"):
+            self.answer_cache.put(key[0], key[1], question, final_state.get("documents", []), response)
+    
+    def _cache_lookup(
+        self, question, chat_history, retrieval_options, filter, use_cache
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[List[float], str]]]:
+        """(cached result, key to store the answer under on a miss)"""
+        if not self._use_cache(chat_history, use_cache):
+            return None, None
+        # Handed to the retrieval step: the question is embedded once per request
+        vector = self.retrieval_system.embeddings.embed_query(question)
+        scope = self._cache_scope(retrieval_options, filter)
+        result = self.answer_cache.get(vector, scope)
+        return (self._cache_hit(question, result) if result else None), (vector, scope)
+    
+    async def _acache_lookup(
+        self, question, chat_history, retrieval_options, filter, use_cache
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[List[float], str]]]:
+        if not self._use_cache(chat_history, use_cache):
+            return None, None
+        vector = await self.retrieval_system.embeddings.aembed_query(question)
+        scope = self._cache_scope(retrieval_options, filter)
+        # Validation reads the source chunks back from the store
+        result = await run_in_executor(None, self.answer_cache.get, vector, scope)
+        return (self._cache_hit(question, result) if result else None), (vector, scope)
+    
+    def run(
+        self,
+        question: str,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        retrieval_options: Optional[RetrievalOptions] = None,
+        filter: Optional[MetadataFilter] = None,
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """Run the complete RAG pipeline (semantic answer cache first, if configured)"""
+        cached, cache_key = self._cache_lookup(question, chat_history, retrieval_options, filter, use_cache)
+        if cached is not None:
+            return cached
+        # Saturated LLM: shed now rather than after retrieval
+        self.generator.gateway.check()
+        final_state = self.workflow.invoke(
+            self._initial_state(
+                question, chat_history, retrieval_options=retrieval_options, filter=filter,
+                query_vector=cache_key[0] if cache_key else None
+            )
+        )
+        response = self._build_response(question, final_state)
+        self._cache_put(cache_key, question, final_state, response)
+        return response
+    
+    async def arun(
+        self,
+        question: str,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        retrieval_options: Optional[RetrievalOptions] = None,
+        filter: Optional[MetadataFilter] = None,
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """Run the complete RAG pipeline without blocking the event loop"""
+        cached, cache_key = await self._acache_lookup(question, chat_history, retrieval_options, filter, use_cache)
+        if cached is not None:
+            return cached
+        # Saturated LLM: shed now rather than after retrieval
+        self.generator.gateway.check()
+        final_state = await self.workflow.ainvoke(
+            self._initial_state(
+                question, chat_history, retrieval_options=retrieval_options, filter=filter,
+                query_vector=cache_key[0] if cache_key else None
+            )
+        )
+        response = self._build_response(question, final_state)
+        self._cache_put(cache_key, question, final_state, response)
+        return response
+    
     def stream(
         self,
         question: str,
         chat_history: Optional[List[Dict[str, str]]] = None
     ):
         """Stream the RAG pipeline execution"""
-        initial_state = {
-            "question": question,
-            "chat_history": chat_history or [],
-            "messages": []
-        }
-        
-        for state in self.workflow.stream(initial_state):
+        for state in self.workflow.stream(self._initial_state(question, chat_history)):
             yield state
-
+    
+    async def astream(
+        self,
+        question: str,
+        chat_history: Optional[List[Dict[str, str]]] = None
+    ):
+        """Stream the RAG pipeline execution (async)"""
+        async for state in self.workflow.astream(self._initial_state(question, chat_history)):
+            yield state
+    
+    async def astream_answer(
+        self,
+        question: str,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        retrieval_options: Optional[RetrievalOptions] = None,
+        filter: Optional[MetadataFilter] = None,
+        use_cache: bool = True
+    ):
+        """Stream the answer as events: sources, then tokens, then end
+        
+        Yields dicts with an "event" key:
+        - {"event": "sources", "sources": [...]} once the retrieve (or rerank) node is done
+        - {"event": "token", "content": "..."} for every LLM token
+        - {"event": "end", "question", "answer", "sources", "model", "trace_id", "cached"}
+        
+        A cached answer is sent as a single token event.
+        """
+        cached, cache_key = await self._acache_lookup(question, chat_history, retrieval_options, filter, use_cache)
+        if cached is not None:
+            yield {"event": "sources", "sources": cached["sources"]}
+            yield {"event": "token", "content": cached["answer"]}
+            yield {"event": "end", **cached}
+            return
+        self.generator.gateway.check()
+        
+        final_state: Dict[str, Any] = {}
+        documents: List = []
+        initial_state = self._initial_state(
+            question, chat_history, stream_tokens=True, retrieval_options=retrieval_options, filter=filter,
+            query_vector=cache_key[0] if cache_key else None
+        )
+        
+        sources_node = "rerank" if self.reranker is not None else "retrieve"
+        
+        async for mode, chunk in self.workflow.astream(initial_state, stream_mode=["updates", "custom"]):
+            if mode == "custom":
+                yield chunk
+            elif sources_node in chunk:
+                documents = chunk[sources_node].get("documents", [])
+                yield {"event": "sources", "sources": self.generator.format_sources(documents)}
+            elif "generate" in chunk:
+                final_state = chunk["generate"]
+        
+        response = self._build_response(question, final_state)
+        self._cache_put(cache_key, question, {**final_state, "documents": documents}, response)
+        yield {"event": "end", **response}
@@ -0,0 +1,106 @@
+"""Post-retrieval selection: MMR, similarity cutoff and per-source caps"""
+
+from dataclasses import dataclass, replace
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.config import settings
+
+
+@dataclass(frozen=True)
+class RetrievalOptions:
+    """Per-request post-retrieval settings (defaults from settings)"""
+    mmr: bool = False
+    mmr_lambda: float = 0.5  # 1 = relevance only, 0 = diversity only
+    fetch_k: Optional[int] = None  # candidates over-fetched before selection (default: 4 x k)
+    score_threshold: Optional[float] = None  # minimum cosine similarity to the query
+    max_per_source: Optional[int] = None  # at most N chunks per metadata["source"]
+
+    @property
+    def active(self) -> bool:
+        return self.mmr or self.score_threshold is not None or self.max_per_source is not None
+
+    def candidates(self, k: int) -> int:
+        return max(k, self.fetch_k or 4 * k)
+
+    @classmethod
+    def from_settings(cls, **overrides) -> "RetrievalOptions":
+        """Settings defaults, overridden by the non-None values given"""
+        options = cls(
+            mmr=settings.retrieval_mmr_enabled,
+            mmr_lambda=settings.retrieval_mmr_lambda,
+            fetch_k=settings.retrieval_fetch_k,
+            score_threshold=settings.retrieval_score_threshold,
+            max_per_source=settings.retrieval_max_per_source
+        )
+        return replace(options, **{key: value for key, value in overrides.items() if value is not None})
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def select_documents(
+    documents: Sequence[Document],
+    document_vectors: Sequence[Sequence[float]],
+    k: int,
+    options: RetrievalOptions,
+    query_vector: Optional[Sequence[float]] = None
+) -> List[Document]:
+    """Pick up to k documents in one greedy pass over the candidates
+
+    Candidates below score_threshold are dropped, sources that reached
+    max_per_source are masked out, and with mmr each step picks
+    argmax(lambda * sim(q, d) - (1 - lambda) * max sim(d, selected)).
+    Without a query vector (lexical results) relevance follows the input
+    rank and the threshold is not applied.
+    """
+    if not documents:
+        return []
+    vectors = _normalize(np.asarray(document_vectors, dtype=np.float32))
+    n = len(documents)
+
+    if query_vector is not None:
+        relevance = vectors @ _normalize(np.asarray(query_vector, dtype=np.float32))
+    else:
+        relevance = 1.0 - np.arange(n, dtype=np.float32) / n
+
+    available = np.ones(n, dtype=bool)
+    if options.score_threshold is not None and query_vector is not None:
+        available &= relevance >= options.score_threshold
+
+    sources = [doc.metadata.get("source") for doc in documents]
+    source_codes = np.unique(np.array([str(source) for source in sources]), return_inverse=True)[1]
+    per_source = np.zeros(source_codes.max() + 1, dtype=np.int32)
+
+    # Redundancy = max similarity to the documents selected so far
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    selected: List[int] = []
+    while len(selected) < k and available.any():
+        if options.mmr and selected:
+            scores = options.mmr_lambda * relevance - (1 - options.mmr_lambda) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+
+        code = source_codes[best]
+        per_source[code] += 1
+        if options.max_per_source is not None and sources[best] is not None \
+                and per_source[code] >= options.max_per_source:
+            available &= source_codes != code
+        if options.mmr:
+            np.maximum(redundancy, vectors @ vectors[best], out=redundancy)
+
+    results = []
+    for index in selected:
+        doc = documents[index]
+        if query_vector is not None:
+            doc.metadata = {**doc.metadata, "similarity": round(float(relevance[index]), 4)}
+        results.append(doc)
+    return results
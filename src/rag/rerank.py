@@ -0,0 +1,151 @@
+"""Reranking of over-fetched candidates under a per-request time budget"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from src.config import settings
+from src.monitoring.prometheus import record_rerank
+from .lexical import BM25Index
+
+try:
+    from sentence_transformers import CrossEncoder
+    CROSS_ENCODER_AVAILABLE = True
+except ImportError:
+    CROSS_ENCODER_AVAILABLE = False
+    CrossEncoder = None
+
+
+class RerankBudgetExceeded(Exception):
+    """Scoring stopped because the request deadline passed"""
+
+
+class LexicalOverlapScorer:
+    """BM25 over the candidate set only: cheap, no model, no network"""
+
+    name = "lexical"
+
+    def score(self, query: str, texts: Sequence[str], deadline: Optional[float] = None) -> List[float]:
+        index = BM25Index()
+        ids = [str(i) for i in range(len(texts))]
+        index.add(ids, texts)
+        scores = [0.0] * len(texts)
+        for doc_id, score in index.search(query, len(texts)):
+            scores[int(doc_id)] = score
+        return scores
+
+
+class CrossEncoderScorer:
+    """Local cross-encoder on CPU, scored batch by batch until the deadline"""
+
+    name = "cross_encoder"
+
+    def __init__(self, model_name: str, batch_size: int = 16, max_length: int = 512):
+        if not CROSS_ENCODER_AVAILABLE:
+            raise ImportError("sentence-transformers is required for the cross-encoder reranker")
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.batch_size = batch_size
+
+    def score(self, query: str, texts: Sequence[str], deadline: Optional[float] = None) -> List[float]:
+        scores: List[float] = []
+        for offset in range(0, len(texts), self.batch_size):
+            # Stop burning CPU once the caller has given up on us
+            if deadline is not None and time.monotonic() > deadline:
+                raise RerankBudgetExceeded()
+            pairs = [(query, text) for text in texts[offset:offset + self.batch_size]]
+            scores.extend(float(s) for s in self.model.predict(pairs, batch_size=self.batch_size))
+        return scores
+
+
+def create_scorer(scorer_type: Optional[str] = None):
+    """Build the configured scorer; falls back to lexical when no model is available"""
+    scorer_type = scorer_type or settings.rerank_scorer
+    if scorer_type == "lexical":
+        return LexicalOverlapScorer()
+    if scorer_type == "cross_encoder":
+        if CROSS_ENCODER_AVAILABLE:
+            return CrossEncoderScorer(
+                settings.rerank_model,
+                batch_size=settings.rerank_batch_size,
+                max_length=settings.rerank_max_length
+            )
+        print("⚠️  Warning: sentence-transformers not installed, using the lexical reranker")
+        return LexicalOverlapScorer()
+    raise ValueError(f"Unknown rerank scorer: {scorer_type!r} (expected 'lexical' or 'cross_encoder')")
+
+
+class Reranker:
+    """Reorder candidates with a scorer; vector order is kept if the budget runs out"""
+
+    def __init__(
+        self,
+        scorer=None,
+        fetch_k: Optional[int] = None,
+        top_n: Optional[int] = None,
+        budget_seconds: Optional[float] = None,
+        max_workers: int = 2
+    ):
+        self.scorer = scorer or create_scorer()
+        self.fetch_k = fetch_k or settings.rerank_fetch_k
+        self.top_n = top_n or settings.rerank_top_n
+        self.budget_seconds = settings.rerank_budget_seconds if budget_seconds is None else budget_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank")
+
+    def _order(self, documents: List[Document], scores: List[float]) -> List[Document]:
+        # Stable sort: equal scores keep the retrieval order
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+        results = []
+        for i in order[:self.top_n]:
+            doc = documents[i]
+            doc.metadata = {**doc.metadata, "rerank_score": round(scores[i], 4)}
+            results.append(doc)
+        return results
+
+    def _finish(self, documents: List[Document], scores: Optional[List[float]], outcome: str, start: float):
+        record_rerank(self.scorer.name, outcome, time.perf_counter() - start)
+        if scores is None:
+            return documents[:self.top_n]
+        return self._order(documents, scores)
+
+    def rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        """Best top_n candidates, or the first top_n in retrieval order on timeout/error"""
+        if len(documents) <= 1:
+            return documents[:self.top_n]
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.budget_seconds if self.budget_seconds else None
+        texts = [doc.page_content for doc in documents]
+        future = self._executor.submit(self.scorer.score, query, texts, deadline)
+        try:
+            scores = future.result(timeout=self.budget_seconds or None)
+        except (FutureTimeoutError, RerankBudgetExceeded):
+            return self._finish(documents, None, "timeout", start)
+        except Exception as e:
+            print(f"⚠️  Warning: reranking failed ({e}), keeping retrieval order")
+            return self._finish(documents, None, "error", start)
+        return self._finish(documents, scores, "reranked", start)
+
+    async def arerank(self, query: str, documents: List[Document]) -> List[Document]:
+        """Async rerank: scoring runs on the rerank pool, the event loop only waits"""
+        if len(documents) <= 1:
+            return documents[:self.top_n]
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.budget_seconds if self.budget_seconds else None
+        texts = [doc.page_content for doc in documents]
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, self.scorer.score, query, texts, deadline
+        )
+        try:
+            scores = await asyncio.wait_for(future, timeout=self.budget_seconds or None)
+        except (asyncio.TimeoutError, RerankBudgetExceeded):
+            return self._finish(documents, None, "timeout", start)
+        except Exception as e:
+            print(f"⚠️  Warning: reranking failed ({e}), keeping retrieval order")
+            return self._finish(documents, None, "error", start)
+        return self._finish(documents, scores, "reranked", start)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
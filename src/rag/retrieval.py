@@ -1,9 +1,19 @@
 """Retrieval system for vector search"""
 
-from typing import List, Optional
+import asyncio
+import contextvars
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+import httpx
+import openai
 from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore, VectorStore
 try:
     from langchain.retrievers import ContextualCompressionRetriever
     from langchain.retrievers.document_compressors import LLMChainExtractor
@@ -14,18 +24,52 @@ except ImportError:
     LLMChainExtractor = None
 from langchain_openai import ChatOpenAI
 from src.config import settings
+from .embedding_cache import CachedEmbeddings, DocumentEmbeddingStore, QueryEmbeddingCache
+from .embedding_writer import BatchedEmbeddingWriter
+from .lexical import BM25Index, reciprocal_rank_fusion
+from .metadata_index import MetadataFilter, matches, normalize_filter, to_chroma_where
+from .postprocess import RetrievalOptions, select_documents
+from .vector_stores import FaissVectorStore, create_vector_store
+from src.monitoring.prometheus import record_lexical_fallback, time_stage
+from src.monitoring.telemetry import telemetry
 
-try:
-    import mlflow
-    MLFLOW_AVAILABLE = True
-except ImportError:
-    MLFLOW_AVAILABLE = False
-    class MockMLflow:
-        @staticmethod
-        def log_param(*args, **kwargs): pass
-        @staticmethod
-        def log_metric(*args, **kwargs): pass
-    mlflow = MockMLflow()
+# Embedding service slow or unreachable: serve BM25 instead. Anything else
+# (bugs, store errors, bad requests) propagates instead of hiding behind BM25.
+EMBEDDING_UNAVAILABLE_ERRORS = (
+    TimeoutError,  # also concurrent.futures and asyncio timeouts
+    ConnectionError,
+    httpx.TransportError,
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class TimedQueryEmbeddings(Embeddings):
+    """Times query embeddings (cache hits included) as the query_embedding stage"""
+    
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+    
+    def __getattr__(self, name: str) -> Any:
+        # embed_queries, query_cache... of the wrapped embeddings
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        with time_stage("query_embedding"):
+            return self.embeddings.embed_query(text)
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        with time_stage("query_embedding"):
+            return await self.embeddings.aembed_query(text)
 
 
 class RetrievalSystem:
@@ -34,29 +78,77 @@ class RetrievalSystem:
     def __init__(
         self,
         embedding_model: Optional[str] = None,
-        vector_store: Optional[Chroma] = None,
+        vector_store: Optional[VectorStore] = None,
         top_k: int = 5,
-        use_compression: bool = False
+        use_compression: bool = False,
+        embeddings: Optional[Embeddings] = None
     ):
         self.embedding_model_name = embedding_model or settings.embedding_model
         self.top_k = top_k
         self.use_compression = use_compression
         
         # Initialize embeddings
-        self.embeddings = OpenAIEmbeddings(
-            model=self.embedding_model_name,
-            openai_api_key=settings.openai_api_key
+        if embeddings is None:
+            embeddings = OpenAIEmbeddings(
+                model=self.embedding_model_name,
+                openai_api_key=settings.openai_api_key
+            )
+        
+        # Cache query embeddings and chunk embeddings in front of the embedding API
+        self.query_cache: Optional[QueryEmbeddingCache] = None
+        if settings.query_embedding_cache_enabled:
+            self.query_cache = QueryEmbeddingCache(
+                model_name=self.embedding_model_name,
+                max_bytes=settings.query_embedding_cache_max_bytes,
+                ttl_seconds=settings.query_embedding_cache_ttl_seconds,
+                persist_path=settings.query_embedding_cache_path
+            )
+        
+        self.document_store: Optional[DocumentEmbeddingStore] = None
+        if settings.ingest_embedding_cache_enabled:
+            self.document_store = DocumentEmbeddingStore(
+                path=settings.ingest_embedding_cache_path or os.path.join(
+                    settings.chroma_persist_directory, "embedding_cache.sqlite"
+                ),
+                model_name=self.embedding_model_name
+            )
+        
+        if self.query_cache is not None or self.document_store is not None:
+            embeddings = CachedEmbeddings(embeddings, self.query_cache, self.document_store)
+        # Stores built here embed queries through it: the stage is timed with or without caches
+        self.embeddings = TimedQueryEmbeddings(embeddings)
+        
+        # Token-packed, concurrent embedding requests for ingestion
+        self.writer = BatchedEmbeddingWriter(
+            self.embeddings,
+            model_name=self.embedding_model_name,
+            max_tokens_per_request=settings.embedding_batch_max_tokens,
+            max_inputs_per_request=settings.embedding_batch_max_inputs,
+            max_concurrency=settings.embedding_max_concurrency,
+            max_retries=settings.embedding_max_retries,
+            write_batch_size=settings.vector_store_write_batch_size,
+            tokens_per_minute=settings.embedding_tokens_per_minute
         )
         
-        # Initialize or use existing vector store
+        # Initialize or use existing vector store (backend from settings.vector_store_type)
         if vector_store is None:
-            self.vector_store = Chroma(
-                persist_directory=settings.chroma_persist_directory,
-                embedding_function=self.embeddings
-            )
+            self.vector_store = create_vector_store(self.embeddings)
         else:
             self.vector_store = vector_store
         
+        # BM25 index maintained alongside the vector store (hybrid retrieval,
+        # lexical fallback). Persisted next to the configured store only.
+        self.retrieval_mode = settings.retrieval_mode
+        self.lexical_index: Optional[BM25Index] = None
+        self.lexical_index_path: Optional[str] = settings.lexical_index_path
+        if vector_store is None and self.lexical_index_path is None:
+            self.lexical_index_path = os.path.join(settings.chroma_persist_directory, "bm25_index.npz")
+        if settings.lexical_index_enabled or self.retrieval_mode != "vector":
+            self.lexical_index = self._load_lexical_index()
+        self._vector_unavailable_until = 0.0
+        self._search_executor: Optional[ThreadPoolExecutor] = None
+        self._write_listeners: List[Callable[[List[str]], None]] = []
+        
         # Setup retriever
         self.retriever = self.vector_store.as_retriever(
             search_kwargs={"k": self.top_k}
@@ -77,47 +169,506 @@ class RetrievalSystem:
         elif use_compression and not COMPRESSION_AVAILABLE:
             print("Warning: Compression retriever not available, using standard retriever")
     
-    def add_documents(self, documents: List[Document]) -> List[str]:
-        """Add documents to the vector store"""
-        ids = self.vector_store.add_documents(documents)
+    def _load_lexical_index(self) -> BM25Index:
+        """Load the persisted BM25 index, or rebuild it from the vector store"""
+        if self.lexical_index_path and os.path.exists(self.lexical_index_path):
+            try:
+                return BM25Index.load(self.lexical_index_path)
+            except Exception as e:
+                print(f"⚠️  Warning: Could not load BM25 index, rebuilding: {e}")
+        
+        index = BM25Index()
+        if self.lexical_index_path:
+            for batch in self._iter_store_texts():
+                index.add([doc_id for doc_id, _ in batch], [text for _, text in batch])
+        return index
+    
+    def _iter_store_texts(self, batch_size: int = 1000):
+        """Batches of (id, text) already in the vector store"""
+        if isinstance(self.vector_store, FaissVectorStore):
+            yield from self.vector_store.docstore.iter_texts(batch_size)
+        elif isinstance(self.vector_store, Chroma):
+            offset = 0
+            while True:
+                batch = self.vector_store.get(include=["documents"], limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    return
+                yield list(zip(batch["ids"], batch["documents"]))
+                offset += len(batch["ids"])
+    
+    def add_write_listener(self, listener: Callable[[List[str]], None]):
+        """Call listener(ids) after every upsert or delete (e.g. cache invalidation)"""
+        self._write_listeners.append(listener)
+    
+    def _notify_write(self, ids: List[str]):
+        for listener in self._write_listeners:
+            try:
+                listener(ids)
+            except Exception as e:
+                print(f"⚠️  Warning: Index write listener failed: {e}")
+    
+    def _accepts_embeddings(self) -> bool:
+        """Whether the vector store can be written with precomputed embeddings"""
+        return isinstance(self.vector_store, Chroma) or hasattr(self.vector_store, "add_embeddings")
+    
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """Add documents to the vector store (upsert when ids are given)"""
+        if self._accepts_embeddings():
+            # Embeddings batched by token budget, then bulk upserts
+            return self.writer.write(self, documents, ids=ids)
         
-        mlflow.log_metric("documents_added", len(ids))
+        if ids is not None:
+            ids = self.vector_store.add_documents(documents, ids=ids)
+        else:
+            ids = self.vector_store.add_documents(documents)
+        
+        if self.lexical_index is not None:
+            self.lexical_index.add(ids, [doc.page_content for doc in documents])
+        self._notify_write(ids)
+        
+        telemetry.record("indexing", "documents_added", len(ids))
         return ids
     
-    def similarity_search(
+    def add_embedded_documents(
+        self,
+        documents: List[Document],
+        vectors: List[List[float]],
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """Upsert documents whose embeddings were already computed"""
+        if ids is None:
+            ids = [doc.id or str(uuid.uuid4()) for doc in documents]
+        
+        if isinstance(self.vector_store, Chroma):
+            # Chroma rejects empty metadata dicts: upsert both groups separately
+            with_metadata = [i for i, doc in enumerate(documents) if doc.metadata]
+            without_metadata = [i for i, doc in enumerate(documents) if not doc.metadata]
+            if with_metadata:
+                self.vector_store._collection.upsert(
+                    ids=[ids[i] for i in with_metadata],
+                    embeddings=[vectors[i] for i in with_metadata],
+                    documents=[documents[i].page_content for i in with_metadata],
+                    metadatas=[documents[i].metadata for i in with_metadata]
+                )
+            if without_metadata:
+                self.vector_store._collection.upsert(
+                    ids=[ids[i] for i in without_metadata],
+                    embeddings=[vectors[i] for i in without_metadata],
+                    documents=[documents[i].page_content for i in without_metadata]
+                )
+        elif hasattr(self.vector_store, "add_embeddings"):
+            self.vector_store.add_embeddings(
+                text_embeddings=[(doc.page_content, vector) for doc, vector in zip(documents, vectors)],
+                metadatas=[doc.metadata for doc in documents],
+                ids=ids
+            )
+        else:
+            # Store without a precomputed-embeddings API: it embeds again
+            # (served by the document embedding cache when enabled)
+            self.vector_store.add_documents(documents, ids=ids)
+        
+        if self.lexical_index is not None:
+            self.lexical_index.add(ids, [doc.page_content for doc in documents])
+        self._notify_write(ids)
+        
+        telemetry.record("indexing", "documents_added", len(ids))
+        return ids
+    
+    def flush(self):
+        """Persist pending writes (FAISS index file, BM25 index; Chroma writes through)"""
+        if hasattr(self.vector_store, "flush"):
+            self.vector_store.flush()
+        if self.lexical_index is not None and self.lexical_index.dirty and self.lexical_index_path:
+            self.lexical_index.save(self.lexical_index_path)
+    
+    def delete(self, ids: List[str]):
+        """Delete documents from the vector store by id"""
+        if ids:
+            self.vector_store.delete(ids=ids)
+            if self.lexical_index is not None:
+                self.lexical_index.delete(ids)
+            self._notify_write(ids)
+    
+    def lexical_search(
         self,
         query: str,
-        k: Optional[int] = None
+        k: Optional[int] = None,
+        filter: Optional[MetadataFilter] = None
     ) -> List[Document]:
-        """Perform similarity search"""
+        """BM25 search; documents are fetched back from the vector store (no embedding call)
+        
+        The BM25 index has no metadata: filtered searches over-fetch and
+        post-filter until k matches are found or the hits run out.
+        """
         k = k or self.top_k
+        if self.lexical_index is None:
+            return []
+        fetch = 4 * k if filter else k
+        while True:
+            hits = self.lexical_index.search(query, fetch)
+            if not hits:
+                return []
+            by_id = {doc.id: doc for doc in self.vector_store.get_by_ids([doc_id for doc_id, _ in hits])}
+            results = []
+            for doc_id, score in hits:
+                doc = by_id.get(doc_id)
+                if doc is not None and (not filter or matches(doc.metadata, filter)):
+                    doc.metadata = {**doc.metadata, "bm25_score": round(score, 4)}
+                    results.append(doc)
+            if len(results) >= k or len(hits) < fetch:
+                return results[:k]
+            fetch *= 4
+    
+    def _lexical_available(self) -> bool:
+        return self.lexical_index is not None and len(self.lexical_index) > 0
+    
+    def _store_filter(self, filter: Optional[MetadataFilter]) -> Any:
+        """Filter in the vector store's native form (pre-filtering inside the store)"""
+        if not filter:
+            return None
+        if isinstance(self.vector_store, Chroma):
+            return to_chroma_where(filter)
+        if isinstance(self.vector_store, InMemoryVectorStore):
+            return lambda doc: matches(doc.metadata, filter)
+        return filter
+    
+    def _search_kwargs(self, k: int, filter: Optional[MetadataFilter]) -> dict:
+        store_filter = self._store_filter(filter)
+        return {"k": k, "filter": store_filter} if store_filter is not None else {"k": k}
+    
+    @property
+    def _compressing(self) -> bool:
+        """The compression retriever works on the query text (hybrid bypasses it)"""
+        return (
+            COMPRESSION_AVAILABLE and self.retrieval_mode != "hybrid"
+            and isinstance(self.retriever, ContextualCompressionRetriever)
+        )
+    
+    def _vector_search_fn(
+        self,
+        query: str,
+        k: int,
+        filter: Optional[MetadataFilter] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> Callable[[], Tuple[List[Document], Optional[List[float]]]]:
+        """(candidates, query vector): the query is embedded at most once per request"""
+        if self._compressing:
+            return lambda: (self._retrieve(query, k, filter), query_vector)
         
+        def search():
+            vector = query_vector if query_vector is not None else self.embeddings.embed_query(query)
+            return self.vector_store.similarity_search_by_vector(vector, **self._search_kwargs(k, filter)), vector
+        return search
+    
+    async def _avector_search(
+        self,
+        query: str,
+        k: int,
+        filter: Optional[MetadataFilter] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> Tuple[List[Document], Optional[List[float]]]:
+        if self._compressing:
+            # ainvoke uses the async embedding client; stores without native
+            # async support are run in the default executor by LangChain
+            return await self.retriever.ainvoke(query, **self._search_kwargs(k, filter)), query_vector
+        if query_vector is None:
+            query_vector = await self.embeddings.aembed_query(query)
+        documents = await self.vector_store.asimilarity_search_by_vector(query_vector, **self._search_kwargs(k, filter))
+        return documents, query_vector
+    
+    def _retrieve(self, query: str, k: int, filter: Optional[MetadataFilter] = None) -> List[Document]:
+        # k and filter override the retriever's search_kwargs (also through compression)
         # Utiliser invoke pour les nouvelles versions de LangChain
         try:
-            results = self.retriever.invoke(query)
+            return self.retriever.invoke(query, **self._search_kwargs(k, filter))
         except AttributeError:
             # Fallback pour les anciennes versions
-            results = self.retriever.get_relevant_documents(query)
+            return self.retriever.get_relevant_documents(query, **self._search_kwargs(k, filter))
+    
+    def _fallback_to_lexical(self, error: Exception):
+        """Embedding service slow or down: serve BM25 only for a cooldown period"""
+        self._vector_unavailable_until = time.monotonic() + settings.lexical_fallback_cooldown_seconds
+        record_lexical_fallback("timeout" if isinstance(error, (TimeoutError, openai.APITimeoutError)) else "unavailable")
+        print(f"⚠️  Warning: Vector search unavailable ({type(error).__name__}: {error}), using BM25 results")
+    
+    def _combine(self, vector: Optional[List[Document]], lexical: List[Document], k: int) -> List[Document]:
+        if vector is None:
+            return lexical[:k]
+        if self.retrieval_mode == "hybrid":
+            return reciprocal_rank_fusion(
+                [vector, lexical],
+                weights=[settings.hybrid_vector_weight, settings.hybrid_lexical_weight],
+                rrf_k=settings.hybrid_rrf_k
+            )[:k]
+        return vector
+    
+    def similarity_search(
+        self,
+        query: str,
+        k: Optional[int] = None,
+        options: Optional[RetrievalOptions] = None,
+        filter: Optional[MetadataFilter] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> List[Document]:
+        """Perform similarity search (vector, hybrid or lexical, per retrieval_mode)
+        
+        With active options, candidates are over-fetched then reduced to k by
+        MMR / score threshold / per-source caps. filter restricts the search
+        to chunks whose metadata match ({"source": "a.pdf", "tenant": ["x", "y"]}).
+        query_vector: embedding of query if the caller already has it (answer cache).
+        """
+        k = k or self.top_k
+        options = options or RetrievalOptions.from_settings()
+        normalize_filter(filter)  # ValueError on malformed filters
+        
+        if options.active:
+            candidates, query_vector = self._search(query, options.candidates(k), filter, query_vector)
+            with time_stage("postprocess"):
+                results = self._postprocess(query, candidates, k, options, query_vector)
+        else:
+            results, _ = self._search(query, k, filter, query_vector)
+        
+        # Raw queries are not logged (cardinality, PII): only the result count
+        telemetry.record("retrieval", "results_count", len(results))
+        
+        return results
+    
+    def _search(
+        self, query: str, k: int, filter: Optional[MetadataFilter] = None, query_vector: Optional[List[float]] = None
+    ) -> Tuple[List[Document], Optional[List[float]]]:
+        with time_stage("vector_search"):
+            return self._search_store(query, k, filter, query_vector)
+    
+    def _search_store(
+        self, query: str, k: int, filter: Optional[MetadataFilter] = None, query_vector: Optional[List[float]] = None
+    ) -> Tuple[List[Document], Optional[List[float]]]:
+        """(results, query vector if it was computed)"""
+        if self.retrieval_mode == "lexical":
+            results = self.lexical_search(query, k, filter)
+        elif not self._lexical_available():
+            results, query_vector = self._vector_search_fn(query, k, filter, query_vector)()
+        else:
+            hybrid = self.retrieval_mode == "hybrid"
+            fetch_k = 2 * k if hybrid else k
+            vector = None
+            if time.monotonic() >= self._vector_unavailable_until:
+                try:
+                    vector, query_vector = self._vector_search_with_timeout(
+                        self._vector_search_fn(query, fetch_k, filter, query_vector)
+                    )
+                except EMBEDDING_UNAVAILABLE_ERRORS as e:
+                    self._fallback_to_lexical(e)
+            lexical = self.lexical_search(query, fetch_k, filter) if hybrid or vector is None else []
+            results = self._combine(vector, lexical, k)
+        return results, query_vector
+    
+    def _vector_search_with_timeout(self, search: Callable[[], Any]) -> Any:
+        """Run the vector search, raising TimeoutError past lexical_fallback_timeout_seconds"""
+        timeout = settings.lexical_fallback_timeout_seconds
+        if not timeout:
+            return search()
+        if self._search_executor is None:
+            self._search_executor = ThreadPoolExecutor(
+                max_workers=settings.lexical_fallback_workers, thread_name_prefix="vector-search"
+            )
+        # The context carries the trace id to the query embedding stage
+        return self._search_executor.submit(contextvars.copy_context().run, search).result(timeout=timeout)
+    
+    async def asimilarity_search(
+        self,
+        query: str,
+        k: Optional[int] = None,
+        options: Optional[RetrievalOptions] = None,
+        filter: Optional[MetadataFilter] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> List[Document]:
+        """Perform similarity search without blocking the event loop"""
+        k = k or self.top_k
+        options = options or RetrievalOptions.from_settings()
+        normalize_filter(filter)
+        
+        if options.active:
+            candidates, query_vector = await self._asearch(query, options.candidates(k), filter, query_vector)
+            with time_stage("postprocess"):
+                results = await asyncio.get_running_loop().run_in_executor(
+                    None, self._postprocess, query, candidates, k, options, query_vector
+                )
+        else:
+            results, _ = await self._asearch(query, k, filter, query_vector)
+        
+        telemetry.record("retrieval", "results_count", len(results))
+        
+        return results
+    
+    async def _asearch(
+        self, query: str, k: int, filter: Optional[MetadataFilter] = None, query_vector: Optional[List[float]] = None
+    ) -> Tuple[List[Document], Optional[List[float]]]:
+        with time_stage("vector_search"):
+            return await self._asearch_store(query, k, filter, query_vector)
+    
+    async def _asearch_store(
+        self, query: str, k: int, filter: Optional[MetadataFilter] = None, query_vector: Optional[List[float]] = None
+    ) -> Tuple[List[Document], Optional[List[float]]]:
+        loop = asyncio.get_running_loop()
+        
+        if self.retrieval_mode == "lexical":
+            results = await loop.run_in_executor(None, self.lexical_search, query, k, filter)
+        elif not self._lexical_available():
+            results, query_vector = await self._avector_search(query, k, filter, query_vector)
+        else:
+            hybrid = self.retrieval_mode == "hybrid"
+            fetch_k = 2 * k if hybrid else k
+            vector = None
+            if time.monotonic() >= self._vector_unavailable_until:
+                try:
+                    vector, query_vector = await asyncio.wait_for(
+                        self._avector_search(query, fetch_k, filter, query_vector),
+                        timeout=settings.lexical_fallback_timeout_seconds or None
+                    )
+                except EMBEDDING_UNAVAILABLE_ERRORS as e:
+                    self._fallback_to_lexical(e)
+            lexical = []
+            if hybrid or vector is None:
+                lexical = await loop.run_in_executor(None, self.lexical_search, query, fetch_k, filter)
+            results = self._combine(vector, lexical, k)
+        return results, query_vector
+    
+    def _document_vectors(self, documents: List[Document]) -> List[List[float]]:
+        """Embeddings of retrieved chunks: read from the vector store, else from the embedding cache"""
+        vectors: dict = {}
+        ids = [doc.id for doc in documents if doc.id]
+        if ids and isinstance(self.vector_store, Chroma):
+            found = self.vector_store._collection.get(ids=ids, include=["embeddings"])
+            vectors = dict(zip(found["ids"], found["embeddings"]))
+        elif ids and isinstance(self.vector_store, FaissVectorStore):
+            vectors = {doc_id: vector.tolist() for doc_id, vector in self.vector_store.get_vectors(ids).items()}
+        missing = [doc for doc in documents if doc.id not in vectors]
+        if missing:
+            # Chunks were embedded at ingestion: served by the document embedding store
+            embedded = self.embeddings.embed_documents([doc.page_content for doc in missing])
+            for doc, vector in zip(missing, embedded):
+                vectors[doc.id or doc.page_content] = vector
+        return [vectors[doc.id] if doc.id in vectors else vectors[doc.page_content] for doc in documents]
+    
+    def _query_vector(self, query: str) -> Optional[List[float]]:
+        """Query embedding for post-processing, when the search did not compute it"""
+        if self.retrieval_mode == "lexical" or time.monotonic() < self._vector_unavailable_until:
+            return None
+        try:
+            return self.embeddings.embed_query(query)
+        except Exception as e:
+            print(f"⚠️  Warning: Could not embed query for post-processing: {e}")
+            return None
+    
+    def _postprocess(
+        self,
+        query: str,
+        candidates: List[Document],
+        k: int,
+        options: RetrievalOptions,
+        query_vector: Optional[List[float]] = None
+    ) -> List[Document]:
+        if not candidates:
+            return []
+        if query_vector is None:
+            query_vector = self._query_vector(query)
+        return select_documents(candidates, self._document_vectors(candidates), k, options, query_vector)
+    
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """All queries in one embedding request (query cache hits excluded)"""
+        with time_stage("query_embedding"):
+            if hasattr(self.embeddings, "embed_queries"):
+                return self.embeddings.embed_queries(queries)
+            return self.embeddings.embed_documents(queries)
+    
+    def search_by_vectors(
+        self,
+        vectors: List[List[float]],
+        k: int,
+        filter: Optional[MetadataFilter] = None
+    ) -> List[List[Document]]:
+        """One vectorized search for a matrix of query vectors"""
+        if isinstance(self.vector_store, FaissVectorStore):
+            return [[doc for doc, _ in rows] for rows in self.vector_store.search_vectors(vectors, k, filter=filter)]
+        if isinstance(self.vector_store, Chroma):
+            found = self.vector_store._collection.query(
+                query_embeddings=vectors,
+                n_results=k,
+                where=to_chroma_where(filter),
+                include=["documents", "metadatas"]
+            )
+            return [
+                [
+                    Document(id=doc_id, page_content=text, metadata=metadata or {})
+                    for doc_id, text, metadata in zip(ids, texts, metadatas)
+                ]
+                for ids, texts, metadatas in zip(found["ids"], found["documents"], found["metadatas"])
+            ]
+        # Generic stores: one search per vector, still without embedding calls
+        return [
+            self.vector_store.similarity_search_by_vector(vector, **self._search_kwargs(k, filter))
+            for vector in vectors
+        ]
+    
+    def similarity_search_batch(
+        self,
+        queries: List[str],
+        k: Optional[int] = None,
+        options: Optional[RetrievalOptions] = None,
+        filter: Optional[MetadataFilter] = None
+    ) -> List[List[Document]]:
+        """Search many queries with one embedding request and one matrix search"""
+        k = k or self.top_k
+        options = options or RetrievalOptions.from_settings()
+        normalize_filter(filter)
+        if not queries:
+            return []
+        
+        select_k = options.candidates(k) if options.active else k
+        query_vectors: List[Optional[List[float]]] = [None] * len(queries)
+        if self.retrieval_mode == "lexical":
+            results = [self.lexical_search(query, select_k, filter) for query in queries]
+        else:
+            hybrid = self.retrieval_mode == "hybrid" and self._lexical_available()
+            fetch_k = 2 * select_k if hybrid else select_k
+            try:
+                query_vectors = self._embed_queries(queries)
+                vector_results = self.search_by_vectors(query_vectors, fetch_k, filter)
+            except EMBEDDING_UNAVAILABLE_ERRORS as e:
+                if not self._lexical_available():
+                    raise
+                self._fallback_to_lexical(e)
+                vector_results = [None] * len(queries)
+            results = [
+                self._combine(
+                    vector,
+                    self.lexical_search(query, fetch_k, filter) if hybrid or vector is None else [],
+                    select_k
+                )
+                for query, vector in zip(queries, vector_results)
+            ]
         
-        # Log to MLflow (si disponible)
-        if MLFLOW_AVAILABLE:
-            mlflow.log_param("search_query", query)
-            mlflow.log_metric("results_count", len(results))
+        if options.active:
+            results = [
+                self._postprocess(query, candidates, k, options, query_vector)
+                for query, candidates, query_vector in zip(queries, results, query_vectors)
+            ]
         
+        telemetry.record("retrieval", "batch_queries_count", len(queries))
         return results
     
     def similarity_search_with_score(
         self,
         query: str,
-        k: Optional[int] = None
+        k: Optional[int] = None,
+        filter: Optional[MetadataFilter] = None
     ) -> List[tuple[Document, float]]:
         """Perform similarity search with scores"""
         k = k or self.top_k
         
-        results = self.vector_store.similarity_search_with_score(query, k=k)
+        results = self.vector_store.similarity_search_with_score(query, **self._search_kwargs(k, filter))
         
-        mlflow.log_param("search_query", query)
-        mlflow.log_metric("results_count", len(results))
+        telemetry.record("retrieval", "results_count", len(results))
         
         return results
     
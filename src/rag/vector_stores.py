@@ -0,0 +1,864 @@
+"""Vector store backends (selected by settings.vector_store_type)"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.vectorstores import VectorStore
+
+from src.config import settings
+from .metadata_index import MetadataFilter, MetadataIndex, bitmap_count, bitmap_to_bytes, matches
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+    faiss = None
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    # Windows: the single-writer rule is documented, not enforced
+    FCNTL_AVAILABLE = False
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+QUANTIZATIONS = ("none", "fp16", "int8", "pq")
+# int8 learns per-dimension ranges: a handful of chunks would clip every later vector
+INT8_TRAINING_VECTORS = 1000
+
+
+def _mmap_flags() -> int:
+    """Read-only mmap; MMAP_IFC also maps flat codes (zero-copy) when available"""
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class _ReadWriteLock:
+    """Many concurrent readers or one writer; waiting writers block new readers"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class FaissDocstore:
+    """Compact docstore: faiss id -> (document id, text, metadata) in SQLite
+
+    Ids are AUTOINCREMENT so a deleted faiss id is never reused (a stale
+    vector left in an index that cannot remove ids never resolves to a new
+    document). Reads go through SQLite's mmap, so workers share the page cache.
+
+    Rows are inserted as pending and marked indexed once the index file that
+    holds their vectors has been written (mark_indexed); rows still pending
+    when the store is reopened belong to a writer that crashed before its
+    flush (drop_pending).
+    """
+
+    # Ids per IN (...) query, below SQLite's bound parameter limit
+    BATCH_SIZE = 500
+
+    def __init__(self, path: str, mmap_bytes: int = 1 << 30):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "faiss_id INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL UNIQUE, "
+            "text TEXT NOT NULL, metadata TEXT, pending INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(docs)")}
+        if "pending" not in columns:
+            # Docstores written before the pending flag: every row is indexed
+            self._db.execute("ALTER TABLE docs ADD COLUMN pending INTEGER NOT NULL DEFAULT 0")
+        self._db.commit()
+
+    def _select_in(self, query: str, column: str, values: Sequence) -> list:
+        """Rows of query for column IN values, one statement per BATCH_SIZE values"""
+        values = list(values)
+        rows = []
+        for start in range(0, len(values), self.BATCH_SIZE):
+            batch = values[start:start + self.BATCH_SIZE]
+            rows.extend(self._db.execute(
+                f"{query} WHERE {column} IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return rows
+
+    def _delete_doc_ids(self, doc_ids: List[str]):
+        for start in range(0, len(doc_ids), self.BATCH_SIZE):
+            batch = doc_ids[start:start + self.BATCH_SIZE]
+            self._db.execute(f"DELETE FROM docs WHERE doc_id IN ({','.join('?' * len(batch))})", batch)
+
+    def upsert(self, doc_ids: List[str], texts: List[str], metadatas: List[dict]) -> Tuple[List[int], List[int]]:
+        """Insert documents (pending), replacing existing ids; return (new faiss ids, replaced faiss ids)"""
+        with self._lock:
+            replaced = self._faiss_ids(doc_ids)
+            if replaced:
+                self._delete_doc_ids(doc_ids)
+            new_ids = []
+            for doc_id, text, metadata in zip(doc_ids, texts, metadatas):
+                cursor = self._db.execute(
+                    "INSERT OR REPLACE INTO docs (doc_id, text, metadata, pending) VALUES (?, ?, ?, 1)",
+                    (doc_id, text, json.dumps(metadata) if metadata else None)
+                )
+                new_ids.append(cursor.lastrowid)
+            self._db.commit()
+        return new_ids, replaced
+
+    def delete(self, doc_ids: List[str]) -> List[int]:
+        """Delete documents, return their faiss ids"""
+        with self._lock:
+            faiss_ids = self._faiss_ids(doc_ids)
+            self._delete_doc_ids(doc_ids)
+            self._db.commit()
+        return faiss_ids
+
+    def mark_indexed(self, faiss_ids: Sequence[int]):
+        """The index file now holds the vectors of these rows"""
+        faiss_ids = [int(faiss_id) for faiss_id in faiss_ids]
+        with self._lock:
+            for start in range(0, len(faiss_ids), self.BATCH_SIZE):
+                batch = faiss_ids[start:start + self.BATCH_SIZE]
+                self._db.execute(
+                    f"UPDATE docs SET pending = 0 WHERE faiss_id IN ({','.join('?' * len(batch))})", batch
+                )
+            self._db.commit()
+
+    def drop_pending(self) -> List[str]:
+        """Delete the rows whose vectors never reached the index file, return their document ids"""
+        with self._lock:
+            doc_ids = [row[0] for row in self._db.execute("SELECT doc_id FROM docs WHERE pending = 1")]
+            self._db.execute("DELETE FROM docs WHERE pending = 1")
+            self._db.commit()
+        return doc_ids
+
+    def _faiss_ids(self, doc_ids: List[str]) -> List[int]:
+        return [row[0] for row in self._select_in("SELECT faiss_id FROM docs", "doc_id", doc_ids)]
+
+    def faiss_id_map(self, doc_ids: Sequence[str]) -> Dict[str, int]:
+        """document id -> faiss id, for the ids that exist"""
+        if not doc_ids:
+            return {}
+        with self._lock:
+            rows = self._select_in("SELECT doc_id, faiss_id FROM docs", "doc_id", doc_ids)
+        return dict(rows)
+
+    def get(self, faiss_ids: Sequence[int]) -> dict:
+        """faiss id -> Document, for the ids that still exist"""
+        if not faiss_ids:
+            return {}
+        with self._lock:
+            rows = self._select_in(
+                "SELECT faiss_id, doc_id, text, metadata FROM docs", "faiss_id",
+                [int(faiss_id) for faiss_id in faiss_ids]
+            )
+        return {
+            faiss_id: Document(id=doc_id, page_content=text, metadata=json.loads(metadata) if metadata else {})
+            for faiss_id, doc_id, text, metadata in rows
+        }
+
+    def get_by_doc_ids(self, doc_ids: Sequence[str]) -> List[Document]:
+        with self._lock:
+            rows = self._select_in("SELECT doc_id, text, metadata FROM docs", "doc_id", doc_ids)
+        return [
+            Document(id=doc_id, page_content=text, metadata=json.loads(metadata) if metadata else {})
+            for doc_id, text, metadata in rows
+        ]
+
+    def iter_metadata(self, batch_size: int = 1000) -> Iterable[List[Tuple[int, dict]]]:
+        """Batches of (faiss id, metadata), in insertion order"""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT faiss_id, metadata FROM docs WHERE faiss_id > ? ORDER BY faiss_id LIMIT ?",
+                    (last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [(faiss_id, json.loads(metadata) if metadata else {}) for faiss_id, metadata in rows]
+
+    def iter_texts(self, batch_size: int = 1000) -> Iterable[List[Tuple[str, str]]]:
+        """Batches of (document id, text), in insertion order"""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT faiss_id, doc_id, text FROM docs WHERE faiss_id > ? ORDER BY faiss_id LIMIT ?",
+                    (last, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [(doc_id, text) for _, doc_id, text in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+
+class FullPrecisionVectors:
+    """float32 copies of the vectors on disk (row = faiss id), read through a read-only memmap
+
+    Used to re-score the candidates of a quantized index exactly. Rows of
+    deleted ids are left in place (ids are never reused).
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._row_bytes = dim * 4
+        self._lock = threading.Lock()
+        self._map: Optional[np.memmap] = None
+        self._mapped_size = 0
+
+    def write(self, faiss_ids: Sequence[int], matrix: np.ndarray):
+        order = np.argsort(faiss_ids)
+        ids = np.asarray(faiss_ids, dtype=np.int64)[order]
+        rows = np.ascontiguousarray(matrix[order], dtype=np.float32)
+        with self._lock, open(self.path, "r+b" if os.path.exists(self.path) else "w+b") as f:
+            # AUTOINCREMENT ids: a batch is usually one contiguous run
+            start = 0
+            for end in range(1, len(ids) + 1):
+                if end == len(ids) or ids[end] != ids[end - 1] + 1:
+                    f.seek(int(ids[start]) * self._row_bytes)
+                    f.write(rows[start:end].tobytes())
+                    start = end
+
+    def read(self, faiss_ids: np.ndarray) -> np.ndarray:
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        with self._lock:
+            if size != self._mapped_size:
+                self._map = np.memmap(self.path, dtype=np.float32, mode="r", shape=(size // self._row_bytes, self.dim))
+                self._mapped_size = size
+            mapped = self._map
+        rows = len(mapped) if mapped is not None else 0
+        if len(faiss_ids) and int(np.max(faiss_ids)) >= rows:
+            # Another row would silently re-score the wrong vector
+            raise RuntimeError(
+                f"{self.path} has {rows} rows, no vector for faiss id {int(np.max(faiss_ids))}: rebuild the index"
+            )
+        return mapped[faiss_ids] if rows else np.zeros((0, self.dim), dtype=np.float32)
+
+
+class FaissVectorStore(VectorStore):
+    """FAISS vector store persisted as an index file plus a SQLite docstore
+
+    Vectors are L2-normalized and searched by inner product (cosine
+    similarity; higher scores are better). The index file is memory-mapped
+    read-only at startup so several uvicorn workers on a node share one copy
+    through the page cache. The first write switches to a private in-memory
+    copy; flush() persists it atomically and other workers pick it up within
+    reload_interval seconds.
+
+    index_type:
+        flat: exact search.
+        ivf:  inverted lists (nprobe lists visited).
+        hnsw: graph index; it cannot remove ids, so deleted vectors stay in the
+              index and are filtered out through the docstore.
+
+    quantization (codes held in the index):
+        none: float32 (4 bytes per dimension).
+        fp16: half precision (2 bytes per dimension).
+        int8: scalar quantization with learned per-dimension ranges
+              (1 byte per dimension).
+        pq:   product quantization, pq_m codes of pq_nbits bits per vector.
+
+    IVF and PQ learn centroids, int8 value ranges: until the corpus holds
+    ~39 points per centroid (39 x nlist, 39 x 2^pq_nbits) or
+    INT8_TRAINING_VECTORS vectors, they are kept in an exact flat index,
+    then the configured index is trained on all of them.
+    With a quantized index the float32 vectors are also written to
+    vectors.f32; the rescore_factor x k best candidates are re-scored
+    exactly from that memmapped file (only those rows are paged in).
+
+    Metadata filters on metadata_fields are answered by an in-memory bitmap
+    index over faiss ids, handed to FAISS as an IDSelector: only matching
+    vectors are scored. Conditions on other fields are post-filtered.
+
+    FAISS indexes are not safe for concurrent reads and writes: searches
+    share a read lock, add/delete take it exclusively. Across processes
+    there is a single writer: the first write takes an exclusive lock on
+    index.lock (reloading the index if another process flushed it since),
+    held until flush(). A second process writing meanwhile gets a
+    RuntimeError, so ingestion must run from one worker at a time.
+    Documents added but not flushed when the writer died are dropped from
+    the docstore on the next open and listed in dropped_ids.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        directory: str,
+        index_type: str = "flat",
+        mmap: bool = True,
+        nlist: int = 1024,
+        nprobe: int = 16,
+        hnsw_m: int = 32,
+        hnsw_ef_construction: int = 200,
+        hnsw_ef_search: int = 128,
+        reload_interval: float = 5.0,
+        metadata_fields: Sequence[str] = ("source",),
+        quantization: str = "none",
+        pq_m: int = 64,
+        pq_nbits: int = 8,
+        rescore_factor: int = 4
+    ):
+        if not FAISS_AVAILABLE:
+            raise ImportError("faiss is not installed: pip install faiss-cpu")
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown FAISS index type {index_type!r} (expected one of {INDEX_TYPES})")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown FAISS quantization {quantization!r} (expected one of {QUANTIZATIONS})")
+
+        self.embedding = embedding
+        self.directory = directory
+        self.index_type = index_type
+        self.mmap = mmap
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.reload_interval = reload_interval
+        self.metadata_fields = tuple(metadata_fields)
+        self.quantization = quantization
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.rescore_factor = rescore_factor
+
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.faiss")
+        self.lock_path = os.path.join(directory, "index.lock")
+        self._writer_fd: Optional[int] = None
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self._full_vectors: Optional[FullPrecisionVectors] = None
+        self.docstore = FaissDocstore(os.path.join(directory, "docstore.sqlite"))
+
+        self._lock = threading.RLock()  # writers (and reloads) of this process
+        self._rw = _ReadWriteLock()  # searches vs in-place index writes
+        self._index = None
+        self._mapped = False  # index is a read-only mmap of index_path
+        self._dirty = False
+        self._unflushed: List[int] = []  # faiss ids added since the last flush
+        self._loaded_mtime: Optional[int] = None
+        self._last_reload_check = 0.0
+        self._load()
+        self.dropped_ids = self._drop_unflushed()
+        self.metadata_index = self._build_metadata_index()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    # ------------------------------------------------------------------
+    # Index lifecycle
+    # ------------------------------------------------------------------
+
+    def _load(self, writable: bool = False):
+        if not os.path.exists(self.index_path):
+            return
+        mtime = os.stat(self.index_path).st_mtime_ns
+        if writable or not self.mmap:
+            index = faiss.read_index(self.index_path)
+            self._mapped = False
+        else:
+            index = faiss.read_index(self.index_path, _mmap_flags())
+            self._mapped = True
+        self._configure(index)
+        self._index = index
+        self._loaded_mtime = mtime
+        if self._full_vectors is None and os.path.exists(self.vectors_path):
+            self._full_vectors = FullPrecisionVectors(self.vectors_path, index.d)
+
+    def _drop_unflushed(self) -> List[str]:
+        """Forget documents added by a writer that died before flush(), return their ids
+
+        Their vectors are not in the index file, so keeping the rows would
+        report them as indexed. Skipped while another process holds the
+        writer lock: its pending rows are still on their way to the index.
+        """
+        try:
+            self._acquire_writer()
+        except RuntimeError:
+            return []
+        try:
+            dropped = self.docstore.drop_pending()
+        finally:
+            self._release_writer()
+        if dropped:
+            print(f"⚠️  Warning: {len(dropped)} document(s) of an interrupted ingestion were not in {self.index_path}")
+        return dropped
+
+    def _build_metadata_index(self) -> MetadataIndex:
+        metadata_index = MetadataIndex(self.metadata_fields)
+        for rows in self.docstore.iter_metadata():
+            metadata_index.add([faiss_id for faiss_id, _ in rows], [metadata for _, metadata in rows])
+        return metadata_index
+
+    def _configure(self, index):
+        """Apply search-time parameters"""
+        inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+        if isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = self.nprobe
+        elif isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = self.hnsw_ef_search
+
+    def _pq_params(self, dim: int) -> Tuple[int, int]:
+        # pq_m must divide the dimension
+        m = max(d for d in range(1, min(self.pq_m, dim) + 1) if dim % d == 0)
+        if m != self.pq_m:
+            print(f"⚠️  Warning: PQ with {m} codes instead of {self.pq_m} ({dim} dims)")
+        return m, self.pq_nbits
+
+    def _training_size(self) -> int:
+        """Vectors needed to train the index (0: no centroids to learn)"""
+        # Classic rule of thumb: at least ~39 training points per centroid
+        size = 39 * self.nlist if self.index_type == "ivf" else 0
+        if self.quantization == "pq":
+            size = max(size, 39 * 2 ** self.pq_nbits)
+        elif self.quantization == "int8":
+            size = max(size, INT8_TRAINING_VECTORS)
+        return size
+
+    def _buffering(self, index) -> bool:
+        """Still the exact flat index holding vectors until there are enough to train"""
+        return self._training_size() > 0 and isinstance(self._inner(index), faiss.IndexFlat)
+
+    def _train_buffered(self, buffer):
+        """Replace the flat buffer by the configured index, trained on all its vectors"""
+        ids = faiss.vector_to_array(buffer.id_map)
+        vectors = buffer.index.reconstruct_n(0, buffer.ntotal)
+        index = self._new_index(vectors)
+        index.add_with_ids(vectors, ids)
+        return index
+
+    def _scalar_quantizer(self) -> int:
+        return faiss.ScalarQuantizer.QT_fp16 if self.quantization == "fp16" else faiss.ScalarQuantizer.QT_8bit
+
+    def _new_index(self, vectors: np.ndarray):
+        dim = vectors.shape[1]
+        metric = faiss.METRIC_INNER_PRODUCT
+        if len(vectors) < self._training_size():
+            # Not enough points for the centroids yet: exact search meanwhile
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        if self.index_type == "ivf":
+            coarse = faiss.IndexFlatIP(dim)
+            if self.quantization == "none":
+                index = faiss.IndexIVFFlat(coarse, dim, self.nlist, metric)
+            elif self.quantization == "pq":
+                index = faiss.IndexIVFPQ(coarse, dim, self.nlist, *self._pq_params(dim), metric)
+            else:
+                index = faiss.IndexIVFScalarQuantizer(coarse, dim, self.nlist, self._scalar_quantizer(), metric)
+            index.train(vectors)
+            # IVF stores ids natively (an IDMap would go out of sync on remove_ids);
+            # the hashtable direct map lets get_vectors reconstruct by id
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            self._configure(index)
+            return index
+        if self.index_type == "hnsw":
+            if self.quantization == "none":
+                base = faiss.IndexHNSWFlat(dim, self.hnsw_m, metric)
+            elif self.quantization == "pq":
+                m, nbits = self._pq_params(dim)
+                base = faiss.IndexHNSWPQ(dim, m, self.hnsw_m, nbits, metric)
+            else:
+                base = faiss.IndexHNSWSQ(dim, self._scalar_quantizer(), self.hnsw_m, metric)
+            base.hnsw.efConstruction = self.hnsw_ef_construction
+        elif self.quantization == "none":
+            base = faiss.IndexFlatIP(dim)
+        elif self.quantization == "pq":
+            base = faiss.IndexPQ(dim, *self._pq_params(dim), metric)
+        else:
+            base = faiss.IndexScalarQuantizer(dim, self._scalar_quantizer(), metric)
+        if not base.is_trained:
+            base.train(vectors)
+        # IDMap2 keeps the reverse id map: get_vectors reconstructs by faiss id
+        index = faiss.IndexIDMap2(base)
+        self._configure(index)
+        return index
+
+    def _maybe_reload(self):
+        """Pick up an index rewritten by another process (read-only mode)"""
+        now = time.monotonic()
+        if self._dirty or now - self._last_reload_check < self.reload_interval:
+            return
+        self._last_reload_check = now
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            with self._lock:
+                if not self._dirty:
+                    self._load()
+                    # The other process also wrote to the shared docstore
+                    self.metadata_index = self._build_metadata_index()
+
+    def _acquire_writer(self):
+        """Become the single writer of the index files (until the next flush)"""
+        if self._writer_fd is not None or not FCNTL_AVAILABLE:
+            return
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise RuntimeError(
+                f"FAISS index {self.index_path} is being written by another process: "
+                "run ingestion from a single worker"
+            )
+        self._writer_fd = fd
+        # Write on top of what the previous writer flushed, not a stale copy
+        if os.path.exists(self.index_path) and os.stat(self.index_path).st_mtime_ns != self._loaded_mtime:
+            self._load(writable=True)
+            self.metadata_index = self._build_metadata_index()
+
+    def _release_writer(self):
+        if self._writer_fd is not None:
+            fcntl.flock(self._writer_fd, fcntl.LOCK_UN)
+            os.close(self._writer_fd)
+            self._writer_fd = None
+
+    def _writable_index(self):
+        """The mmapped index is read-only: switch to an in-memory copy before writing"""
+        if self._mapped:
+            self._load(writable=True)
+        return self._index
+
+    def flush(self):
+        """Persist the index atomically (no-op if unchanged)"""
+        with self._lock:
+            if self._dirty and self._index is not None:
+                tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+                faiss.write_index(self._index, tmp_path)
+                os.replace(tmp_path, self.index_path)
+                self._loaded_mtime = os.stat(self.index_path).st_mtime_ns
+                self._dirty = False
+                self.docstore.mark_indexed(self._unflushed)
+                self._unflushed = []
+            self._release_writer()
+
+    @property
+    def ntotal(self) -> int:
+        index = self._index
+        return index.ntotal if index is not None else 0
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _as_matrix(vectors) -> np.ndarray:
+        matrix = np.array(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        faiss.normalize_L2(matrix)
+        return matrix
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        """Upsert texts with precomputed embeddings"""
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        texts = [text for text, _ in text_embeddings]
+        matrix = self._as_matrix([vector for _, vector in text_embeddings])
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+
+        with self._lock, self._rw.write():
+            self._acquire_writer()
+            faiss_ids, replaced = self.docstore.upsert(ids, texts, metadatas)
+            if self._index is None:
+                self._index = self._new_index(matrix)
+                self._mapped = False
+                if self.quantization != "none":
+                    self._full_vectors = FullPrecisionVectors(self.vectors_path, matrix.shape[1])
+            if self._full_vectors is not None:
+                self._full_vectors.write(faiss_ids, matrix)
+            index = self._writable_index()
+            if replaced:
+                self._remove(index, replaced)
+                self.metadata_index.remove(replaced)
+            index.add_with_ids(matrix, np.array(faiss_ids, dtype=np.int64))
+            if self._buffering(index) and index.ntotal >= self._training_size():
+                self._index = self._train_buffered(index)
+            self.metadata_index.add(faiss_ids, metadatas)
+            self._unflushed.extend(faiss_ids)
+            self._dirty = True
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        vectors = self.embedding.embed_documents(texts)
+        return self.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+
+    def add_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        ids = kwargs.pop("ids", None)
+        if ids is None and any(doc.id for doc in documents):
+            ids = [doc.id or str(uuid.uuid4()) for doc in documents]
+        return self.add_texts(
+            [doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+            ids=ids
+        )
+
+    @staticmethod
+    def _remove(index, faiss_ids: List[int]):
+        try:
+            index.remove_ids(np.array(faiss_ids, dtype=np.int64))
+        except RuntimeError:
+            # HNSW: the vectors stay in the graph, the docstore filters them out
+            pass
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock, self._rw.write():
+            self._acquire_writer()
+            faiss_ids = self.docstore.delete(list(ids))
+            self.metadata_index.remove(faiss_ids)
+            if faiss_ids and self._index is not None:
+                self._remove(self._writable_index(), faiss_ids)
+                self._dirty = True
+        return True
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        return self.docstore.get_by_doc_ids(ids) if ids else []
+
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Stored (L2-normalized) vectors of documents, without calling the embedding API
+
+        Exact float32 rows from vectors.f32 for quantized indexes, otherwise
+        reconstructed from the index. Ids the index cannot reconstruct
+        (e.g. an index written before IDMap2) are left out.
+        """
+        id_map = self.docstore.faiss_id_map(ids)
+        if not id_map:
+            return {}
+        faiss_ids = np.array(list(id_map.values()), dtype=np.int64)
+        self._maybe_reload()
+        if self._full_vectors is not None:
+            return dict(zip(id_map, self._full_vectors.read(faiss_ids)))
+        with self._rw.read():
+            index = self._index
+            if index is None:
+                return {}
+            try:
+                return dict(zip(id_map, index.reconstruct_batch(faiss_ids)))
+            except RuntimeError:
+                return {}
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _inner(index):
+        return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+    def _search_params(self, index, selector, selected: int, fetch: int):
+        """SearchParameters restricting the search to the selected ids (if any)"""
+        inner = self._inner(index)
+        if isinstance(inner, faiss.IndexIVF):
+            # Selective filter: the few matching vectors may sit outside the
+            # nprobe nearest lists, scan them all (non-matching codes are skipped)
+            nprobe = inner.nlist if selected * 20 < index.ntotal else self.nprobe
+            return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+        if isinstance(inner, faiss.IndexHNSW):
+            # The candidate queue must hold the fetched results; with a filter only
+            # ~selected/ntotal of the visited nodes match, widen it accordingly
+            ef = fetch * index.ntotal // max(selected, 1) if selector is not None else fetch
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=max(self.hnsw_ef_search, min(ef, index.ntotal)))
+        return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+    def search_vectors(
+        self, vectors, k: int, filter: Optional[MetadataFilter] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search several query vectors in one index call, pre-filtered by metadata"""
+        self._maybe_reload()
+        with self._rw.read():
+            return self._search_vectors(vectors, k, filter)
+
+    def _search_vectors(
+        self, vectors, k: int, filter: Optional[MetadataFilter] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        index = self._index
+        matrix = self._as_matrix(vectors)
+        if index is None or index.ntotal == 0:
+            return [[] for _ in range(len(matrix))]
+
+        limit = index.ntotal
+        selector, post_filter = None, None
+        if filter:
+            _, post_filter = self.metadata_index.split(filter)
+            bitmap = self.metadata_index.select(filter)
+            if bitmap is not None and not bitmap:
+                return [[] for _ in range(len(matrix))]
+            if bitmap is not None and isinstance(self._inner(index), faiss.IndexPQ):
+                # IndexPQ does not take an IDSelector: post-filter everything
+                post_filter = filter
+            elif bitmap is not None:
+                limit = min(limit, bitmap_count(bitmap))
+                packed = bitmap_to_bytes(bitmap)  # must outlive the search calls
+                selector = faiss.IDSelectorBitmap(len(packed), faiss.swig_ptr(packed))
+
+        # Quantized index: take rescore_factor x k candidates, re-score them exactly
+        full_vectors = self._full_vectors if self.rescore_factor > 1 else None
+        wanted = k * self.rescore_factor if full_vectors is not None else k
+
+        # Over-fetch so that vectors deleted from the docstore (HNSW) or
+        # rejected by the post-filter (non-indexed fields) can be skipped
+        fetch = min(limit, wanted)
+        while True:
+            params = self._search_params(index, selector, limit, fetch)
+            scores, faiss_ids = index.search(matrix, fetch, params=params)
+            found = self.docstore.get({int(i) for i in faiss_ids.ravel() if i >= 0})
+            if post_filter:
+                found = {i: doc for i, doc in found.items() if matches(doc.metadata, post_filter)}
+            results = []
+            for query, row_scores, row_ids in zip(matrix, scores, faiss_ids):
+                rows = [(int(i), float(score)) for score, i in zip(row_scores, row_ids) if int(i) in found][:wanted]
+                if full_vectors is not None and rows:
+                    exact = full_vectors.read(np.array([i for i, _ in rows], dtype=np.int64)) @ query
+                    rows = sorted(zip((i for i, _ in rows), exact.tolist()), key=lambda row: -row[1])
+                results.append([(found[i], score) for i, score in rows[:k]])
+            if fetch >= limit or all(len(rows) >= k for rows in results):
+                return results
+            fetch = min(limit, fetch * 2)
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.search_vectors([embedding], k, filter=filter)[0]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter=filter)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter=filter)
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter=filter)]
+
+    async def asimilarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        vector = await self.embedding.aembed_query(query)
+        return await run_in_executor(None, self.similarity_search_with_score_by_vector, vector, k, filter)
+
+    async def asimilarity_search(
+        self, query: str, k: int = 4, filter: Optional[MetadataFilter] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, filter=filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Cosine similarity in [-1, 1] -> relevance in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        directory: str = "./faiss_index",
+        **kwargs: Any
+    ) -> "FaissVectorStore":
+        store = cls(embedding=embedding, directory=directory, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        store.flush()
+        return store
+
+
+def create_vector_store(embeddings: Embeddings, store_type: Optional[str] = None) -> VectorStore:
+    """Build the vector store configured by settings.vector_store_type"""
+    store_type = (store_type or settings.vector_store_type).lower()
+    if store_type == "chroma":
+        from langchain_chroma import Chroma
+        return Chroma(
+            persist_directory=settings.chroma_persist_directory,
+            embedding_function=embeddings
+        )
+    if store_type == "faiss":
+        return FaissVectorStore(
+            embedding=embeddings,
+            directory=settings.faiss_index_directory,
+            index_type=settings.faiss_index_type,
+            mmap=settings.faiss_mmap,
+            nlist=settings.faiss_nlist,
+            nprobe=settings.faiss_nprobe,
+            hnsw_m=settings.faiss_hnsw_m,
+            hnsw_ef_construction=settings.faiss_hnsw_ef_construction,
+            hnsw_ef_search=settings.faiss_hnsw_ef_search,
+            reload_interval=settings.faiss_reload_interval_seconds,
+            metadata_fields=settings.metadata_index_fields,
+            quantization=settings.faiss_quantization,
+            pq_m=settings.faiss_pq_m,
+            pq_nbits=settings.faiss_pq_nbits,
+            rescore_factor=settings.faiss_rescore_factor
+        )
+    raise ValueError(f"Unknown vector store type: {store_type!r} (expected 'chroma' or 'faiss')")
@@ -23,8 +23,14 @@ except ImportError:
     __all__ = []
 
 # Always export REST client
-from .mlflow_rest import MLflowRESTClient, get_mlflow_client
-__all__.extend(["MLflowRESTClient", "get_mlflow_client"])
+from .mlflow_rest import (
+    AsyncMLflowClient,
+    MLflowRESTClient,
+    MLflowRun,
+    get_async_mlflow_client,
+    get_mlflow_client
+)
+__all__.extend(["AsyncMLflowClient", "MLflowRESTClient", "MLflowRun", "get_async_mlflow_client", "get_mlflow_client"])
 
 
 
@@ -0,0 +1,173 @@
+"""Background export of Langfuse scores, off the request path
+
+The request path only appends to a bounded in-memory queue (O(1), never
+blocks, never touches the network). A worker thread sends the scores in
+batches, when batch_size are waiting or every flush_interval seconds,
+with exponential backoff on errors. When the queue is full new scores
+are dropped and counted: Langfuse being slow or down never slows queries.
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, List, Optional
+
+from src.config import settings
+from src.monitoring.prometheus import record_langfuse_scores, set_langfuse_score_queue_depth
+
+
+@dataclass
+class ScoreRecord:
+    name: str
+    value: float
+    trace_id: Optional[str] = None
+    comment: Optional[str] = None
+
+
+def send_to_langfuse(batch: List[ScoreRecord]):
+    """Default sender: process-wide client, one create_score per record, one flush per batch"""
+    from src.utils.langfuse_scoring import get_langfuse_client
+
+    client = get_langfuse_client()
+    if client is None:
+        raise RuntimeError("Langfuse client not available")
+    for record in batch:
+        params = {"name": record.name, "value": float(record.value)}
+        if record.trace_id:
+            params["trace_id"] = record.trace_id
+        if record.comment:
+            params["comment"] = record.comment
+        client.create_score(**params)
+    if hasattr(client, "flush"):
+        client.flush()
+
+
+class ScoreExporter:
+    """Bounded queue + batching worker thread for Langfuse scores"""
+
+    def __init__(
+        self,
+        send: Callable[[List[ScoreRecord]], None] = send_to_langfuse,
+        max_queue: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_seconds: float = 0.5
+    ):
+        self.send = send
+        self.max_queue = max_queue or settings.langfuse_score_queue_size
+        self.batch_size = batch_size or settings.langfuse_score_batch_size
+        self.flush_interval = flush_interval or settings.langfuse_score_flush_seconds
+        self.max_retries = settings.langfuse_score_max_retries if max_retries is None else max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self._queue: Deque[ScoreRecord] = deque()
+        self._condition = threading.Condition()
+        self._sending = 0  # records taken by the worker, not yet sent
+        self._closed = False
+        self._flushing = False
+        self._worker: Optional[threading.Thread] = None
+        self.exported = 0
+        self.dropped = 0
+
+    def submit(self, record: ScoreRecord) -> bool:
+        """Queue a score (O(1)); False if it was dropped because the queue is full"""
+        with self._condition:
+            if self._closed or len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                record_langfuse_scores("dropped", 1)
+                return False
+            self._queue.append(record)
+            depth = len(self._queue)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="langfuse-scores", daemon=True)
+                self._worker.start()
+            if depth >= self.batch_size:
+                self._condition.notify_all()
+        set_langfuse_score_queue_depth(depth)
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._queue) < self.batch_size and not (self._closed or self._flushing):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if not self._queue:
+                    self._flushing = False
+                    if self._closed:
+                        return
+                    continue
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._sending = len(batch)
+                depth = len(self._queue)
+            set_langfuse_score_queue_depth(depth)
+            self._export(batch)
+            with self._condition:
+                self._sending = 0
+                self._condition.notify_all()
+
+    def _export(self, batch: List[ScoreRecord]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.send(batch)
+            except Exception as e:
+                if attempt == self.max_retries or self._closed:
+                    print(f"⚠️  Warning: Could not export {len(batch)} Langfuse score(s): {e}")
+                    record_langfuse_scores("failed", len(batch))
+                    return
+                time.sleep(self.backoff_seconds * 2 ** attempt)
+            else:
+                self.exported += len(batch)
+                record_langfuse_scores("exported", len(batch))
+                return
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued score has been handled; False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if not (self._queue or self._sending):
+                return True
+            # Send partial batches right away
+            self._flushing = True
+            self._condition.notify_all()
+            while self._queue or self._sending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._worker is None:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: float = 5.0):
+        """Send what is queued (no retries after timeout), then stop the worker"""
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+
+_exporter: Optional[ScoreExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_score_exporter() -> ScoreExporter:
+    """Process-wide score exporter (its worker starts with the first score)"""
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = ScoreExporter()
+        return _exporter
+
+
+def shutdown_score_exporter(timeout: float = 5.0):
+    global _exporter
+    with _exporter_lock:
+        exporter, _exporter = _exporter, None
+    if exporter is not None:
+        exporter.shutdown(timeout)
@@ -1,6 +1,7 @@
 """Langfuse scoring utilities for RAG evaluation"""
 
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, List
 
 try:
     from src.config import settings
@@ -15,8 +16,13 @@ except ImportError:
     LANGFUSE_AVAILABLE = False
 
 
+_client: Optional[Any] = None
+_client_lock = threading.Lock()
+
+
 def get_langfuse_client() -> Optional[Any]:
-    """Get Langfuse client instance"""
+    """Get the process-wide Langfuse client (created on first use)"""
+    global _client
     if not LANGFUSE_AVAILABLE:
         return None
     
@@ -26,15 +32,48 @@ def get_langfuse_client() -> Optional[Any]:
     if not settings.langfuse_secret_key or not settings.langfuse_public_key:
         return None
     
-    try:
-        return Langfuse(
-            secret_key=settings.langfuse_secret_key,
-            public_key=settings.langfuse_public_key,
-            host=settings.langfuse_host
-        )
-    except Exception as e:
-        print(f"⚠️  Warning: Could not initialize Langfuse client: {e}")
-        return None
+    # One client (and its background threads) per process, not per score
+    with _client_lock:
+        if _client is None:
+            try:
+                _client = Langfuse(
+                    secret_key=settings.langfuse_secret_key,
+                    public_key=settings.langfuse_public_key,
+                    host=settings.langfuse_host
+                )
+            except Exception as e:
+                print(f"⚠️  Warning: Could not initialize Langfuse client: {e}")
+                return None
+        return _client
+
+
+def _build_comment(comment: Optional[str], metadata: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Score comment: truncated comment + a short "key:value | ..." metadata summary"""
+    final_comment = None
+    if comment:
+        final_comment = str(comment)[:500]  # Truncate to 500 chars
+    
+    # Add metadata to comment if provided
+    if metadata:
+        try:
+            metadata_items = []
+            for k, v in list(metadata.items())[:5]:  # Limit to 5 items
+                if isinstance(v, (str, int, float, bool)):
+                    metadata_items.append(f"{k}:{v}")
+                else:
+                    metadata_items.append(f"{k}:{str(v)[:50]}")
+            
+            metadata_str = " | ".join(metadata_items)
+            if len(metadata_str) > 200:
+                metadata_str = metadata_str[:200] + "..."
+            
+            if final_comment:
+                final_comment = f"{final_comment} | {metadata_str}"
+            else:
+                final_comment = metadata_str
+        except Exception as e:
+            print(f"   ⚠️  Metadata non sérialisable: {e}")
+    return final_comment
 
 
 def create_score(
@@ -69,31 +108,7 @@ def create_score(
         return None
     
     # Build comment first (needed for both score_current_trace and create_score)
-    final_comment = None
-    if comment:
-        final_comment = str(comment)[:500]  # Truncate to 500 chars
-    
-    # Add metadata to comment if provided
-    if metadata:
-        try:
-            import json
-            metadata_items = []
-            for k, v in list(metadata.items())[:5]:  # Limit to 5 items
-                if isinstance(v, (str, int, float, bool)):
-                    metadata_items.append(f"{k}:{v}")
-                else:
-                    metadata_items.append(f"{k}:{str(v)[:50]}")
-            
-            metadata_str = " | ".join(metadata_items)
-            if len(metadata_str) > 200:
-                metadata_str = metadata_str[:200] + "..."
-            
-            if final_comment:
-                final_comment = f"{final_comment} | {metadata_str}"
-            else:
-                final_comment = metadata_str
-        except Exception as e:
-            print(f"   ⚠️  Metadata non sérialisable: {e}")
+    final_comment = _build_comment(comment, metadata)
     
     # If use_current_trace is True and no trace_id provided, try to use score_current_trace
     if use_current_trace and not trace_id:
@@ -226,8 +241,7 @@ def create_score(
         return None
 
 
-def score_rag_response(
-    trace_id: Optional[str],
+def rag_response_scores(
     answer: str,
     question: str,
     sources_count: int = 0,
@@ -235,25 +249,8 @@ def score_rag_response(
     relevance_score: Optional[float] = None,
     completeness_score: Optional[float] = None,
     accuracy_score: Optional[float] = None
-) -> Dict[str, Optional[str]]:
-    """
-    Create multiple scores for a RAG response
-    
-    Args:
-        trace_id: ID of the trace
-        answer: Generated answer
-        question: Original question
-        sources_count: Number of sources used
-        answer_length: Length of the answer
-        relevance_score: Relevance score (0.0-1.0)
-        completeness_score: Completeness score (0.0-1.0)
-        accuracy_score: Accuracy score (0.0-1.0)
-    
-    Returns:
-        Dictionary with score IDs
-    """
-    scores = {}
-    
+) -> List[Dict[str, Any]]:
+    """Scores of a RAG response (name, value, comment, metadata), heuristics when not given"""
     # Automatic scores based on heuristics
     if relevance_score is None:
         # Simple heuristic: longer answers with sources are more relevant
@@ -263,47 +260,102 @@ def score_rag_response(
         # Heuristic: answers with more content are more complete
         completeness_score = min(1.0, answer_length / 300)
     
-    # Create scores
-    if relevance_score is not None:
-        scores["relevance"] = create_score(
-            trace_id=trace_id,
-            name="relevance",
-            value=relevance_score,
-            comment=f"Relevance of answer to question: {question[:50]}...",
-            metadata={
+    scores = [
+        {
+            "name": "relevance",
+            "value": relevance_score,
+            "comment": f"Relevance of answer to question: {question[:50]}...",
+            "metadata": {
                 "question": question,
                 "sources_count": sources_count,
                 "answer_length": answer_length
             }
-        )
-    
-    if completeness_score is not None:
-        scores["completeness"] = create_score(
-            trace_id=trace_id,
-            name="completeness",
-            value=completeness_score,
-            comment=f"Completeness of the answer",
-            metadata={
+        },
+        {
+            "name": "completeness",
+            "value": completeness_score,
+            "comment": f"Completeness of the answer",
+            "metadata": {
                 "answer_length": answer_length,
                 "sources_count": sources_count
             }
-        )
+        }
+    ]
     
     if accuracy_score is not None:
-        scores["accuracy"] = create_score(
-            trace_id=trace_id,
-            name="accuracy",
-            value=accuracy_score,
-            comment=f"Accuracy of the answer (manual evaluation)",
-            metadata={
+        scores.append({
+            "name": "accuracy",
+            "value": accuracy_score,
+            "comment": f"Accuracy of the answer (manual evaluation)",
+            "metadata": {
                 "question": question,
                 "answer_preview": answer[:200]
             }
-        )
+        })
     
     return scores
 
 
+def score_rag_response(
+    trace_id: Optional[str],
+    answer: str,
+    question: str,
+    sources_count: int = 0,
+    answer_length: int = 0,
+    relevance_score: Optional[float] = None,
+    completeness_score: Optional[float] = None,
+    accuracy_score: Optional[float] = None
+) -> Dict[str, Optional[str]]:
+    """
+    Create multiple scores for a RAG response (blocking, one call per score)
+    
+    Args:
+        trace_id: ID of the trace
+        answer: Generated answer
+        question: Original question
+        sources_count: Number of sources used
+        answer_length: Length of the answer
+        relevance_score: Relevance score (0.0-1.0)
+        completeness_score: Completeness score (0.0-1.0)
+        accuracy_score: Accuracy score (0.0-1.0)
+    
+    Returns:
+        Dictionary with score IDs
+    """
+    return {
+        score["name"]: create_score(trace_id=trace_id, **score)
+        for score in rag_response_scores(
+            answer, question, sources_count, answer_length,
+            relevance_score, completeness_score, accuracy_score
+        )
+    }
+
+
+def enqueue_rag_response_scores(
+    trace_id: Optional[str],
+    answer: str,
+    question: str,
+    sources_count: int = 0,
+    answer_length: int = 0
+) -> int:
+    """Queue the scores of a RAG response for background export (request path, O(1))
+    
+    Returns the number of scores queued (scores are dropped when the queue is full).
+    """
+    from src.utils.langfuse_exporter import ScoreRecord, get_score_exporter
+    
+    exporter = get_score_exporter()
+    queued = 0
+    for score in rag_response_scores(answer, question, sources_count, answer_length):
+        queued += exporter.submit(ScoreRecord(
+            name=score["name"],
+            value=float(score["value"]),
+            trace_id=trace_id,
+            comment=_build_comment(score["comment"], score["metadata"])
+        ))
+    return queued
+
+
 def get_trace_id_from_generation(generation_id: Optional[str]) -> Optional[str]:
     """
     Get trace ID from a generation ID
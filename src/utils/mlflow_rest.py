@@ -1,8 +1,17 @@
-"""MLflow REST API client - Alternative to Python SDK when imports fail"""
+"""MLflow REST API clients - Alternative to Python SDK when imports fail
 
+MLflowRESTClient is blocking (scripts, background threads); AsyncMLflowClient
+serves the API: pooled keep-alive connections, bounded retries, and one
+MLflowRun handle per run instead of a shared current run.
+"""
+
+import asyncio
 import requests
 import json
-from typing import Dict, Optional, Any
+import time
+from typing import Dict, Iterator, List, Optional, Any
+
+import httpx
 
 try:
     from src.config import settings
@@ -10,10 +19,39 @@ except ImportError:
     from config import settings
 
 
+# runs/log-batch limits (per request)
+MAX_BATCH_METRICS = 1000
+MAX_BATCH_PARAMS = 100
+
+
+def batch_payloads(
+    run_id: str,
+    metrics: Optional[List[Dict[str, Any]]] = None,
+    params: Optional[Dict[str, Any]] = None,
+    tags: Optional[Dict[str, str]] = None
+) -> Iterator[Dict[str, Any]]:
+    """runs/log-batch bodies of at most 1000 metrics / 100 params each"""
+    metrics = list(metrics or [])
+    params = [{"key": k, "value": str(v)} for k, v in (params or {}).items()]
+    tags = [{"key": k, "value": str(v)} for k, v in (tags or {}).items()]
+    while True:
+        yield {
+            "run_id": run_id,
+            "metrics": metrics[:MAX_BATCH_METRICS],
+            "params": params[:MAX_BATCH_PARAMS],
+            "tags": tags
+        }
+        metrics, params, tags = metrics[MAX_BATCH_METRICS:], params[MAX_BATCH_PARAMS:], []
+        if not metrics and not params:
+            return
+
+
 class MLflowRESTClient:
     """Simple MLflow REST API client"""
     
     def __init__(self, tracking_uri: Optional[str] = None):
+        # Pooled keep-alive connections instead of one TCP connection per call
+        self.session = requests.Session()
         self.tracking_uri = tracking_uri or settings.mlflow_tracking_uri
         # Remove trailing slash
         if self.tracking_uri.endswith('/'):
@@ -27,7 +65,7 @@ class MLflowRESTClient:
         """Ensure experiment exists, create if not"""
         try:
             # Try to get experiment
-            response = requests.get(
+            response = self.session.get(
                 f"{self.tracking_uri}/api/2.0/mlflow/experiments/get-by-name",
                 params={"experiment_name": self.experiment_name},
                 timeout=5
@@ -41,7 +79,7 @@ class MLflowRESTClient:
                     raise Exception("Experiment data not found in response")
             else:
                 # Create experiment
-                response = requests.post(
+                response = self.session.post(
                     f"{self.tracking_uri}/api/2.0/mlflow/experiments/create",
                     json={"name": self.experiment_name},
                     timeout=5
@@ -61,38 +99,58 @@ class MLflowRESTClient:
             # Try to use default experiment (ID 0)
             self.experiment_id = "0"
     
+    def create_run(self, run_name: Optional[str] = None, tags: Optional[Dict[str, str]] = None) -> str:
+        """Create a run and return its id (does not change the current run); raises on failure"""
+        tags = dict(tags or {})
+        tags["mlflow.runName"] = run_name or "unnamed_run"
+        
+        response = self.session.post(
+            f"{self.tracking_uri}/api/2.0/mlflow/runs/create",
+            json={
+                "experiment_id": self.experiment_id,
+                "start_time": int(time.time() * 1000),
+                "tags": [{"key": k, "value": v} for k, v in tags.items()]
+            },
+            timeout=5
+        )
+        if response.status_code != 200:
+            raise Exception(f"Failed to create run: {response.text}")
+        return response.json()["run"]["info"]["run_id"]
+    
     def start_run(self, run_name: Optional[str] = None, tags: Optional[Dict[str, str]] = None) -> str:
         """Start a new MLflow run"""
         try:
-            tags = tags or {}
-            tags["mlflow.runName"] = run_name or "unnamed_run"
-            
-            response = requests.post(
-                f"{self.tracking_uri}/api/2.0/mlflow/runs/create",
-                json={
-                    "experiment_id": self.experiment_id,
-                    "start_time": int(__import__("time").time() * 1000),
-                    "tags": [{"key": k, "value": v} for k, v in tags.items()]
-                },
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                self.current_run_id = response.json()["run"]["info"]["run_id"]
-                return self.current_run_id
-            else:
-                raise Exception(f"Failed to create run: {response.text}")
+            self.current_run_id = self.create_run(run_name, tags)
+            return self.current_run_id
         except Exception as e:
             print(f"⚠️  Warning: Could not start MLflow run: {e}")
             return None
     
+    def log_batch(
+        self,
+        run_id: str,
+        metrics: Optional[List[Dict[str, Any]]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        tags: Optional[Dict[str, str]] = None
+    ):
+        """Log metrics ({key, value, timestamp, step}), params and tags with runs/log-batch
+        
+        Split in requests of at most 1000 metrics / 100 params; raises on failure.
+        """
+        for payload in batch_payloads(run_id, metrics, params, tags):
+            response = self.session.post(
+                f"{self.tracking_uri}/api/2.0/mlflow/runs/log-batch", json=payload, timeout=5
+            )
+            if response.status_code != 200:
+                raise Exception(f"log-batch failed ({response.status_code}): {response.text[:200]}")
+    
     def log_param(self, key: str, value: Any):
         """Log a parameter"""
         if not self.current_run_id:
             return
         
         try:
-            requests.post(
+            self.session.post(
                 f"{self.tracking_uri}/api/2.0/mlflow/runs/log-parameter",
                 json={
                     "run_id": self.current_run_id,
@@ -111,9 +169,9 @@ class MLflowRESTClient:
         
         try:
             if timestamp is None:
-                timestamp = int(__import__("time").time() * 1000)
+                timestamp = int(time.time() * 1000)
             
-            requests.post(
+            self.session.post(
                 f"{self.tracking_uri}/api/2.0/mlflow/runs/log-metric",
                 json={
                     "run_id": self.current_run_id,
@@ -132,7 +190,7 @@ class MLflowRESTClient:
             return
         
         try:
-            requests.post(
+            self.session.post(
                 f"{self.tracking_uri}/api/2.0/mlflow/runs/update",
                 json={
                     "run_id": self.current_run_id,
@@ -160,3 +218,174 @@ def get_mlflow_client() -> Optional[MLflowRESTClient]:
             return None
     return _mlflow_client
 
+
+
+class MLflowError(Exception):
+    """MLflow answered with an error that retrying will not fix (or retries ran out)"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class MLflowRun:
+    """Handle of one run: params and metrics are buffered, then sent with log-batch
+    
+    Each upload gets its own handle, so concurrent runs never share state.
+    """
+    
+    def __init__(self, client: "AsyncMLflowClient", run_id: str):
+        self.client = client
+        self.run_id = run_id
+        self._params: Dict[str, Any] = {}
+        self._tags: Dict[str, str] = {}
+        self._metrics: List[Dict[str, Any]] = []
+    
+    def log_param(self, key: str, value: Any):
+        self._params[key] = value
+    
+    def set_tag(self, key: str, value: str):
+        self._tags[key] = value
+    
+    def log_metric(self, key: str, value: float, step: int = 0):
+        self._metrics.append({
+            "key": key, "value": float(value), "timestamp": int(time.time() * 1000), "step": step
+        })
+    
+    async def flush(self):
+        """Send the buffered logs in as few log-batch requests as possible"""
+        if not (self._params or self._tags or self._metrics):
+            return
+        metrics, params, tags = self._metrics, self._params, self._tags
+        self._metrics, self._params, self._tags = [], {}, {}
+        await self.client.log_batch(self.run_id, metrics=metrics, params=params, tags=tags)
+    
+    async def end(self, status: str = "FINISHED"):
+        """Flush, then close the run (FINISHED, FAILED or KILLED)"""
+        try:
+            await self.flush()
+        finally:
+            await self.client.end_run(self.run_id, status)
+    
+    async def __aenter__(self) -> "MLflowRun":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.end("FAILED" if exc_type else "FINISHED")
+
+
+class AsyncMLflowClient:
+    """MLflow REST client on httpx.AsyncClient (keep-alive pool, bounded retries)"""
+    
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    
+    def __init__(
+        self,
+        tracking_uri: Optional[str] = None,
+        experiment_name: Optional[str] = None,
+        max_retries: Optional[int] = None,
+        backoff_seconds: float = 0.2,
+        timeout: float = 5.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.tracking_uri = (tracking_uri or settings.mlflow_tracking_uri).rstrip("/")
+        self.experiment_name = experiment_name or settings.mlflow_experiment_name
+        self.max_retries = settings.mlflow_max_retries if max_retries is None else max_retries
+        self.backoff_seconds = backoff_seconds
+        self._client = httpx.AsyncClient(
+            base_url=f"{self.tracking_uri}/api/2.0/mlflow",
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            transport=transport
+        )
+        self._experiment_id: Optional[str] = None
+        self._experiment_lock = asyncio.Lock()
+    
+    async def _request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
+        """JSON response; connection errors, 429 and 5xx are retried with backoff"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client.request(method, endpoint, **kwargs)
+            except httpx.TransportError as e:
+                error = MLflowError(f"{endpoint}: {e!r}")
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                error = MLflowError(
+                    f"{endpoint} failed ({response.status_code}): {response.text[:200]}", response.status_code
+                )
+                if response.status_code not in self.RETRY_STATUSES:
+                    raise error
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.backoff_seconds * 2 ** attempt)
+        raise error
+    
+    async def experiment_id(self) -> str:
+        """Id of the configured experiment, created on first use"""
+        async with self._experiment_lock:
+            if self._experiment_id is None:
+                try:
+                    data = await self._request(
+                        "GET", "/experiments/get-by-name", params={"experiment_name": self.experiment_name}
+                    )
+                    self._experiment_id = data["experiment"]["experiment_id"]
+                except MLflowError as e:
+                    if e.status_code != 404:
+                        raise
+                    data = await self._request("POST", "/experiments/create", json={"name": self.experiment_name})
+                    self._experiment_id = data["experiment_id"]
+            return self._experiment_id
+    
+    async def start_run(
+        self,
+        run_name: Optional[str] = None,
+        tags: Optional[Dict[str, str]] = None,
+        start_time: Optional[int] = None
+    ) -> MLflowRun:
+        """Create a run and return its handle"""
+        tags = {**(tags or {}), "mlflow.runName": run_name or "unnamed_run"}
+        data = await self._request("POST", "/runs/create", json={
+            "experiment_id": await self.experiment_id(),
+            "start_time": start_time or int(time.time() * 1000),
+            "tags": [{"key": k, "value": str(v)} for k, v in tags.items()]
+        })
+        return MLflowRun(self, data["run"]["info"]["run_id"])
+    
+    async def log_batch(
+        self,
+        run_id: str,
+        metrics: Optional[List[Dict[str, Any]]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        tags: Optional[Dict[str, str]] = None
+    ):
+        for payload in batch_payloads(run_id, metrics, params, tags):
+            await self._request("POST", "/runs/log-batch", json=payload)
+    
+    async def end_run(self, run_id: str, status: str = "FINISHED"):
+        await self._request("POST", "/runs/update", json={
+            "run_id": run_id, "status": status, "end_time": int(time.time() * 1000)
+        })
+    
+    async def aclose(self):
+        await self._client.aclose()
+
+
+# One async client per event loop (httpx connections belong to the loop that opened them)
+_async_client: Optional[AsyncMLflowClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_async_mlflow_client() -> AsyncMLflowClient:
+    """Shared async client of the running event loop"""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client, _async_client_loop = AsyncMLflowClient(), loop
+    return _async_client
+
+
+async def close_async_mlflow_client():
+    global _async_client, _async_client_loop
+    client, _async_client, _async_client_loop = _async_client, None, None
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,13 @@
+"""Shared test fixtures"""
+
+import pytest
+
+from src.config import settings
+
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """Keep indexes, caches and manifests written by tests out of the checkout"""
+    monkeypatch.setattr(settings, "chroma_persist_directory", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(settings, "faiss_index_directory", str(tmp_path / "faiss_index"))
+    monkeypatch.setattr(settings, "ingest_embedding_cache_path", str(tmp_path / "embedding_cache.sqlite"))
@@ -0,0 +1,132 @@
+"""Tests for the semantic answer cache"""
+
+import asyncio
+import re
+import zlib
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src.rag.answer_cache import SemanticAnswerCache
+from src.rag.generation import RAGGenerator
+from src.rag.pipeline import RAGPipeline
+from src.rag.retrieval import RetrievalSystem
+
+
+class BagOfWordsEmbedding(Embeddings):
+    """Paraphrases sharing most words get close vectors"""
+
+    def _embed(self, text):
+        vector = [0.0] * 64
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode()) % 64] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def make_pipeline(responses, **cache_options):
+    embeddings = BagOfWordsEmbedding()
+    retrieval = RetrievalSystem(embeddings=embeddings, vector_store=InMemoryVectorStore(embedding=embeddings), top_k=2)
+    retrieval.add_documents([
+        Document(page_content="Python is a programming language", metadata={"source": "python.txt"}),
+        Document(page_content="The router manual", metadata={"source": "router.txt"})
+    ])
+    cache = SemanticAnswerCache(retrieval.vector_store.get_by_ids, **{"threshold": 0.7, **cache_options})
+    retrieval.add_write_listener(cache.on_index_write)
+    llm = FakeListChatModel(responses=responses)
+    pipeline = RAGPipeline(retrieval, RAGGenerator(llm=llm, use_langfuse=False), answer_cache=cache)
+    return pipeline, retrieval, cache
+
+
+def test_paraphrase_is_served_from_cache():
+    pipeline, _, cache = make_pipeline(["first", "second"])
+
+    first = asyncio.run(pipeline.arun("What is Python?"))
+    second = asyncio.run(pipeline.arun("what is python exactly"))
+    assert (first["answer"], first["cached"]) == ("first", False)
+    assert (second["answer"], second["cached"]) == ("first", True)
+    assert second["question"] == "what is python exactly"
+    assert cache.hits == 1
+
+
+def test_question_is_embedded_once_per_request():
+    """The answer cache vector is reused by the vector search and the MMR re-ranking"""
+    from unittest.mock import patch
+    from src.config import settings
+    from src.rag.postprocess import RetrievalOptions
+
+    with patch.object(settings, "query_embedding_cache_enabled", False):
+        pipeline, retrieval, _ = make_pipeline(["first", "second"])
+    calls = []
+    embed_query = BagOfWordsEmbedding.embed_query
+    options = RetrievalOptions(mmr=True, fetch_k=2)
+
+    with patch.object(BagOfWordsEmbedding, "embed_query", lambda self, text: calls.append(text) or embed_query(self, text)):
+        pipeline.run("What is Python?", retrieval_options=options)
+        assert calls == ["What is Python?"]
+        asyncio.run(pipeline.arun("How do I reset the router?", retrieval_options=options))
+        assert calls == ["What is Python?", "How do I reset the router?"]
+
+
+def test_bypass_for_follow_ups_and_use_cache_false():
+    pipeline, _, cache = make_pipeline(["first", "second", "third"])
+
+    pipeline.run("What is Python?")
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    assert pipeline.run("What is Python?", chat_history=history)["answer"] == "second"
+    assert pipeline.run("What is Python?", use_cache=False)["answer"] == "third"
+    assert cache.hits == 0
+
+
+def test_ingestion_clears_cached_answers():
+    pipeline, retrieval, cache = make_pipeline(["first", "second"])
+
+    pipeline.run("What is Python?")
+    assert len(cache) == 1
+    retrieval.add_documents([Document(page_content="Python 4 was released", metadata={"source": "news.txt"})])
+    assert len(cache) == 0
+    assert pipeline.run("What is Python?")["answer"] == "second"
+
+
+def test_changed_chunk_makes_entry_stale():
+    pipeline, retrieval, cache = make_pipeline(["first", "second"], clear_on_write=False)
+
+    pipeline.run("What is Python?")
+    # Another worker rewrites a source chunk behind our back (no write listener)
+    store = retrieval.vector_store
+    chunk_id = next(iter(next(iter(cache._entries.values())).chunk_fingerprints))
+    store.store[chunk_id]["text"] = "Python is a snake"
+
+    assert pipeline.run("What is Python?")["answer"] == "second"
+    assert cache.hits == 0
+
+
+def test_delete_invalidates_only_dependent_answers():
+    pipeline, retrieval, cache = make_pipeline(["python", "router"], clear_on_write=False)
+
+    pipeline.run("What is Python?")
+    pipeline.run("Where is the router manual?")
+    assert len(cache) == 2
+    python_slot, entry = next(iter(cache._entries.items()))
+    retrieval.delete(list(entry.chunk_fingerprints)[:1])
+    assert python_slot not in cache._entries
+
+
+def test_lru_bound():
+    cache = SemanticAnswerCache(lambda ids: [], max_entries=2, threshold=0.99)
+    docs = [Document(page_content="x", id="1")]
+    for i in range(3):
+        vector = [0.0] * 4
+        vector[i] = 1.0
+        cache.put(vector, "scope", f"q{i}", docs, {"answer": str(i)})
+
+    assert len(cache) == 2
+    assert cache.get([1.0, 0.0, 0.0, 0.0], "scope") is None
+    assert cache.get([0.0, 1.0, 0.0, 0.0], "other") is None
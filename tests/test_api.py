@@ -1,8 +1,11 @@
 """Tests for API endpoints"""
 
+import hashlib
+import json
+
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 from src.api.main import app
 
@@ -23,12 +26,12 @@ def test_health_check(client):
 @patch('src.api.main.rag_pipeline')
 def test_query_endpoint(mock_pipeline, client):
     """Test query endpoint"""
-    mock_pipeline.run.return_value = {
+    mock_pipeline.arun = AsyncMock(return_value={
         "question": "What is Python?",
         "answer": "Python is a programming language.",
         "sources": [],
         "model": "gpt-4"
-    }
+    })
     
     response = client.post(
         "/api/query",
@@ -40,6 +43,25 @@ def test_query_endpoint(mock_pipeline, client):
     assert response.status_code in [200, 503]
 
 
+@patch('src.api.main.rag_pipeline')
+def test_query_stream_endpoint(mock_pipeline, client):
+    """Test that the stream endpoint emits JSON-encoded SSE events"""
+    async def fake_stream(question, chat_history=None, retrieval_options=None, filter=None, use_cache=True):
+        yield {"event": "sources", "sources": []}
+        yield {"event": "token", "content": "Python"}
+        yield {"event": "end", "question": question, "answer": "Python", "sources": [], "model": "gpt-4", "trace_id": None}
+    
+    mock_pipeline.astream_answer = fake_stream
+    
+    response = client.post("/api/query/stream", json={"question": "What is Python?"})
+    
+    assert response.status_code == 200
+    data_lines = [line[len("data: "):] for line in response.text.splitlines() if line.startswith("data: ")]
+    events = [json.loads(line) for line in data_lines]
+    assert [event["event"] for event in events] == ["sources", "token", "end"]
+    assert events[-1]["auto_scores"]["completeness"] > 0
+
+
 def test_metrics_endpoint(client):
     """Test Prometheus metrics endpoint"""
     response = client.get("/metrics")
@@ -47,4 +69,122 @@ def test_metrics_endpoint(client):
     assert response.status_code in [200, 404]
 
 
+def test_metrics_endpoint_openmetrics(client):
+    """Scrapers asking for OpenMetrics get the format that carries exemplars"""
+    response = client.get("/metrics", headers={"Accept": "application/openmetrics-text; version=1.0.0"})
+    if response.status_code == 200:
+        assert response.headers["content-type"].startswith("application/openmetrics-text")
+        assert response.text.rstrip().endswith("# EOF")
+
+
+
+
+
+@patch('src.api.main.ingestion_jobs')
+@patch('src.api.main.retrieval_system')
+@patch('src.api.main.document_ingester')
+def test_upload_streams_to_disk_and_hashes(mock_ingester, mock_retrieval, mock_jobs, client, tmp_path):
+    """Uploads are written to disk in blocks, hashed on the fly and size-limited"""
+    mock_jobs.submit.return_value = MagicMock(id="job-1", status="queued")
+    content = b"hello world\n" * 1000
+    
+    with patch.multiple('src.api.main.settings', ingest_upload_dir=str(tmp_path), ingest_upload_chunk_bytes=1024):
+        response = client.post("/api/ingest/upload", files={"file": ("doc.txt", content)})
+        assert response.status_code == 202
+        kwargs = mock_jobs.submit.call_args.kwargs
+        assert kwargs["content_hash"] == hashlib.sha256(content).hexdigest()
+        assert kwargs["filename"] == "doc.txt"
+        saved = mock_jobs.submit.call_args.args[1]
+        assert saved.endswith(".txt") and open(saved, "rb").read() == content
+        
+        with patch('src.api.main.settings.ingest_upload_max_bytes', 100):
+            response = client.post("/api/ingest/upload", files={"file": ("big.txt", content)})
+        assert response.status_code == 413
+        assert len(list(tmp_path.iterdir())) == 1  # the rejected upload was removed
+
+
+def test_upload_rejected_on_content_length_before_reading_the_body(tmp_path):
+    """A declared size above the limit is refused without receiving the body"""
+    import asyncio
+    from fastapi import HTTPException
+    from starlette.requests import Request
+    from src.api.uploads import save_upload
+    
+    async def receive():
+        raise AssertionError("the body was read")
+    
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=x"), (b"content-length", b"10000000")]
+    }
+    with patch.multiple('src.api.main.settings', ingest_upload_dir=str(tmp_path), ingest_upload_max_bytes=100):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(save_upload(Request(scope, receive)))
+    assert error.value.status_code == 413
+    assert not list(tmp_path.iterdir())
+
+
+@patch('src.api.main.ingestion_jobs')
+@patch('src.api.main.retrieval_system')
+@patch('src.api.main.document_ingester')
+def test_ingest_returns_job_id_unless_asked_to_wait(mock_ingester, mock_retrieval, mock_jobs, client):
+    """/api/ingest answers 202 with a job id; wait=true keeps the blocking behaviour"""
+    from concurrent.futures import Future
+    
+    done = Future()
+    done.set_result({"message": "Documents ingested successfully", "chunks_count": 3})
+    mock_jobs.submit.return_value = MagicMock(id="job-1", status="queued")
+    mock_jobs.future.return_value = done
+    
+    response = client.post("/api/ingest", json={"path": "/data/doc.txt"})
+    assert response.status_code == 202
+    assert response.json() == {"job_id": "job-1", "status": "queued", "status_url": "/api/ingest/jobs/job-1"}
+    
+    response = client.post("/api/ingest?wait=true", json={"path": "/data/doc.txt"})
+    assert response.status_code == 200
+    assert response.json()["chunks_count"] == 3
+
+
+@patch('src.api.main.retrieval_system')
+def test_search_batch_endpoint(mock_retrieval, client):
+    """Batch search returns one result list per query"""
+    from langchain_core.documents import Document
+    mock_retrieval.similarity_search_batch.return_value = [
+        [Document(page_content="a", metadata={"source": "x"})],
+        [],
+    ]
+    
+    response = client.post("/api/search/batch", json={"queries": ["q1", "q2"], "k": 1})
+    
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["query"] for r in results] == ["q1", "q2"]
+    assert results[0]["results"][0]["content"] == "a"
+    assert mock_retrieval.similarity_search_batch.call_args.args[:2] == (["q1", "q2"], 1)
+
+
+@patch('src.api.main.retrieval_system')
+def test_search_metadata_filter(mock_retrieval, client):
+    """filter is passed to the retrieval system; malformed filters are rejected"""
+    mock_retrieval.asimilarity_search = AsyncMock(return_value=[])
+    
+    response = client.get("/api/search", params={"query": "q", "filter": json.dumps({"tenant": ["a", "b"]})})
+    assert response.status_code == 200
+    assert mock_retrieval.asimilarity_search.call_args.kwargs["filter"] == {"tenant": ["a", "b"]}
+    
+    assert client.get("/api/search", params={"query": "q", "filter": "not json"}).status_code == 400
+    response = client.post("/api/search/batch", json={"queries": ["q"], "filter": {"tenant": {"$ne": "a"}}})
+    assert response.status_code == 400
+
+
+@patch('src.api.main.rag_pipeline')
+def test_query_shed_by_llm_gateway_returns_503(mock_pipeline, client):
+    """A saturated LLM gateway answers 503 with Retry-After instead of hanging"""
+    from src.rag.llm_gateway import LLMOverloaded
+    mock_pipeline.arun = AsyncMock(side_effect=LLMOverloaded("queue_full", 2.5))
+
+    response = client.post("/api/query", json={"question": "What is Python?"})
 
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
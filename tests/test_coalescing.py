@@ -0,0 +1,125 @@
+"""Tests for single-flight request coalescing"""
+
+import asyncio
+
+import pytest
+
+from src.rag.coalescing import RequestCoalescer, coalescing_key
+
+
+def test_key_normalizes_question_and_includes_parameters():
+    assert coalescing_key("What is  Python? ") == coalescing_key("what is python?")
+    assert coalescing_key("What is Python?") != coalescing_key("What is Python?", [{"role": "user", "content": "hi"}])
+    assert coalescing_key("What is Python?", filter={"tenant": "a"}) != coalescing_key("What is Python?", filter={"tenant": "b"})
+
+
+def test_identical_requests_share_one_run():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"answer": "Python"}
+
+    async def main():
+        results = await asyncio.gather(*(coalescer.run("key", work) for _ in range(5)))
+        # The run is over: the next request starts a new one
+        await coalescer.run("key", work)
+        return results
+
+    results = asyncio.run(main())
+    assert results == [{"answer": "Python"}] * 5
+    assert len(calls) == 2
+    assert coalescer.in_flight() == 0
+
+
+def test_cancelled_waiter_does_not_cancel_shared_run():
+    coalescer = RequestCoalescer()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(coalescer.run("key", work))
+        second = asyncio.ensure_future(coalescer.run("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_errors_reach_every_waiter():
+    coalescer = RequestCoalescer()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("LLM down")
+
+    async def main():
+        return await asyncio.gather(*(coalescer.run("key", work) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(main()))
+
+
+def test_stream_follower_joining_mid_stream_replays_events():
+    coalescer = RequestCoalescer()
+    runs = []
+
+    async def events():
+        runs.append(1)
+        for token in ["a", "b", "c"]:
+            await asyncio.sleep(0.02)
+            yield token
+
+    async def collect():
+        return [event async for event in coalescer.stream("key", events)]
+
+    async def main():
+        leader = asyncio.ensure_future(collect())
+        await asyncio.sleep(0.03)  # "a" already sent
+        follower = asyncio.ensure_future(collect())
+        return await leader, await follower
+
+    leader, follower = asyncio.run(main())
+    assert leader == follower == ["a", "b", "c"]
+    assert len(runs) == 1
+
+
+def test_stream_error_is_raised_to_subscribers():
+    coalescer = RequestCoalescer()
+
+    async def events():
+        yield "a"
+        raise RuntimeError("boom")
+
+    async def collect():
+        return [event async for event in coalescer.stream("key", events)]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect())
+
+
+def test_stream_producer_is_owned_and_outlives_disconnected_subscriber():
+    coalescer = RequestCoalescer()
+    produced = []
+
+    async def events():
+        for token in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            produced.append(token)
+            yield token
+
+    async def main():
+        stream = coalescer.stream("key", events)
+        assert await stream.__anext__() == "a"
+        producer = coalescer._streams["key"].producer
+        assert producer is not None and not producer.done()
+        await stream.aclose()  # client disconnected
+        await producer
+        return coalescer.in_flight()
+
+    assert asyncio.run(main()) == 0
+    assert produced == ["a", "b", "c"]
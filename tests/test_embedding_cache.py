@@ -0,0 +1,159 @@
+"""Tests for embedding caches"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from unittest.mock import patch
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.embedding_cache import (
+    CachedEmbeddings,
+    DocumentEmbeddingStore,
+    QueryEmbeddingCache,
+    collect_embedding_stats,
+    content_hash,
+    normalize_query,
+)
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Fake embeddings counting calls to the underlying API"""
+    
+    calls: int = 0
+    
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+    
+    def embed_documents(self, texts):
+        self.calls += 1
+        return super().embed_documents(texts)
+
+
+def test_normalize_query():
+    """Test that case and whitespace differences share a key"""
+    assert normalize_query("  What  is\tPython? ") == normalize_query("what is python?")
+
+
+def test_cached_embeddings_hits_on_repeated_query():
+    """Test that a repeated query does not call the embedding API again"""
+    base = CountingEmbeddings(size=8)
+    cache = QueryEmbeddingCache(model_name="fake")
+    embeddings = CachedEmbeddings(base, cache)
+    
+    first = embeddings.embed_query("What is Python?")
+    second = embeddings.embed_query("what is   python?")
+    
+    assert base.calls == 1
+    assert second == pytest.approx(first)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_query_cache_evicts_lru_within_byte_budget():
+    """Test that the cache stays under max_bytes by evicting the oldest entries"""
+    cache = QueryEmbeddingCache(model_name="fake", max_bytes=1000)
+    for i in range(10):
+        cache.put(f"query {i}", [0.0] * 64)
+    
+    assert cache.size_bytes <= 1000
+    assert cache.get("query 9") is not None
+    assert cache.get("query 0") is None
+
+
+def test_query_cache_ttl_expiry():
+    """Test that expired entries are treated as misses"""
+    cache = QueryEmbeddingCache(model_name="fake", ttl_seconds=10)
+    with patch("src.rag.embedding_cache.time.time", return_value=1000.0):
+        cache.put("query", [1.0, 2.0])
+    with patch("src.rag.embedding_cache.time.time", return_value=1011.0):
+        assert cache.get("query") is None
+    assert len(cache) == 0
+
+
+def test_query_cache_shared_on_disk(tmp_path):
+    """Test that two caches (e.g. two workers) share entries through SQLite"""
+    path = str(tmp_path / "query_embeddings.sqlite")
+    writer = QueryEmbeddingCache(model_name="fake", persist_path=path)
+    reader = QueryEmbeddingCache(model_name="fake", persist_path=path)
+    
+    writer.put("What is Python?", [0.5, 0.25])
+    
+    assert reader.get("what is python?") == [0.5, 0.25]
+
+
+def test_query_cache_prunes_expired_rows_on_disk(tmp_path):
+    """Expired rows are deleted on open and by later writes, the file does not grow forever"""
+    path = str(tmp_path / "query_embeddings.sqlite")
+    
+    def rows(cache):
+        return cache._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+    
+    cache = QueryEmbeddingCache(model_name="fake", ttl_seconds=10, persist_path=path, prune_interval=0)
+    with patch("src.rag.embedding_cache.time.time", return_value=1000.0):
+        cache.put("old query", [1.0])
+    assert rows(cache) == 1
+    with patch("src.rag.embedding_cache.time.time", return_value=1011.0):
+        cache.put("new query", [2.0])
+    assert rows(cache) == 1
+    
+    with patch("src.rag.embedding_cache.time.time", return_value=1022.0):
+        reopened = QueryEmbeddingCache(model_name="fake", ttl_seconds=10, persist_path=path)
+    assert rows(reopened) == 0
+
+
+def test_query_cache_disk_access_is_thread_safe(tmp_path):
+    """Test that request threads sharing one SQLite connection do not interleave statements"""
+    path = str(tmp_path / "query_embeddings.sqlite")
+    writer = QueryEmbeddingCache(model_name="fake", persist_path=path)
+    reader = QueryEmbeddingCache(model_name="fake", persist_path=path)
+    
+    def work(thread):
+        for i in range(50):
+            writer.put(f"query {thread} {i}", [float(i)])
+            assert reader.get(f"query {thread} {i}") == [float(i)]
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(work, range(8)))
+    assert reader.hits == 400
+
+
+def test_aembed_query_uses_the_persistent_cache(tmp_path):
+    """Test that the async path serves and fills the on-disk cache (off the event loop)"""
+    path = str(tmp_path / "query_embeddings.sqlite")
+    base = CountingEmbeddings(size=8)
+    first = CachedEmbeddings(base, QueryEmbeddingCache(model_name="fake", persist_path=path))
+    second = CachedEmbeddings(base, QueryEmbeddingCache(model_name="fake", persist_path=path))
+    
+    vector = asyncio.run(first.aembed_query("What is Python?"))
+    assert asyncio.run(second.aembed_query("what is python?")) == pytest.approx(vector)
+    assert second.query_cache.hits == 1
+
+
+def test_document_store_reembeds_only_changed_chunks(tmp_path):
+    """Test that re-ingesting mostly unchanged chunks only embeds the new ones"""
+    base = CountingEmbeddings(size=8)
+    store = DocumentEmbeddingStore(str(tmp_path / "embedding_cache.sqlite"), model_name="fake")
+    embeddings = CachedEmbeddings(base, document_store=store)
+    
+    first = embeddings.embed_documents(["chunk a", "chunk b", "chunk c"])
+    with collect_embedding_stats(cost_per_1k_tokens=1.0) as stats:
+        second = embeddings.embed_documents(["chunk a", "chunk b", "chunk d"])
+    
+    assert base.calls == 2
+    assert second[0] == pytest.approx(first[0])
+    assert second[1] == pytest.approx(first[1])
+    assert stats.chunks == 3
+    assert stats.cache_hits == 2
+    assert stats.hit_ratio == pytest.approx(2 / 3)
+    assert stats.tokens_saved > 0
+    assert stats.cost_saved == pytest.approx(stats.tokens_saved / 1000)
+
+
+def test_document_store_is_keyed_by_model(tmp_path):
+    """Test that embeddings from another model are not reused"""
+    path = str(tmp_path / "embedding_cache.sqlite")
+    DocumentEmbeddingStore(path, model_name="model-a").put_many([(content_hash("chunk", "model-a"), [1.0], 1)])
+    
+    store_b = DocumentEmbeddingStore(path, model_name="model-b")
+    assert store_b.get_many([content_hash("chunk", "model-b")]) == {}
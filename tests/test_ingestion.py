@@ -0,0 +1,280 @@
+"""Tests for incremental and large-scale ingestion"""
+
+import time
+from unittest.mock import patch
+
+import httpx
+import openai
+import pytest
+from tenacity import wait_none
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src.rag.embedding_writer import BatchedEmbeddingWriter, pack_by_tokens
+from src.rag.ingest_stream import prefetch, stream_ingest
+from src.rag.ingestion import DocumentIngester
+from src.rag.jobs import IngestionJobManager
+from src.rag.manifest import IngestionManifest, SyncResult, file_sha256, sync_directory, sync_upload
+from src.rag.retrieval import RetrievalSystem
+from src.rag.vector_stores import FaissVectorStore
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """Small directory of text documents"""
+    directory = tmp_path / "corpus"
+    directory.mkdir()
+    for i in range(3):
+        paragraphs = [f"Document {i} paragraph {j}. " * 5 for j in range(4)]
+        (directory / f"doc_{i}.txt").write_text("\n\n".join(paragraphs))
+    return directory
+
+
+@pytest.fixture
+def retrieval():
+    """Retrieval system over an in-memory store"""
+    embeddings = DeterministicFakeEmbedding(size=8)
+    return RetrievalSystem(
+        embeddings=embeddings,
+        vector_store=InMemoryVectorStore(embedding=embeddings)
+    )
+
+
+def test_sync_directory_is_incremental(corpus, retrieval, tmp_path):
+    """Test that re-syncing only touches changed files and keeps the index size stable"""
+    ingester = DocumentIngester(chunk_size=120, chunk_overlap=0)
+    manifest = IngestionManifest(str(tmp_path / "manifest.sqlite"))
+    
+    first = sync_directory(str(corpus), ingester, retrieval, manifest)
+    index_size = len(retrieval.vector_store.store)
+    assert first.files_changed == 3
+    assert first.chunks_added == index_size > 0
+    
+    second = sync_directory(str(corpus), ingester, retrieval, manifest)
+    assert (second.files_changed, second.chunks_added, second.chunks_deleted) == (0, 0, 0)
+    assert len(retrieval.vector_store.store) == index_size
+    
+    # Edit the last paragraph of one file: only its chunks change
+    doc = corpus / "doc_0.txt"
+    doc.write_text(doc.read_text().replace("Document 0 paragraph 3.", "Edited paragraph."))
+    third = sync_directory(str(corpus), ingester, retrieval, manifest)
+    assert third.files_changed == 1
+    assert 0 < third.chunks_added == third.chunks_deleted
+    assert third.chunks_unchanged > 0
+    assert len(retrieval.vector_store.store) == index_size
+
+
+def test_sync_directory_removes_deleted_files(corpus, retrieval, tmp_path):
+    """Test that chunks of deleted files are removed from the store"""
+    ingester = DocumentIngester(chunk_size=120, chunk_overlap=0)
+    manifest = IngestionManifest(str(tmp_path / "manifest.sqlite"))
+    sync_directory(str(corpus), ingester, retrieval, manifest)
+    index_size = len(retrieval.vector_store.store)
+    
+    (corpus / "doc_1.txt").unlink()
+    result = sync_directory(str(corpus), ingester, retrieval, manifest)
+    
+    assert result.files_removed == 1
+    assert len(retrieval.vector_store.store) == index_size - result.chunks_deleted
+    assert len(manifest) == 2
+
+
+def test_ingestion_interrupted_before_flush_is_redone(corpus, tmp_path):
+    """Chunks written to the docstore but not to the index file are not reported as indexed"""
+    embeddings = DeterministicFakeEmbedding(size=8)
+    ingester = DocumentIngester(chunk_size=120, chunk_overlap=0)
+    manifest = IngestionManifest(str(tmp_path / "manifest.sqlite"))
+    store = FaissVectorStore(embeddings, str(tmp_path / "faiss"))
+    sync_directory(str(corpus), ingester, RetrievalSystem(embeddings=embeddings, vector_store=store), manifest)
+    # Crash before flush(): the OS releases the writer lock, the index file is never written
+    store._release_writer()
+
+    reopened = FaissVectorStore(embeddings, str(tmp_path / "faiss"))
+    assert len(reopened.docstore) == 0 and len(reopened.dropped_ids) > 0
+    assert len(manifest.forget_chunks(reopened.dropped_ids)) == 3
+
+    retrieval = RetrievalSystem(embeddings=embeddings, vector_store=reopened)
+    result = sync_directory(str(corpus), ingester, retrieval, manifest)
+    retrieval.flush()
+    assert result.files_changed == 3 and result.chunks_added == len(reopened.dropped_ids)
+    assert FaissVectorStore(embeddings, str(tmp_path / "faiss")).dropped_ids == []
+    assert reopened.ntotal == len(reopened.docstore) == result.chunks_added
+
+
+def test_parallel_ingestion_matches_serial_order(corpus, caplog):
+    """Test that the shared spawned pool returns the same chunks, in the same order, as serial loading"""
+    (corpus / "broken.pdf").write_bytes(b"not a pdf")
+    serial = DocumentIngester(chunk_size=120, chunk_overlap=0).ingest_directory(str(corpus))
+    ingester = DocumentIngester(chunk_size=120, chunk_overlap=0, max_workers=2, max_in_flight=2)
+    try:
+        assert ingester._pool._mp_context.get_start_method() == "spawn"
+        parallel = ingester.ingest_directory(str(corpus))
+        workers = set(ingester._pool._processes)
+        
+        # ingest(is_directory=True) and load_directory reuse the same workers and log skipped files
+        caplog.clear()
+        with caplog.at_level("WARNING", logger="src.rag.ingestion"):
+            chunks = ingester.ingest(str(corpus), is_directory=True)
+            documents = ingester.load_directory(str(corpus))
+        assert sum("broken.pdf" in record.getMessage() for record in caplog.records) == 2
+        assert set(ingester._pool._processes) == workers
+    finally:
+        ingester.shutdown()
+    
+    assert [c.page_content for c in parallel.chunks] == [c.page_content for c in serial.chunks]
+    assert [c.page_content for c in chunks] == [c.page_content for c in serial.chunks]
+    assert len(documents) == 3
+    assert parallel.files_processed == 4
+    assert list(parallel.errors) == [str(corpus / "broken.pdf")]
+
+
+def test_files_are_parsed_in_the_ingester_process_pool(corpus):
+    """With use_processes, parsing runs in long-lived worker processes, not in the caller"""
+    ingester = DocumentIngester(chunk_size=120, chunk_overlap=0, use_processes=True)
+    try:
+        chunks = ingester.ingest(str(corpus / "doc_0.txt"))
+        workers = set(ingester._pool._processes)
+        assert chunks and len(workers) == 1
+        with pytest.raises(ValueError):
+            ingester.ingest(str(corpus / "notes.md"))
+        sync_directory(str(corpus), ingester, RetrievalSystem(
+            embeddings=DeterministicFakeEmbedding(size=8),
+            vector_store=InMemoryVectorStore(embedding=DeterministicFakeEmbedding(size=8))
+        ), IngestionManifest(str(corpus.parent / "manifest.sqlite")))
+        assert set(ingester._pool._processes) == workers  # the same pool is reused
+    finally:
+        ingester.shutdown()
+
+
+def test_prefetch_applies_backpressure():
+    """Test that the producer never runs more than max_items ahead of the consumer"""
+    produced = []
+    
+    def producer():
+        for i in range(20):
+            produced.append(i)
+            yield i
+    
+    stream = prefetch(producer(), max_items=2)
+    assert next(stream) == 0
+    time.sleep(0.2)
+    # 1 consumed + 2 queued + 1 blocked in put
+    assert len(produced) <= 4
+    assert list(stream) == list(range(1, 20))
+
+
+def test_stream_ingest_writes_in_batches(corpus, retrieval):
+    """Test that streaming ingestion writes every chunk, batch by batch"""
+    ingester = DocumentIngester(chunk_size=120, chunk_overlap=0)
+    expected = ingester.ingest_directory(str(corpus)).chunks_count
+    
+    writes = []
+    original = retrieval.add_embedded_documents
+    retrieval.add_embedded_documents = lambda docs, vectors: writes.append(len(docs)) or original(docs, vectors)
+    
+    result = stream_ingest(ingester, retrieval, str(corpus), batch_size=5)
+    
+    assert result.chunks_count == expected == sum(writes)
+    assert max(writes) <= 5
+    assert len(retrieval.vector_store.store) == expected
+
+
+def test_pack_by_tokens_respects_limits():
+    """Test that requests stay under the token and input limits, in order"""
+    requests = pack_by_tokens([40, 40, 30, 90, 10, 10, 10], max_tokens=100, max_inputs=3)
+    
+    assert requests == [[0, 1], [2], [3, 4], [5, 6]]
+
+
+class FlakyEmbeddings(DeterministicFakeEmbedding):
+    """Fake embeddings answering 429 to the first request"""
+    
+    calls: int = 0
+    
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls == 1:
+            raise openai.RateLimitError(
+                "rate limited",
+                response=httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com")),
+                body=None
+            )
+        return super().embed_documents(texts)
+
+
+def test_embedding_writer_retries_rate_limits_and_keeps_order():
+    """Test that 429s are retried and vectors come back in input order"""
+    embeddings = FlakyEmbeddings(size=8)
+    writer = BatchedEmbeddingWriter(
+        embeddings,
+        model_name="fake",
+        max_tokens_per_request=10,
+        max_concurrency=3
+    )
+    texts = [f"chunk number {i} " * 3 for i in range(12)]
+    
+    with patch("src.rag.embedding_writer.wait_random_exponential", return_value=wait_none()):
+        vectors = writer.embed(texts)
+    
+    assert embeddings.calls > 2
+    assert vectors == [DeterministicFakeEmbedding(size=8).embed_query(text) for text in texts]
+
+
+def test_ingestion_job_reports_progress(corpus, retrieval, tmp_path):
+    """A job runs in the background and exposes its progress and result"""
+    ingester = DocumentIngester(chunk_size=200, chunk_overlap=0)
+    manifest = IngestionManifest(str(tmp_path / "manifest.sqlite"))
+
+    def runner(job):
+        sync = sync_directory(job.source, ingester, retrieval, manifest, progress=job.add_progress)
+        return {"chunks_count": sync.chunks_added}
+
+    jobs = IngestionJobManager(runner, journal_path=str(tmp_path / "jobs.jsonl"))
+    job = jobs.submit("path", str(corpus), is_directory=True)
+    result = jobs.future(job.id).result(timeout=30)
+
+    snapshot = jobs.get(job.id).snapshot()
+    assert snapshot["status"] == "succeeded"
+    assert snapshot["files_processed"] == 3
+    assert snapshot["chunks_embedded"] == result["chunks_count"] > 0
+    assert snapshot["chunks_per_second"] > 0
+    jobs.shutdown(wait=True)
+
+
+def test_ingestion_jobs_resume_after_restart(tmp_path):
+    """Unfinished jobs found in the journal are resubmitted"""
+    journal = str(tmp_path / "jobs.jsonl")
+    blocked = IngestionJobManager(lambda job: time.sleep(0.5) or {}, journal_path=journal)
+    blocked.submit("path", "first")
+    queued = blocked.submit("path", "second")
+    blocked.shutdown(wait=False)  # "crash" while the second job is still queued
+
+    restarted = IngestionJobManager(lambda job: {"chunks_count": 1}, journal_path=journal)
+    resumed = restarted.recover(can_resume=lambda job: True)
+
+    assert queued.id in [job.id for job in resumed]
+    restarted.future(queued.id).result(timeout=30)
+    assert restarted.get(queued.id).status == "succeeded"
+    restarted.shutdown(wait=True)
+
+
+def test_sync_upload_deduplicates_by_content_hash(corpus, retrieval, tmp_path):
+    """An identical upload is skipped; a modified re-upload replaces its chunks"""
+    ingester = DocumentIngester(chunk_size=200, chunk_overlap=0)
+    manifest = IngestionManifest(str(tmp_path / "manifest.sqlite"))
+    upload = corpus / "doc_0.txt"
+
+    first = SyncResult()
+    chunks = sync_upload(str(upload), "upload://doc.txt", file_sha256(str(upload)), ingester, retrieval, manifest, first)
+    assert chunks and first.chunks_added == len(chunks)
+    assert chunks[0].metadata["source"] == "upload://doc.txt"
+
+    again = SyncResult()
+    assert sync_upload(str(upload), "upload://doc.txt", file_sha256(str(upload)), ingester, retrieval, manifest, again) == []
+    assert again.files_unchanged == 1
+
+    upload.write_text(upload.read_text() + "\n\nA brand new closing paragraph.")
+    edited = SyncResult()
+    sync_upload(str(upload), "upload://doc.txt", file_sha256(str(upload)), ingester, retrieval, manifest, edited)
+    assert edited.files_changed == 1
+    assert 0 < edited.chunks_added < len(manifest.get("upload://doc.txt").chunk_ids) + 1
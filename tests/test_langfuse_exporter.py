@@ -0,0 +1,66 @@
+"""Tests for the background Langfuse score exporter"""
+
+import threading
+import time
+
+from src.utils.langfuse_exporter import ScoreExporter, ScoreRecord
+
+
+def records(n):
+    return [ScoreRecord(name="relevance", value=i / n, trace_id=f"trace-{i}") for i in range(n)]
+
+
+def test_scores_are_sent_in_batches():
+    batches = []
+    exporter = ScoreExporter(send=lambda batch: batches.append(len(batch)), batch_size=3, flush_interval=10)
+
+    for record in records(7):
+        assert exporter.submit(record)
+    assert exporter.flush(timeout=2)
+    exporter.shutdown()
+
+    assert sum(batches) == 7
+    assert max(batches) <= 3
+    assert exporter.exported == 7
+
+
+def test_partial_batch_is_sent_after_flush_interval():
+    sent = threading.Event()
+    exporter = ScoreExporter(send=lambda batch: sent.set(), batch_size=100, flush_interval=0.05)
+
+    exporter.submit(records(1)[0])
+    assert sent.wait(1)
+    exporter.shutdown()
+
+
+def test_full_queue_drops_without_blocking():
+    release = threading.Event()
+    exporter = ScoreExporter(send=lambda batch: release.wait(2), max_queue=2, batch_size=1, flush_interval=0.01)
+
+    start = time.perf_counter()
+    results = [exporter.submit(record) for record in records(10)]
+    elapsed = time.perf_counter() - start
+    release.set()
+    exporter.shutdown()
+
+    assert elapsed < 0.5  # Langfuse hanging never blocks the request path
+    assert not all(results)
+    assert exporter.dropped == results.count(False)
+
+
+def test_failed_batches_are_retried_with_backoff():
+    attempts = []
+
+    def flaky(batch):
+        attempts.append(len(batch))
+        if len(attempts) < 3:
+            raise ConnectionError("Langfuse unavailable")
+
+    exporter = ScoreExporter(send=flaky, batch_size=2, max_retries=3, backoff_seconds=0.001)
+    for record in records(2):
+        exporter.submit(record)
+    assert exporter.flush(timeout=2)
+    exporter.shutdown()
+
+    assert attempts == [2, 2, 2]
+    assert exporter.exported == 2
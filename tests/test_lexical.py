@@ -0,0 +1,112 @@
+"""Tests for the BM25 index and hybrid retrieval"""
+
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+from prometheus_client import REGISTRY
+
+from src.config import settings
+from src.rag.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from src.rag.retrieval import RetrievalSystem
+
+DOCS = [
+    "Error ERR-4021 is raised when the payment gateway times out.",
+    "Use retry_with_backoff() to call flaky services.",
+    "The SKU AB-778.2 ships in two business days.",
+    "General notes about payments and refunds.",
+]
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    tokens = tokenize("See ERR-4021 in v1.2.3")
+    assert {"err-4021", "err", "4021", "v1.2.3", "v1"} <= set(tokens)
+
+
+def test_bm25_incremental_updates_and_persistence(tmp_path):
+    index = BM25Index()
+    index.add([str(i) for i in range(len(DOCS))], DOCS)
+    assert index.search("ERR-4021", k=2)[0][0] == "0"
+
+    index.add(["0"], ["Nothing to see here."])  # re-index replaces the old postings
+    assert all(doc_id != "0" for doc_id, _ in index.search("ERR-4021", k=4))
+    index.delete(["2"])
+    assert index.search("AB-778.2", k=4) == []
+
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert len(loaded) == 3
+    assert loaded.search("retry_with_backoff", k=1)[0][0] == "1"
+
+
+def test_reciprocal_rank_fusion_weights():
+    a, b, c = (Document(id=x, page_content=x) for x in "abc")
+    assert [doc.id for doc in reciprocal_rank_fusion([[a, b], [c, b]])][0] == "b"
+    assert [doc.id for doc in reciprocal_rank_fusion([[a, b], [c]], weights=[1, 2])][0] == "c"
+
+
+class BrokenQueryEmbeddings(DeterministicFakeEmbedding):
+    """Embedding service that is down for queries"""
+
+    def embed_query(self, text):
+        raise ConnectionError("embedding service unavailable")
+
+
+def build_retrieval(embeddings):
+    retrieval = RetrievalSystem(embeddings=embeddings, vector_store=InMemoryVectorStore(embedding=embeddings), top_k=2)
+    retrieval.add_documents([Document(page_content=text) for text in DOCS], ids=[str(i) for i in range(len(DOCS))])
+    return retrieval
+
+
+def test_hybrid_search_finds_exact_identifiers():
+    with patch.object(settings, "retrieval_mode", "hybrid"):
+        retrieval = build_retrieval(DeterministicFakeEmbedding(size=16))
+    results = retrieval.similarity_search("what does ERR-4021 mean?")
+    assert results[0].id == "0"
+
+
+def fallbacks(reason):
+    return REGISTRY.get_sample_value("rag_lexical_fallbacks_total", {"reason": reason}) or 0
+
+
+def test_vector_mode_keeps_no_bm25_index_by_default():
+    with patch.object(settings, "retrieval_mode", "vector"), \
+         patch.object(settings, "query_embedding_cache_enabled", False):
+        retrieval = build_retrieval(BrokenQueryEmbeddings(size=16))
+    assert retrieval.lexical_index is None
+    # No silent BM25 answer: the outage surfaces
+    with pytest.raises(ConnectionError):
+        retrieval.similarity_search("SKU AB-778.2")
+    assert retrieval._search_executor is None
+
+
+def test_lexical_fallback_when_embeddings_are_down():
+    with patch.object(settings, "retrieval_mode", "hybrid"), \
+         patch.object(settings, "query_embedding_cache_enabled", False):
+        retrieval = build_retrieval(BrokenQueryEmbeddings(size=16))
+    before = fallbacks("unavailable")
+    assert retrieval.similarity_search("SKU AB-778.2")[0].id == "2"
+    assert fallbacks("unavailable") == before + 1
+    # Cooldown: the vector path is skipped until it expires
+    assert retrieval._vector_unavailable_until > 0
+
+
+class BuggyQueryEmbeddings(DeterministicFakeEmbedding):
+    """A bug, not an outage"""
+
+    def embed_query(self, text):
+        raise KeyError("dimension")
+
+
+@pytest.mark.parametrize("timeout", [0, 2.0])
+def test_lexical_fallback_does_not_hide_other_errors(timeout):
+    with patch.object(settings, "retrieval_mode", "hybrid"), \
+         patch.object(settings, "query_embedding_cache_enabled", False), \
+         patch.object(settings, "lexical_fallback_timeout_seconds", timeout):
+        retrieval = build_retrieval(BuggyQueryEmbeddings(size=16))
+        with pytest.raises(KeyError):
+            retrieval.similarity_search("SKU AB-778.2")
+    assert retrieval._vector_unavailable_until == 0
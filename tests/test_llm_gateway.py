@@ -0,0 +1,133 @@
+"""Tests for the LLM gateway (concurrency limit, queue, load shedding)"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.rag.llm_gateway import LLMGateway, LLMOverloaded
+
+
+def test_concurrency_is_limited_and_queue_drains_in_order():
+    gateway = LLMGateway(max_concurrency=2, max_queue=10, queue_timeout=5, tokens_per_minute=0)
+    running, peak, order = 0, 0, []
+
+    async def call(i):
+        nonlocal running, peak
+        async with gateway.aslot():
+            running += 1
+            peak = max(peak, running)
+            order.append(i)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+    async def main():
+        await asyncio.gather(*(call(i) for i in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert order == list(range(6))
+    assert (gateway.in_flight, gateway.queued) == (0, 0)
+
+
+def test_full_queue_is_shed_with_retry_after():
+    gateway = LLMGateway(max_concurrency=1, max_queue=0, queue_timeout=5, tokens_per_minute=0)
+
+    with gateway.slot():
+        with pytest.raises(LLMOverloaded) as error:
+            with gateway.slot():
+                pass
+    assert error.value.reason == "queue_full"
+    assert error.value.retry_after >= 1
+    with gateway.slot():
+        pass
+
+
+def test_waiter_times_out_at_deadline():
+    gateway = LLMGateway(max_concurrency=1, max_queue=5, queue_timeout=0.05, tokens_per_minute=0)
+    gateway._call_seconds = 0.01
+    holding = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with gateway.slot():
+            holding.set()
+            release.wait(1)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    holding.wait(1)
+    start = time.monotonic()
+    with pytest.raises(LLMOverloaded) as error:
+        with gateway.slot():
+            pass
+    release.set()
+    holder.join()
+    assert error.value.reason == "timeout"
+    assert time.monotonic() - start < 0.5
+    assert gateway.queued == 0
+
+
+def test_expected_wait_past_deadline_is_shed_immediately():
+    gateway = LLMGateway(max_concurrency=1, max_queue=5, queue_timeout=1, tokens_per_minute=0)
+    gateway._call_seconds = 30.0
+
+    with gateway.slot():
+        with pytest.raises(LLMOverloaded) as error:
+            with gateway.slot():
+                pass
+    assert error.value.reason == "deadline"
+
+
+def test_expected_wait_counts_what_running_calls_have_left():
+    """Calls longer than the queue timeout do not disable the queue"""
+    gateway = LLMGateway(max_concurrency=1, max_queue=5, queue_timeout=10, tokens_per_minute=0)
+    gateway._call_seconds = 12.0
+    clock = patch("src.rag.llm_gateway.time.monotonic")
+
+    with clock as now:
+        now.return_value = 1000.0
+        with gateway.slot():
+            now.return_value = 1005.0
+            assert gateway._expected_wait() == pytest.approx(7.0)
+            gateway.check()  # 7s left: the request may queue
+            now.return_value = 1001.0
+            with pytest.raises(LLMOverloaded) as error:
+                gateway.check()  # 11s left: past the deadline
+    assert error.value.reason == "deadline"
+
+
+def test_tokens_per_minute_budget():
+    gateway = LLMGateway(max_concurrency=4, max_queue=5, queue_timeout=1, tokens_per_minute=100)
+
+    with gateway.slot(tokens=80) as call:
+        call.record(60)  # billed less than reserved
+    assert gateway.tokens_last_minute() == 60
+    with pytest.raises(LLMOverloaded) as error:
+        with gateway.slot(tokens=50):
+            pass
+    assert error.value.reason == "tpm"
+    with gateway.slot(tokens=40):
+        pass
+
+
+def test_settled_reservation_ages_out_as_one_entry():
+    """Billed/refunded tokens correct the reservation in place, under its own timestamp"""
+    gateway = LLMGateway(max_concurrency=4, max_queue=5, queue_timeout=1, tokens_per_minute=100)
+    clock = patch("src.rag.llm_gateway.time.monotonic")
+
+    with clock as now:
+        now.return_value = 1000.0
+        with gateway.slot(tokens=80) as call:
+            now.return_value = 1030.0
+            call.record(20)
+        assert gateway.tokens_last_minute() == 20
+        with gateway.slot(tokens=70) as call:
+            call.record(70)
+        now.return_value = 1061.0
+        # Only the first call aged out: no negative refund left behind
+        assert gateway.tokens_last_minute() == 70
+        now.return_value = 1091.0
+        assert gateway.tokens_last_minute() == 0
@@ -0,0 +1,73 @@
+"""Tests for metadata filters and the bitmap index"""
+
+from unittest.mock import patch
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src.config import settings
+from src.rag.metadata_index import (
+    MetadataIndex,
+    bitmap_ids,
+    bitmap_to_bytes,
+    matches,
+    normalize_filter,
+    to_chroma_where,
+)
+from src.rag.retrieval import RetrievalSystem
+
+
+def test_metadata_index_select_add_remove():
+    index = MetadataIndex(["source", "tenant"])
+    index.add([1, 5000, 9000], [
+        {"source": "a.pdf", "tenant": "x"},
+        {"source": "b.pdf", "tenant": "x"},
+        {"source": "a.pdf", "tenant": "y", "page": 2},
+    ])
+
+    assert bitmap_ids(index.select({"source": "a.pdf"})) == [1, 9000]
+    assert bitmap_ids(index.select({"source": ["a.pdf", "b.pdf"], "tenant": "x"})) == [1, 5000]
+    assert index.select({"tenant": "z"}) == {}
+    assert index.select({"page": 2}) is None  # not indexed: caller post-filters
+    assert index.split({"tenant": "y", "page": 2}) == ({"tenant": ["y"]}, {"page": [2]})
+
+    index.remove([1])
+    index.add([5000], [{"source": "a.pdf", "tenant": "x"}])  # re-adding replaces
+    assert bitmap_ids(index.select({"source": "a.pdf"})) == [5000, 9000]
+
+    packed = bitmap_to_bytes(index.select({"tenant": "y"}))
+    assert packed[9000 >> 3] == 1 << (9000 & 7) and packed.sum() == packed[9000 >> 3]
+
+
+def test_filter_validation_and_translation():
+    assert normalize_filter({"source": "a.pdf"}) == {"source": ["a.pdf"]}
+    with pytest.raises(ValueError):
+        normalize_filter({"source": {"$ne": "a.pdf"}})
+    with pytest.raises(ValueError):
+        normalize_filter({"source": []})
+
+    assert to_chroma_where({"source": "a.pdf"}) == {"source": {"$eq": "a.pdf"}}
+    assert to_chroma_where({"source": ["a", "b"], "flag": True}) == {
+        "$and": [{"source": {"$in": ["a", "b"]}}, {"flag": {"$eq": True}}]
+    }
+    assert matches({"flag": True}, {"flag": True}) and not matches({"flag": 1}, {"flag": True})
+
+
+def test_retrieval_system_filter_in_vector_and_lexical_modes():
+    embeddings = DeterministicFakeEmbedding(size=16)
+    with patch.object(settings, "lexical_index_enabled", True):
+        retrieval = RetrievalSystem(embeddings=embeddings, vector_store=InMemoryVectorStore(embedding=embeddings), top_k=3)
+    docs = [Document(page_content=f"invoice {i}", metadata={"tenant": f"t{i % 4}"}) for i in range(40)]
+    retrieval.add_documents(docs, ids=[str(i) for i in range(40)])
+
+    results = retrieval.similarity_search("invoice 5", filter={"tenant": "t1"})
+    assert len(results) == 3 and {doc.metadata["tenant"] for doc in results} == {"t1"}
+
+    retrieval.retrieval_mode = "lexical"
+    results = retrieval.similarity_search("invoice", k=10, filter={"tenant": "t2"})
+    assert len(results) == 10 and {doc.metadata["tenant"] for doc in results} == {"t2"}
+
+    with pytest.raises(ValueError):
+        retrieval.similarity_search("invoice", filter={"tenant": [["nested"]]})
@@ -0,0 +1,124 @@
+"""Tests for the async MLflow client (pooling, per-run handles, retries)"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src.utils.mlflow_rest import AsyncMLflowClient, MLflowError
+
+
+class FakeMLflow:
+    """In-memory MLflow tracking server behind an httpx.MockTransport"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.requests = []
+        self.runs = {}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/api/2.0/mlflow")
+        self.requests.append(path)
+        if self.failures:
+            self.failures -= 1
+            return httpx.Response(503, text="unavailable")
+        body = json.loads(request.content) if request.content else {}
+        if path == "/experiments/get-by-name":
+            return httpx.Response(200, json={"experiment": {"experiment_id": "1"}})
+        if path == "/runs/create":
+            run_id = f"run-{len(self.runs)}"
+            self.runs[run_id] = {"params": {}, "metrics": {}, "status": "RUNNING"}
+            return httpx.Response(200, json={"run": {"info": {"run_id": run_id}}})
+        if path == "/runs/log-batch":
+            run = self.runs[body["run_id"]]
+            run["params"].update({p["key"]: p["value"] for p in body["params"]})
+            run["metrics"].update({m["key"]: m["value"] for m in body["metrics"]})
+            return httpx.Response(200, json={})
+        if path == "/runs/update":
+            self.runs[body["run_id"]]["status"] = body["status"]
+            return httpx.Response(200, json={})
+        return httpx.Response(404, json={"error_code": "ENDPOINT_NOT_FOUND"})
+
+    def client(self, **kwargs) -> AsyncMLflowClient:
+        kwargs.setdefault("backoff_seconds", 0)
+        return AsyncMLflowClient(
+            tracking_uri="http://mlflow:5000",
+            experiment_name="test",
+            transport=httpx.MockTransport(self.handler),
+            **kwargs
+        )
+
+
+def test_concurrent_runs_log_to_their_own_run():
+    server = FakeMLflow()
+
+    async def upload(client, name, chunks):
+        async with await client.start_run(run_name=name) as run:
+            await asyncio.sleep(0)
+            run.log_param("filename", name)
+            run.log_metric("chunks_created", chunks)
+        return run.run_id
+
+    async def main():
+        client = server.client()
+        run_ids = await asyncio.gather(*(upload(client, f"doc{i}.pdf", i) for i in range(5)))
+        await client.aclose()
+        return run_ids
+
+    run_ids = asyncio.run(main())
+    assert len(set(run_ids)) == 5
+    for i, run_id in enumerate(run_ids):
+        run = server.runs[run_id]
+        assert run["params"] == {"filename": f"doc{i}.pdf"}
+        assert run["metrics"] == {"chunks_created": float(i)}
+        assert run["status"] == "FINISHED"
+    # Experiment looked up once; params and metrics of a run sent in one request
+    assert server.requests.count("/experiments/get-by-name") == 1
+    assert server.requests.count("/runs/log-batch") == 5
+
+
+def test_run_is_marked_failed_on_exception():
+    server = FakeMLflow()
+
+    async def main():
+        client = server.client()
+        with pytest.raises(ValueError):
+            async with await client.start_run(run_name="broken") as run:
+                raise ValueError("ingestion failed")
+        await client.aclose()
+        return run.run_id
+
+    assert server.runs[asyncio.run(main())]["status"] == "FAILED"
+
+
+def test_large_batches_are_split():
+    server = FakeMLflow()
+
+    async def main():
+        client = server.client()
+        run = await client.start_run()
+        for step in range(1500):
+            run.log_metric("loss", 1.0, step=step)
+        await run.flush()
+        await client.aclose()
+
+    asyncio.run(main())
+    assert server.requests.count("/runs/log-batch") == 2
+
+
+def test_retries_are_bounded():
+    recovering = FakeMLflow(failures=2)
+    down = FakeMLflow(failures=100)
+
+    async def main(server):
+        client = server.client(max_retries=2)
+        try:
+            return await client.start_run()
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(main(recovering)).run_id == "run-0"
+    with pytest.raises(MLflowError):
+        asyncio.run(main(down))
+    assert len(down.requests) == 3
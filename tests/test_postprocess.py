@@ -0,0 +1,85 @@
+"""Tests for post-retrieval MMR, similarity cutoff and per-source caps"""
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src.rag.postprocess import RetrievalOptions, select_documents
+from src.rag.retrieval import RetrievalSystem
+
+
+def make_docs(sources):
+    return [Document(page_content=f"doc {i}", metadata={"source": source}) for i, source in enumerate(sources)]
+
+
+def test_mmr_skips_near_duplicates():
+    docs = make_docs(["a", "a", "b"])
+    vectors = [[1.0, 0.0], [0.99, 0.01], [0.7, 0.7]]
+    query = [1.0, 0.0]
+
+    plain = select_documents(docs, vectors, 2, RetrievalOptions(score_threshold=-1.0), query_vector=query)
+    assert [doc.page_content for doc in plain] == ["doc 0", "doc 1"]
+
+    diverse = select_documents(docs, vectors, 2, RetrievalOptions(mmr=True, mmr_lambda=0.3), query_vector=query)
+    assert [doc.page_content for doc in diverse] == ["doc 0", "doc 2"]
+    assert "similarity" in diverse[0].metadata
+
+
+def test_score_threshold_and_source_cap():
+    docs = make_docs(["a", "a", "a", "b", "c"])
+    vectors = [[1.0, 0.0], [0.95, 0.05], [0.9, 0.1], [0.8, 0.2], [0.0, 1.0]]
+    options = RetrievalOptions(score_threshold=0.5, max_per_source=2)
+
+    selected = select_documents(docs, vectors, 5, options, query_vector=[1.0, 0.0])
+    assert [doc.page_content for doc in selected] == ["doc 0", "doc 1", "doc 3"]
+
+
+def test_rank_order_is_kept_without_query_vector():
+    docs = make_docs(["a", "a", "b"])
+    selected = select_documents(docs, [[1, 0], [1, 0], [0, 1]], 2, RetrievalOptions(max_per_source=1))
+    assert [doc.page_content for doc in selected] == ["doc 0", "doc 2"]
+
+
+def test_retrieval_system_applies_options():
+    embeddings = DeterministicFakeEmbedding(size=16)
+    retrieval = RetrievalSystem(
+        embeddings=embeddings, vector_store=InMemoryVectorStore(embedding=embeddings), top_k=3
+    )
+    docs = [Document(page_content="same text", metadata={"source": "a.txt"}) for _ in range(5)]
+    docs += [Document(page_content=f"other {i}", metadata={"source": f"{i}.txt"}) for i in range(5)]
+    retrieval.add_documents(docs, ids=[str(i) for i in range(10)])
+
+    results = retrieval.similarity_search("same text", options=RetrievalOptions(max_per_source=1, fetch_k=10))
+    assert len(results) == 3
+    assert len({doc.metadata["source"] for doc in results}) == 3
+    assert results[0].page_content == "same text"
+
+
+def test_search_and_post_processing_share_one_query_embedding():
+    """Without the query embedding cache, MMR must not embed the query a second time"""
+    import asyncio
+    from unittest.mock import patch
+    from src.config import settings
+
+    class CountingEmbeddings(DeterministicFakeEmbedding):
+        calls: int = 0
+
+        def embed_query(self, text):
+            self.calls += 1
+            return super().embed_query(text)
+
+    embeddings = CountingEmbeddings(size=16)
+    with patch.object(settings, "query_embedding_cache_enabled", False):
+        retrieval = RetrievalSystem(
+            embeddings=embeddings, vector_store=InMemoryVectorStore(embedding=embeddings), top_k=2
+        )
+    retrieval.add_documents(make_docs(["a", "b", "c", "d"]), ids=[str(i) for i in range(4)])
+    options = RetrievalOptions(mmr=True, fetch_k=4)
+
+    assert len(retrieval.similarity_search("doc 1", options=options)) == 2
+    assert len(asyncio.run(retrieval.asimilarity_search("doc 1", options=options))) == 2
+    assert embeddings.calls == 2
+
+    # A vector the caller already computed is not embedded again
+    retrieval.similarity_search("doc 1", options=options, query_vector=embeddings.embed_query("doc 1"))
+    assert embeddings.calls == 3
@@ -1,12 +1,18 @@
 """Tests for RAG components"""
 
+import asyncio
+
 import pytest
 from unittest.mock import Mock, patch
-from langchain.schema import Document
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.vectorstores import InMemoryVectorStore
 
 from src.rag.ingestion import DocumentIngester
 from src.rag.retrieval import RetrievalSystem
 from src.rag.generation import RAGGenerator
+from src.rag.pipeline import RAGPipeline
 
 
 @pytest.fixture
@@ -34,8 +40,8 @@ def test_document_ingester_chunking(sample_documents):
 
 
 @patch('src.rag.retrieval.OpenAIEmbeddings')
-@patch('src.rag.retrieval.Chroma')
-def test_retrieval_system_initialization(mock_chroma, mock_embeddings):
+@patch('src.rag.retrieval.create_vector_store')
+def test_retrieval_system_initialization(mock_vector_store, mock_embeddings):
     """Test retrieval system initialization"""
     retrieval = RetrievalSystem()
     assert retrieval is not None
@@ -55,3 +61,126 @@ def test_rag_generator_prompt_template():
     generator = RAGGenerator()
     assert generator.prompt_template is not None
 
+
+@pytest.fixture
+def fake_pipeline(sample_documents):
+    """RAG pipeline wired to in-memory fakes (no network)"""
+    embeddings = DeterministicFakeEmbedding(size=16)
+    vector_store = InMemoryVectorStore(embedding=embeddings)
+    retrieval = RetrievalSystem(
+        embeddings=embeddings,
+        vector_store=vector_store,
+        top_k=2
+    )
+    retrieval.add_documents(sample_documents)
+    generator = RAGGenerator(
+        llm=FakeListChatModel(responses=["Python is a programming language."]),
+        use_langfuse=False
+    )
+    return RAGPipeline(retrieval, generator)
+
+
+def test_pipeline_arun_matches_run(fake_pipeline):
+    """Test that the async pipeline returns the same payload as the sync one"""
+    sync_result = fake_pipeline.run("What is Python?")
+    async_result = asyncio.run(fake_pipeline.arun("What is Python?"))
+    
+    assert async_result["answer"] == "Python is a programming language."
+    assert async_result["answer"] == sync_result["answer"]
+    assert len(async_result["sources"]) == 2
+
+
+def test_pipeline_astream_answer_event_order(fake_pipeline):
+    """Test that sources are streamed first, then tokens, then the final event"""
+    async def collect():
+        return [event async for event in fake_pipeline.astream_answer("What is Python?")]
+    
+    events = asyncio.run(collect())
+    kinds = [event["event"] for event in events]
+    
+    assert kinds[0] == "sources"
+    assert kinds[-1] == "end"
+    assert set(kinds[1:-1]) == {"token"}
+    tokens = "".join(event["content"] for event in events if event["event"] == "token")
+    assert tokens == events[-1]["answer"] == "Python is a programming language."
+
+
+def test_concurrent_requests_get_their_own_trace_id(fake_pipeline):
+    """Each request is traced under the id generated for it, even when runs overlap"""
+    from langchain_core.callbacks import BaseCallbackHandler
+    
+    class RecordingHandler(BaseCallbackHandler):
+        def __init__(self):
+            self.root_runs = []
+        
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+            if parent_run_id is None:
+                self.root_runs.append(str(run_id))
+    
+    handler = RecordingHandler()
+    fake_pipeline.generator.langfuse_handler = handler
+    fake_pipeline.generator.llm = FakeListChatModel(responses=["ok"], sleep=0.01)
+    
+    async def main():
+        return await asyncio.gather(*(fake_pipeline.arun(f"Question {i}") for i in range(4)))
+    
+    results = asyncio.run(main())
+    trace_ids = [result["trace_id"] for result in results]
+    
+    assert len(set(trace_ids)) == 4
+    assert sorted(trace_ids) == sorted(handler.root_runs)
+
+
+def test_stage_durations_and_tokens_are_recorded(fake_pipeline):
+    """Each stage is timed with the request trace as exemplar; tokens are counted per model"""
+    from langchain_core.callbacks import BaseCallbackHandler
+    from prometheus_client import REGISTRY
+    from src.monitoring.prometheus import stage_duration
+    
+    def stage_count(stage):
+        return REGISTRY.get_sample_value("rag_stage_duration_seconds_count", {"stage": stage}) or 0
+    
+    def tokens(kind):
+        labels = {"model": fake_pipeline.generator.llm_model, "kind": kind}
+        return REGISTRY.get_sample_value("rag_llm_tokens_total", labels) or 0
+    
+    stages = ["vector_search", "prompt", "llm_first_token", "llm"]
+    before = {stage: stage_count(stage) for stage in stages}
+    prompt_tokens, completion_tokens = tokens("prompt"), tokens("completion")
+    # Exemplars are only attached to traces actually sent to Langfuse
+    fake_pipeline.generator.langfuse_handler = BaseCallbackHandler()
+    
+    async def collect():
+        return [event async for event in fake_pipeline.astream_answer("What is Python?", use_cache=False)]
+    
+    trace_id = asyncio.run(collect())[-1]["trace_id"]
+    
+    assert all(stage_count(stage) == before[stage] + 1 for stage in stages)
+    assert tokens("prompt") > prompt_tokens and tokens("completion") > completion_tokens
+    exemplars = [
+        sample.exemplar.labels["trace_id"]
+        for metric in stage_duration.collect() for sample in metric.samples
+        if sample.labels.get("stage") == "llm" and sample.exemplar
+    ]
+    assert trace_id in exemplars
+
+
+@pytest.mark.parametrize("cache_enabled", [True, False])
+def test_query_embedding_stage_is_timed_without_caches(cache_enabled):
+    """The stage comes from RetrievalSystem, not from the embedding caches"""
+    from prometheus_client import REGISTRY
+    from src.config import settings
+    
+    def stage_count():
+        return REGISTRY.get_sample_value("rag_stage_duration_seconds_count", {"stage": "query_embedding"}) or 0
+    
+    with patch.object(settings, "query_embedding_cache_enabled", cache_enabled), \
+         patch.object(settings, "ingest_embedding_cache_enabled", cache_enabled):
+        retrieval = RetrievalSystem(embeddings=DeterministicFakeEmbedding(size=16), top_k=1)
+    retrieval.add_documents([Document(page_content="Python is a programming language.")])
+    before = stage_count()
+    
+    retrieval.similarity_search("What is Python?")
+    asyncio.run(retrieval.asimilarity_search("What is Python?"))
+    
+    assert stage_count() == before + 2
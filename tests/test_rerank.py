@@ -0,0 +1,58 @@
+"""Tests for the rerank stage"""
+
+import asyncio
+import time
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src.rag.generation import RAGGenerator
+from src.rag.pipeline import RAGPipeline
+from src.rag.rerank import LexicalOverlapScorer, Reranker
+from src.rag.retrieval import RetrievalSystem
+
+
+def make_docs(texts):
+    return [Document(page_content=text, metadata={"source": f"{i}.txt"}) for i, text in enumerate(texts)]
+
+
+class SlowScorer:
+    name = "slow"
+
+    def score(self, query, texts, deadline=None):
+        time.sleep(0.5)
+        return list(range(len(texts)))
+
+
+def test_lexical_reranker_promotes_matching_chunks():
+    docs = make_docs(["weather today", "reset the router with ERR-4021", "router manual", "cooking"])
+    reranker = Reranker(LexicalOverlapScorer(), fetch_k=4, top_n=2, budget_seconds=1.0)
+
+    results = reranker.rerank("how to fix ERR-4021 on the router", docs)
+    assert [doc.metadata["source"] for doc in results] == ["1.txt", "2.txt"]
+    assert results[0].metadata["rerank_score"] > results[1].metadata["rerank_score"]
+
+
+def test_budget_exceeded_keeps_retrieval_order():
+    docs = make_docs(["a", "b", "c"])
+    reranker = Reranker(SlowScorer(), fetch_k=3, top_n=2, budget_seconds=0.05)
+
+    assert [doc.page_content for doc in reranker.rerank("q", docs)] == ["a", "b"]
+    assert [doc.page_content for doc in asyncio.run(reranker.arerank("q", docs))] == ["a", "b"]
+
+
+def test_pipeline_rerank_node_trims_over_fetched_candidates():
+    embeddings = DeterministicFakeEmbedding(size=16)
+    retrieval = RetrievalSystem(embeddings=embeddings, vector_store=InMemoryVectorStore(embedding=embeddings), top_k=5)
+    retrieval.add_documents(make_docs([f"chunk {i}" for i in range(10)] + ["Python is a programming language"]))
+    generator = RAGGenerator(llm=FakeListChatModel(responses=["ok"]), use_langfuse=False)
+    pipeline = RAGPipeline(
+        retrieval, generator,
+        reranker=Reranker(LexicalOverlapScorer(), fetch_k=11, top_n=1, budget_seconds=1.0)
+    )
+
+    result = asyncio.run(pipeline.arun("What is Python?"))
+    assert len(result["sources"]) == 1
+    assert result["sources"][0]["metadata"]["source"] == "10.txt"
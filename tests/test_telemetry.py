@@ -0,0 +1,93 @@
+"""Tests for the buffered MLflow telemetry sink"""
+
+import threading
+import time
+
+from src.monitoring.telemetry import TelemetrySink
+
+
+class FakeMLflowClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+        self.runs = 0
+
+    def create_run(self, run_name=None, tags=None):
+        self.runs += 1
+        return "run-1"
+
+    def log_batch(self, run_id, metrics=None, params=None, tags=None):
+        if self.fail:
+            raise ConnectionError("MLflow unavailable")
+        self.batches.append((run_id, metrics))
+
+
+def test_observations_are_aggregated_into_one_batch():
+    client = FakeMLflowClient()
+    sink = TelemetrySink(client_factory=lambda: client, flush_interval=60, enabled=True, disabled_stages=[])
+
+    for count in [1, 2, 6]:
+        sink.record("retrieval", "results_count", count)
+    sink.record("generation", "answer_length", 120)
+    assert sink.flush()
+
+    run_id, metrics = client.batches[0]
+    values = {metric["key"]: metric["value"] for metric in metrics}
+    assert run_id == "run-1"
+    assert values["retrieval.results_count.count"] == 3
+    assert values["retrieval.results_count.mean"] == 3
+    assert values["retrieval.results_count.max"] == 6
+    assert values["generation.answer_length.count"] == 1
+    # Nothing new: no request
+    assert sink.flush()
+    assert len(client.batches) == 1
+
+
+def test_disabled_stage_is_ignored():
+    client = FakeMLflowClient()
+    sink = TelemetrySink(client_factory=lambda: client, flush_interval=60, enabled=True, disabled_stages=["retrieval"])
+
+    sink.record("retrieval", "results_count", 3)
+    sink.record("pipeline", "retrieved_docs", 3)
+    sink.flush()
+
+    keys = {metric["key"] for metric in client.batches[0][1]}
+    assert keys == {"pipeline.retrieved_docs.count", "pipeline.retrieved_docs.mean", "pipeline.retrieved_docs.max"}
+
+
+def test_failed_flush_drops_interval_and_recovers():
+    client = FakeMLflowClient(fail=True)
+    sink = TelemetrySink(client_factory=lambda: client, flush_interval=60, enabled=True, disabled_stages=[])
+
+    sink.record("pipeline", "retrieved_docs", 3)
+    assert not sink.flush()
+    client.fail = False
+    sink.record("pipeline", "retrieved_docs", 5)
+    assert sink.flush()
+
+    values = {metric["key"]: metric["value"] for metric in client.batches[0][1]}
+    assert values["pipeline.retrieved_docs.count"] == 1
+    assert client.runs == 1
+
+
+def test_record_does_not_wait_for_a_slow_flush():
+    release = threading.Event()
+
+    class SlowClient(FakeMLflowClient):
+        def log_batch(self, run_id, metrics=None, params=None, tags=None):
+            release.wait(2)
+
+    sink = TelemetrySink(client_factory=SlowClient, flush_interval=60, enabled=True, disabled_stages=[])
+    sink.record("pipeline", "retrieved_docs", 1)
+    flusher = threading.Thread(target=sink.flush)
+    flusher.start()
+    time.sleep(0.05)
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        sink.record("pipeline", "retrieved_docs", 1)
+    elapsed = time.perf_counter() - start
+    release.set()
+    flusher.join()
+
+    assert elapsed < 0.5
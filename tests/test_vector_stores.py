@@ -0,0 +1,256 @@
+"""Tests for the FAISS vector store backend"""
+
+import threading
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag.retrieval import RetrievalSystem
+from src.rag.vector_stores import FaissVectorStore, FullPrecisionVectors, create_vector_store
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=16)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_faiss_store_upserts_deletes_and_reloads_mmapped(embeddings, tmp_path, index_type):
+    """Writes are flushed to disk and served from a read-only mmap after restart"""
+    store = FaissVectorStore(embeddings, str(tmp_path), index_type=index_type, nlist=4)
+    texts = [f"text {i}" for i in range(200)]
+    store.add_texts(texts, metadatas=[{"i": i} for i in range(200)], ids=[str(i) for i in range(200)])
+    store.delete(["7"])
+    store.add_texts(["text 8 (v2)"], metadatas=[{"i": 8}], ids=["8"])
+    store.flush()
+
+    reopened = FaissVectorStore(embeddings, str(tmp_path), index_type=index_type, nlist=4)
+    assert reopened._mapped
+
+    top = reopened.similarity_search_with_score("text 3", k=3)
+    assert top[0][0].id == "3" and top[0][0].metadata == {"i": 3}
+    assert top[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert all(doc.id != "7" for doc in reopened.similarity_search("text 7", k=10))
+    assert reopened.get_by_ids(["8"])[0].page_content == "text 8 (v2)"
+
+    # The first write switches to an in-memory copy of the index
+    reopened.add_texts(["new"], ids=["new"])
+    assert not reopened._mapped
+    assert reopened.similarity_search("new", k=1)[0].id == "new"
+
+
+def test_faiss_searches_run_safely_during_writes(embeddings, tmp_path):
+    """Searches and in-place index writes from other threads do not interleave"""
+    store = FaissVectorStore(embeddings, str(tmp_path), index_type="ivf", nlist=4)
+    store.add_texts([f"text {i}" for i in range(200)], ids=[str(i) for i in range(200)])
+    errors = []
+
+    def write():
+        for batch in range(20):
+            ids = [f"w{batch}-{i}" for i in range(10)]
+            store.add_texts([f"written {batch} {i}" for i in range(10)], ids=ids)
+            store.delete(ids[:5])
+
+    def search():
+        try:
+            for _ in range(50):
+                assert store.similarity_search("text 3", k=1)[0].id == "3"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert store.ntotal == 300
+
+
+def test_faiss_single_writer_across_processes(embeddings, tmp_path):
+    """A second writer is refused until the first flushes, then writes on top of its index"""
+    first = FaissVectorStore(embeddings, str(tmp_path))
+    second = FaissVectorStore(embeddings, str(tmp_path))
+    first.add_texts(["from first"], ids=["a"])
+
+    with pytest.raises(RuntimeError):
+        second.add_texts(["from second"], ids=["b"])
+    first.flush()
+
+    second.add_texts(["from second"], ids=["b"])
+    second.flush()
+    assert second.ntotal == 2
+    assert {doc.id for doc in second.similarity_search("from", k=2)} == {"a", "b"}
+
+
+@pytest.mark.parametrize("index_type,quantization", [("ivf", "none"), ("flat", "pq"), ("ivf", "pq"), ("hnsw", "int8")])
+def test_index_is_trained_once_enough_vectors_are_buffered(embeddings, tmp_path, index_type, quantization):
+    """A small first batch stays in an exact flat index; training uses the configured nlist/pq_nbits"""
+    kwargs = dict(index_type=index_type, nlist=4, quantization=quantization, pq_m=4, pq_nbits=4)
+    store = FaissVectorStore(embeddings, str(tmp_path), **kwargs)
+    store.add_texts([f"text {i}" for i in range(10)], ids=[str(i) for i in range(10)])
+    store.delete(["2"])
+    store.flush()
+
+    reopened = FaissVectorStore(embeddings, str(tmp_path), **kwargs)
+    assert reopened._buffering(reopened._index)
+    assert reopened.similarity_search("text 3", k=1)[0].id == "3"
+
+    for start in range(10, 1010, 100):
+        reopened.add_texts([f"text {i}" for i in range(start, start + 100)], ids=[str(i) for i in range(start, start + 100)])
+    inner = reopened._inner(reopened._index)
+    assert not reopened._buffering(reopened._index)
+    assert reopened.ntotal == 1009
+    if index_type == "ivf":
+        assert inner.nlist == 4
+    if quantization == "pq":
+        assert inner.pq.nbits == 4
+    assert reopened.similarity_search("text 3", k=1)[0].id == "3"
+    assert all(doc.id != "2" for doc in reopened.similarity_search("text 2", k=10))
+
+
+def test_docstore_lookups_span_several_batches(embeddings, tmp_path):
+    """Lookups of more ids than one IN (...) query holds"""
+    store = FaissVectorStore(embeddings, str(tmp_path))
+    ids = [str(i) for i in range(1200)]
+    store.add_texts([f"text {i}" for i in ids], ids=ids)
+
+    assert len(store.docstore.faiss_id_map(ids)) == 1200
+    assert {doc.id for doc in store.get_by_ids(ids)} == set(ids)
+    store.delete(ids[:1100])
+    assert [doc.id for doc in store.get_by_ids(ids)] == ids[1100:]
+
+
+def test_full_precision_vectors_refuse_ids_past_the_end(tmp_path):
+    """A missing row is an error, not the last row re-scored in its place"""
+    vectors = FullPrecisionVectors(str(tmp_path / "vectors.f32"), dim=4)
+    vectors.write([0, 1], np.eye(4, dtype=np.float32)[:2])
+
+    assert vectors.read(np.array([1, 0])).tolist() == [[0, 1, 0, 0], [1, 0, 0, 0]]
+    with pytest.raises(RuntimeError):
+        vectors.read(np.array([0, 2]))
+
+
+def test_retrieval_system_writes_precomputed_embeddings_to_faiss(embeddings, tmp_path):
+    """RetrievalSystem uses the FAISS backend through the batched writer"""
+    store = FaissVectorStore(embeddings, str(tmp_path))
+    retrieval = RetrievalSystem(embeddings=embeddings, vector_store=store, top_k=2)
+    docs = [Document(page_content=f"chunk {i}", metadata={"source": "a.txt"}) for i in range(10)]
+
+    retrieval.add_documents(docs, ids=[f"id-{i}" for i in range(10)])
+    retrieval.flush()
+
+    assert store.ntotal == 10
+    assert retrieval.similarity_search("chunk 4")[0].id == "id-4"
+
+
+def test_create_vector_store_rejects_unknown_type(embeddings):
+    with pytest.raises(ValueError):
+        create_vector_store(embeddings, store_type="pinecone")
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Counts embedding requests"""
+
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+@pytest.mark.parametrize("backend", ["memory", "faiss"])
+def test_similarity_search_honours_k_and_batches_queries(tmp_path, backend):
+    """k overrides top_k; a batch of queries costs one embedding request"""
+    from langchain_core.vectorstores import InMemoryVectorStore
+
+    embeddings = CountingEmbeddings(size=16)
+    store = FaissVectorStore(embeddings, str(tmp_path)) if backend == "faiss" else InMemoryVectorStore(embedding=embeddings)
+    retrieval = RetrievalSystem(embeddings=embeddings, vector_store=store, top_k=2)
+    retrieval.add_documents([Document(page_content=f"chunk {i}") for i in range(20)], ids=[str(i) for i in range(20)])
+
+    assert len(retrieval.similarity_search("chunk 3")) == 2
+    assert len(retrieval.similarity_search("chunk 3", k=7)) == 7
+
+    queries = [f"chunk {i} batch" for i in range(10)]
+    embeddings.calls = 0
+    batches = retrieval.similarity_search_batch(queries, k=3)
+    assert embeddings.calls == 1
+    assert [len(docs) for docs in batches] == [3] * 10
+    assert [doc.id for doc in batches[4]] == [doc.id for doc in retrieval.similarity_search(queries[4], k=3)]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_faiss_metadata_filter_prefilters_with_bitmaps(embeddings, tmp_path, index_type):
+    """Indexed fields are filtered inside FAISS, other fields are post-filtered"""
+    store = FaissVectorStore(embeddings, str(tmp_path), index_type=index_type, nlist=4, metadata_fields=["tenant"])
+    metadatas = [{"tenant": f"t{i % 10}", "lang": "fr" if i % 2 else "en"} for i in range(400)]
+    store.add_texts([f"text {i}" for i in range(400)], metadatas=metadatas, ids=[str(i) for i in range(400)])
+    store.delete(["3"])
+
+    results = store.similarity_search("text 3", k=5, filter={"tenant": "t3"})
+    assert len(results) == 5
+    assert all(doc.metadata["tenant"] == "t3" and doc.id != "3" for doc in results)
+
+    results = store.similarity_search("text 13", k=50, filter={"tenant": ["t3", "t4"], "lang": "fr"})
+    assert results[0].id == "13"
+    assert len(results) == 39  # 40 matches, "3" was deleted
+    assert all(doc.metadata["lang"] == "fr" and doc.metadata["tenant"] in ("t3", "t4") for doc in results)
+
+    assert store.similarity_search("text 1", k=5, filter={"tenant": "nobody"}) == []
+
+    # The bitmap index is rebuilt from the docstore on restart
+    store.flush()
+    reopened = FaissVectorStore(embeddings, str(tmp_path), index_type=index_type, nlist=4, metadata_fields=["tenant"])
+    assert {doc.metadata["tenant"] for doc in reopened.similarity_search("text 7", k=5, filter={"tenant": "t7"})} == {"t7"}
+
+
+@pytest.mark.parametrize("index_type,quantization", [
+    ("flat", "fp16"), ("flat", "int8"), ("flat", "pq"), ("ivf", "pq"), ("hnsw", "int8")
+])
+def test_quantized_index_rescores_from_full_precision_vectors(embeddings, tmp_path, index_type, quantization):
+    """Quantized codes in the index, exact float32 scores from vectors.f32"""
+    kwargs = dict(index_type=index_type, nlist=4, quantization=quantization, pq_m=4, pq_nbits=4, metadata_fields=["tenant"])
+    store = FaissVectorStore(embeddings, str(tmp_path), **kwargs)
+    metadatas = [{"tenant": f"t{i % 3}"} for i in range(1000)]
+    store.add_texts([f"text {i}" for i in range(1000)], metadatas=metadatas, ids=[str(i) for i in range(1000)])
+    store.delete(["5"])
+    store.flush()
+
+    reopened = FaissVectorStore(embeddings, str(tmp_path), **kwargs)
+    assert reopened._mapped and reopened._full_vectors is not None
+    assert not reopened._buffering(reopened._index)
+    top = reopened.similarity_search_with_score("text 42", k=3)
+    assert top[0][0].id == "42"
+    assert top[0][1] == pytest.approx(1.0, abs=1e-5)  # exact, not the quantized score
+    assert [score for _, score in top] == sorted((score for _, score in top), reverse=True)
+    assert all(doc.id != "5" for doc in reopened.similarity_search("text 5", k=10))
+    filtered = reopened.similarity_search("text 42", k=5, filter={"tenant": "t1"})
+    assert len(filtered) == 5 and {doc.metadata["tenant"] for doc in filtered} == {"t1"}
+
+
+@pytest.mark.parametrize("index_type,quantization", [("flat", "none"), ("ivf", "none"), ("hnsw", "none"), ("flat", "pq")])
+def test_post_processing_reads_candidate_vectors_from_faiss(tmp_path, index_type, quantization):
+    """MMR/dedup vectors come from the index (or vectors.f32), not from the embedding API"""
+    embeddings = CountingEmbeddings(size=16)
+    kwargs = dict(index_type=index_type, nlist=4, quantization=quantization, pq_m=4)
+    store = FaissVectorStore(embeddings, str(tmp_path), **kwargs)
+    store.add_texts([f"text {i}" for i in range(300)], ids=[str(i) for i in range(300)])
+    store.flush()
+
+    reopened = FaissVectorStore(embeddings, str(tmp_path), **kwargs)
+    retrieval = RetrievalSystem(embeddings=embeddings, vector_store=reopened, top_k=3)
+    candidates = reopened.get_by_ids(["1", "2", "3"])
+    embeddings.calls = 0
+    vectors = retrieval._document_vectors(candidates)
+
+    assert embeddings.calls == 0
+    expected = np.array(embeddings.embed_documents(["text 1"])[0])
+    expected /= np.linalg.norm(expected)  # stored L2-normalized (cosine)
+    assert vectors[0] == pytest.approx(expected, abs=0.05 if quantization == "pq" else 1e-5)